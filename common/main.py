@@ -1,9 +1,18 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Query
+from fastapi.responses import Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from typing import List, Optional
 import uuid
+import json
+import time
+import asyncio
+import hashlib
+import os
 from enum import Enum
 
+from order_repository import create_order_repository
+
 app = FastAPI(root_path='/pizza-api')
 
 # Enums and Models
@@ -24,30 +33,79 @@ class OrderCreate(BaseModel):
     street: str
     house_number: str
 
+class StatusUpdate(BaseModel):
+    status: OrderStatus
+
 class Order(BaseModel):
     id: str
     pizza_id: int
     address: Address
     status: OrderStatus
 
-# Mock database
-pizzas = [
-    {"id": 1, "name": "Margherita"},
-    {"id": 2, "name": "Pepperoni"},
-    {"id": 3, "name": "Hawaiian"},
-    {"id": 4, "name": "Quattro Formaggi"}
-]
+# Pizza catalog, loaded once from the data file
+PIZZAS_PATH = os.environ.get("PIZZAS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "pizzas.json"))
+MENU_MAX_AGE = 300
+
+with open(PIZZAS_PATH, encoding="utf-8") as f:
+    pizzas = json.load(f)
+
+# Indexes for O(1) lookups by id and by (case-insensitive) name
+pizzas_by_id = {pizza["id"]: pizza for pizza in pizzas}
+pizzas_by_name = {pizza["name"].casefold(): pizza for pizza in pizzas}
+
+# The menu only changes with a restart, so it is serialized once and revalidated by its ETag
+MENU_BODY = json.dumps(pizzas).encode()
+MENU_ETAG = '"' + hashlib.sha256(MENU_BODY).hexdigest()[:16] + '"'
+MENU_HEADERS = {"ETag": MENU_ETAG, "Cache-Control": f"public, max-age={MENU_MAX_AGE}"}
 
-# Store orders in memory (in a real application, use a proper database)
-orders = {}
+# Orders and Idempotency-Keys, shared by all workers (see order_repository.py)
+orders = create_order_repository()
+
+# order_id -> event that is set (and replaced) on every status change, wakes up long-polls and SSE streams
+status_events = {}
+# order_id -> number of waiting long-polls and SSE streams, the event is dropped when the last one leaves
+status_waiters = {}
+# waiters re-check the status at least this often, e.g. for changes made by another worker
+STATUS_CHECK_INTERVAL = 1.0
+SSE_KEEPALIVE_INTERVAL = 15.0
 
 # Valid cities for delivery
 VALID_CITIES = ["Leipzig", "Halle", "Dresden"]
+MIN_STREET_LENGTH = 2
+
+# Address rules for clients that validate locally, the version changes with every rule change
+ADDRESS_RULES = {
+    "valid_cities": VALID_CITIES,
+    "min_street_length": MIN_STREET_LENGTH,
+    "house_number_required": True,
+}
+ADDRESS_RULES["version"] = hashlib.sha256(json.dumps(ADDRESS_RULES, sort_keys=True).encode()).hexdigest()[:16]
+
+def _etag_matches(if_none_match: str) -> bool:
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # weak comparison, as proxies may weaken the tag when they compress the response
+    return "*" in tags or MENU_ETAG in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
 
 @app.get("/pizza")
-async def list_pizzas():
-    """List all available pizzas"""
-    return pizzas
+async def list_pizzas(name: Optional[str] = None, if_none_match: Optional[str] = Header(default=None)):
+    """List all available pizzas, or the pizza with the given name"""
+    if name is not None:
+        pizza = pizzas_by_name.get(name.strip().casefold())
+        return [pizza] if pizza else []
+
+    if if_none_match and _etag_matches(if_none_match):
+        return Response(status_code=304, headers=MENU_HEADERS)
+    return Response(content=MENU_BODY, media_type="application/json", headers=MENU_HEADERS)
+
+@app.get("/pizza/{pizza_id}")
+async def get_pizza(pizza_id: int):
+    """Get a pizza by its ID"""
+    if pizza_id not in pizzas_by_id:
+        raise HTTPException(
+            status_code=404,
+            detail="Pizza not found"
+        )
+    return pizzas_by_id[pizza_id]
 
 @app.post("/address/validate")
 async def validate_address(address: Address):
@@ -60,7 +118,7 @@ async def validate_address(address: Address):
         )
     
     # Basic validation for street and house number
-    if len(address.street) < 2:
+    if len(address.street) < MIN_STREET_LENGTH:
         raise HTTPException(
             status_code=400,
             detail="Invalid street name"
@@ -74,11 +132,45 @@ async def validate_address(address: Address):
 
     return {"message": "Address is valid", "address": address}
 
+@app.get("/address/rules")
+async def address_rules():
+    """Rules applied by /address/validate, so clients can validate addresses without a request"""
+    return ADDRESS_RULES
+
 @app.post("/order")
-async def create_order(order: OrderCreate):
-    """Create a neworder"""
+async def create_order(order: OrderCreate, idempotency_key: Optional[str] = Header(default=None)):
+    """Create a neworder, retries with the same Idempotency-Key header return the first order"""
+    if idempotency_key is None:
+        return await _create_order(order)
+
+    fingerprint = json.dumps(jsonable_encoder(order), sort_keys=True)
+    record = await orders.claim_idempotency_key(idempotency_key, fingerprint)
+    if record is not None:
+        if record["fingerprint"] != fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used for a different order"
+            )
+        if record["response"] is None:
+            raise HTTPException(
+                status_code=409,
+                detail="Order with this Idempotency-Key is still being processed"
+            )
+        return record["response"]
+
+    try:
+        response = await _create_order(order)
+    except Exception:
+        # failed requests may be retried with the same key
+        await orders.release_idempotency_key(idempotency_key)
+        raise
+    response = jsonable_encoder(response)
+    await orders.complete_idempotency_key(idempotency_key, response)
+    return response
+
+async def _create_order(order: OrderCreate):
     # Validate pizza_id
-    if not any(pizza["id"] == order.pizza_id for pizza in pizzas):
+    if order.pizza_id not in pizzas_by_id:
         raise HTTPException(
             status_code=404,
             detail="Pizza not found"
@@ -102,26 +194,110 @@ async def create_order(order: OrderCreate):
     )
     
     # Save order
-    orders[order_id] = new_order
+    await orders.add(jsonable_encoder(new_order))
 
     return {"order_id": order_id, "status": OrderStatus.RECEIVED}
 
-@app.get("/order/{order_id}")
-async def get_order_status(order_id: str):
-    """Get order status by order ID"""
-    if order_id not in orders:
+async def _order_response(order_id: str):
+    order = await orders.get(order_id)
+    if order is None:
         raise HTTPException(
             status_code=404,
             detail="Order not found"
         )
-    
+
     return {
         "order_id": order_id,
-        "status": orders[order_id].status,
-        "pizza_id": orders[order_id].pizza_id,
-        "address": orders[order_id].address
+        "status": order["status"],
+        "pizza_id": order["pizza_id"],
+        "address": order["address"]
     }
 
+async def _wait_for_status_change(order_id: str, since: OrderStatus, timeout: float):
+    """Waits until the status of the order differs from `since` or `timeout` seconds passed"""
+    deadline = time.monotonic() + timeout
+    status_waiters[order_id] = status_waiters.get(order_id, 0) + 1
+    try:
+        while True:
+            # taken before reading the status, so a change in between is not missed
+            event = status_events.get(order_id)
+            if event is None:
+                event = status_events[order_id] = asyncio.Event()
+            order = await orders.get(order_id)
+            remaining = deadline - time.monotonic()
+            if order is None or order["status"] != since or remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(event.wait(), min(remaining, STATUS_CHECK_INTERVAL))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        status_waiters[order_id] -= 1
+        if not status_waiters[order_id]:
+            del status_waiters[order_id]
+            status_events.pop(order_id, None)
+
+@app.get("/order/{order_id}")
+async def get_order_status(order_id: str):
+    """Get order status by order ID"""
+    return await _order_response(order_id)
+
+@app.get("/order")
+async def list_orders(status: OrderStatus, limit: int = Query(default=100, ge=1, le=1000)):
+    """Orders with the given status, oldest first (e.g. the queue of the kitchen)"""
+    return [Order(**order) for order in await orders.list_by_status(status.value, limit)]
+
+@app.get("/order/{order_id}/status")
+async def wait_order_status(order_id: str, since: Optional[OrderStatus] = None,
+                            timeout: float = Query(default=25.0, ge=0, le=60)):
+    """Long-poll: returns as soon as the status differs from `since`, at the latest after `timeout` seconds"""
+    await _order_response(order_id)
+    if since is not None:
+        await _wait_for_status_change(order_id, since, timeout)
+    return await _order_response(order_id)
+
+@app.get("/order/{order_id}/events")
+async def order_status_events(order_id: str):
+    """Server-sent events: one `status` event per status transition until the order is delivered"""
+    await _order_response(order_id)
+
+    async def events():
+        status = None
+        while True:
+            order = await orders.get(order_id)
+            if order is None:
+                return
+            if order["status"] != status:
+                status = order["status"]
+                yield "event: status\ndata: " + json.dumps(jsonable_encoder(await _order_response(order_id))) + "\n\n"
+                if status == OrderStatus.DELIVERED:
+                    return
+            else:
+                # keep proxies from closing an idle connection
+                yield ": keepalive\n\n"
+            await _wait_for_status_change(order_id, status, SSE_KEEPALIVE_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.put("/order/{order_id}/status")
+async def update_order_status(order_id: str, update: StatusUpdate):
+    """Set the order status (kitchen/delivery), wakes up all waiting clients of this worker"""
+    if await orders.set_status(order_id, update.status.value) is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Order not found"
+        )
+
+    event = status_events.pop(order_id, None)
+    if event is not None:
+        event.set()
+    return await _order_response(order_id)
+
+@app.get("/metrics")
+async def metrics():
+    """Counters of the order repository, e.g. the writes per group commit of the SQLite backend"""
+    return {"orders": orders.metrics()}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
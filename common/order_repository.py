@@ -0,0 +1,296 @@
+"""
+Order storage of the pizza API.
+
+`MemoryOrderRepository` keeps the orders of one process (tests, local development).
+`SqliteOrderRepository` stores them in SQLite in WAL mode, so orders survive restarts and all workers of
+`uvicorn main:app --workers N` share them: readers never block the writer, and every worker opens its own
+connections. Writes are group committed: the writes arriving within `batch_delay` seconds are committed
+in one transaction, each request still returns only after its write is durable.
+
+Orders are dicts shaped like the `Order` model: `id`, `pizza_id`, `address` (`city`, `street`,
+`house_number`) and `status`.
+"""
+import abc
+import time
+import json
+import asyncio
+import sqlite3
+import threading
+from os import environ
+
+DEFAULT_DB_PATH = "orders.sqlite"
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_BATCH_DELAY = 0.002
+# a claimed Idempotency-Key without response is given up after this many seconds (crashed worker)
+IDEMPOTENCY_CLAIM_TIMEOUT = 60.0
+
+
+class OrderRepository(abc.ABC):
+    """
+    Interface of the order stores
+    """
+
+    @abc.abstractmethod
+    async def add(self, order: dict):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get(self, order_id: str):
+        """Returns the order or None"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def set_status(self, order_id: str, status: str):
+        """Returns the updated order or None if it does not exist"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def list_by_status(self, status: str, limit: int = 100) -> list:
+        """Oldest orders with the status first"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def claim_idempotency_key(self, key: str, fingerprint: str):
+        """
+        Returns None if the caller now owns the key, else the existing record (`fingerprint`, `response`).
+        A claim without response older than IDEMPOTENCY_CLAIM_TIMEOUT is taken over.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def complete_idempotency_key(self, key: str, response: dict):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def release_idempotency_key(self, key: str):
+        raise NotImplementedError
+
+    def metrics(self) -> dict:
+        return {}
+
+
+class MemoryOrderRepository(OrderRepository):
+    """
+    Orders of this process only, do not use with several workers
+    """
+
+    def __init__(self):
+        self._orders = {}
+        self._by_status = {}  # status -> {order_id: None}, in order of arrival
+        self._idempotency_keys = {}
+
+    async def add(self, order: dict):
+        self._orders[order["id"]] = order
+        self._by_status.setdefault(order["status"], {})[order["id"]] = None
+
+    async def get(self, order_id: str):
+        return self._orders.get(order_id)
+
+    async def set_status(self, order_id: str, status: str):
+        order = self._orders.get(order_id)
+        if order is None:
+            return None
+        self._by_status.get(order["status"], {}).pop(order_id, None)
+        self._by_status.setdefault(status, {})[order_id] = None
+        order["status"] = status
+        return order
+
+    async def list_by_status(self, status: str, limit: int = 100) -> list:
+        order_ids = list(self._by_status.get(status, {}))[:limit]
+        return [self._orders[order_id] for order_id in order_ids]
+
+    async def claim_idempotency_key(self, key: str, fingerprint: str):
+        now = time.time()
+        record = self._idempotency_keys.get(key)
+        if record is not None and record["response"] is None and record["created"] < now - IDEMPOTENCY_CLAIM_TIMEOUT:
+            record = None
+        if record is None:
+            self._idempotency_keys[key] = {"fingerprint": fingerprint, "response": None, "created": now}
+            return None
+        return {"fingerprint": record["fingerprint"], "response": record["response"]}
+
+    async def complete_idempotency_key(self, key: str, response: dict):
+        self._idempotency_keys[key]["response"] = response
+
+    async def release_idempotency_key(self, key: str):
+        if key in self._idempotency_keys and self._idempotency_keys[key]["response"] is None:
+            del self._idempotency_keys[key]
+
+    def metrics(self) -> dict:
+        return {"backend": "memory", "orders": len(self._orders)}
+
+
+class SqliteOrderRepository(OrderRepository):
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS orders (
+            id TEXT PRIMARY KEY,
+            pizza_id INTEGER NOT NULL,
+            city TEXT NOT NULL,
+            street TEXT NOT NULL,
+            house_number TEXT NOT NULL,
+            status TEXT NOT NULL,
+            updated REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS orders_status ON orders (status, updated);
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            response TEXT,
+            created REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, batch_size: int = DEFAULT_BATCH_SIZE,
+                 batch_delay: float = DEFAULT_BATCH_DELAY):
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self._writer = self._connect()
+        self._writer.executescript(self.SCHEMA)
+        self._reader = self._connect()
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._pending = []  # (statement, parameters, future)
+        self._flusher = None
+        self._metrics = {"writes": 0, "batches": 0, "reads": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        # autocommit mode, transactions are explicit (BEGIN IMMEDIATE) in _execute_batch
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA busy_timeout = 5000")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    # --- writes
+
+    async def _write(self, statement: str, parameters: tuple) -> int:
+        """
+        Queues the statement for the next group commit and returns its row count once committed
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((statement, parameters, future))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush())
+        return await future
+
+    async def _flush(self):
+        await asyncio.sleep(self.batch_delay)
+        while self._pending:
+            batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            try:
+                results = await asyncio.to_thread(self._execute_batch, [(s, p) for s, p, _ in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _execute_batch(self, statements: list) -> list:
+        results = []
+        with self._write_lock:
+            # IMMEDIATE takes the write lock up front, other workers wait for it (busy_timeout)
+            self._writer.execute("BEGIN IMMEDIATE")
+            try:
+                for statement, parameters in statements:
+                    try:
+                        results.append(self._writer.execute(statement, parameters).rowcount)
+                    except sqlite3.IntegrityError as e:
+                        # only this statement is rolled back, the others of the batch commit
+                        results.append(e)
+                self._writer.execute("COMMIT")
+            except Exception:
+                self._writer.execute("ROLLBACK")
+                raise
+            self._metrics["writes"] += len(statements)
+            self._metrics["batches"] += 1
+        return results
+
+    async def add(self, order: dict):
+        address = order["address"]
+        await self._write(
+            "INSERT INTO orders (id, pizza_id, city, street, house_number, status, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (order["id"], order["pizza_id"], address["city"], address["street"], address["house_number"],
+             order["status"], time.time())
+        )
+
+    async def set_status(self, order_id: str, status: str):
+        updated = await self._write("UPDATE orders SET status = ?, updated = ? WHERE id = ?",
+                                    (status, time.time(), order_id))
+        if not updated:
+            return None
+        return await self.get(order_id)
+
+    async def claim_idempotency_key(self, key: str, fingerprint: str):
+        now = time.time()
+        await self._write("DELETE FROM idempotency_keys WHERE key = ? AND response IS NULL AND created < ?",
+                          (key, now - IDEMPOTENCY_CLAIM_TIMEOUT))
+        claimed = await self._write(
+            "INSERT OR IGNORE INTO idempotency_keys (key, fingerprint, response, created) VALUES (?, ?, NULL, ?)",
+            (key, fingerprint, now)
+        )
+        if claimed:
+            return None
+        row = self._read("SELECT fingerprint, response FROM idempotency_keys WHERE key = ?", (key,))
+        if row is None:
+            # released in the meantime, try again
+            return await self.claim_idempotency_key(key, fingerprint)
+        return {"fingerprint": row[0][0], "response": json.loads(row[0][1]) if row[0][1] else None}
+
+    async def complete_idempotency_key(self, key: str, response: dict):
+        await self._write("UPDATE idempotency_keys SET response = ? WHERE key = ?", (json.dumps(response), key))
+
+    async def release_idempotency_key(self, key: str):
+        await self._write("DELETE FROM idempotency_keys WHERE key = ? AND response IS NULL", (key,))
+
+    # --- reads (primary key and status index lookups, fast enough to run on the event loop)
+
+    def _read(self, statement: str, parameters: tuple):
+        with self._read_lock:
+            self._metrics["reads"] += 1
+            return self._reader.execute(statement, parameters).fetchall() or None
+
+    @staticmethod
+    def _order(row) -> dict:
+        return {
+            "id": row[0],
+            "pizza_id": row[1],
+            "address": {"city": row[2], "street": row[3], "house_number": row[4]},
+            "status": row[5],
+        }
+
+    async def get(self, order_id: str):
+        rows = self._read("SELECT id, pizza_id, city, street, house_number, status FROM orders WHERE id = ?",
+                          (order_id,))
+        return self._order(rows[0]) if rows else None
+
+    async def list_by_status(self, status: str, limit: int = 100) -> list:
+        rows = self._read("SELECT id, pizza_id, city, street, house_number, status FROM orders "
+                          "WHERE status = ? ORDER BY updated LIMIT ?", (status, limit))
+        return [self._order(row) for row in rows or []]
+
+    def metrics(self) -> dict:
+        metrics = {"backend": "sqlite", **self._metrics, "pending": len(self._pending)}
+        metrics["writes_per_batch"] = metrics["writes"] / metrics["batches"] if metrics["batches"] else 0.0
+        return metrics
+
+    def close(self):
+        self._writer.close()
+        self._reader.close()
+
+
+def create_order_repository() -> OrderRepository:
+    """
+    Repository selected by ORDER_REPOSITORY (`sqlite`, default, or `memory`) and ORDER_DB_PATH
+    """
+    backend = environ.get("ORDER_REPOSITORY", "sqlite")
+    if backend == "memory":
+        return MemoryOrderRepository()
+    if backend == "sqlite":
+        return SqliteOrderRepository(environ.get("ORDER_DB_PATH", DEFAULT_DB_PATH))
+    raise ValueError(f"Unknown order repository: {backend}")
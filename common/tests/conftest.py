@@ -0,0 +1,10 @@
+"""
+Run with `python -m pytest tests` from `common/`.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+#main.py creates its repository on import, the tests swap in their own
+os.environ.setdefault("ORDER_REPOSITORY", "memory")
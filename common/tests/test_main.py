@@ -0,0 +1,54 @@
+"""
+Idempotent order creation and /metrics through the HTTP API, on both repositories.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from order_repository import MemoryOrderRepository, SqliteOrderRepository
+
+ORDER = {"pizza_id": 1, "city": "Leipzig", "street": "Main Street", "house_number": "1"}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def client(request, tmp_path, monkeypatch):
+    if request.param == "memory":
+        repository = MemoryOrderRepository()
+    else:
+        repository = SqliteOrderRepository(str(tmp_path / "orders.sqlite"))
+    monkeypatch.setattr(main, "orders", repository)
+    with TestClient(main.app) as client:
+        yield client
+    if request.param == "sqlite":
+        repository.close()
+
+
+def test_retry_replays_the_first_order(client):
+    first = client.post("/order", json=ORDER, headers={"Idempotency-Key": "key"})
+    retry = client.post("/order", json=ORDER, headers={"Idempotency-Key": "key"})
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert len(client.get("/order", params={"status": "received"}).json()) == 1
+
+
+def test_key_reused_for_another_order_is_rejected(client):
+    client.post("/order", json=ORDER, headers={"Idempotency-Key": "key"})
+    response = client.post("/order", json=dict(ORDER, pizza_id=2), headers={"Idempotency-Key": "key"})
+    assert response.status_code == 422
+
+
+def test_failed_order_releases_the_key(client):
+    assert client.post("/order", json=dict(ORDER, pizza_id=999), headers={"Idempotency-Key": "key"}).status_code == 404
+    response = client.post("/order", json=ORDER, headers={"Idempotency-Key": "key"})
+    assert response.status_code == 200
+    assert response.json()["status"] == "received"
+
+
+def test_metrics_expose_the_repository(client):
+    client.post("/order", json=ORDER)
+    metrics = client.get("/metrics").json()["orders"]
+    assert metrics["backend"] in ("memory", "sqlite")
+    if metrics["backend"] == "sqlite":
+        assert metrics["writes"] == 1
+    else:
+        assert metrics["orders"] == 1
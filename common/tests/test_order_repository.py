@@ -0,0 +1,97 @@
+"""
+Both order repositories: orders, status index and Idempotency-Key claims.
+"""
+import asyncio
+
+import pytest
+
+import order_repository
+from order_repository import OrderRepository, MemoryOrderRepository, SqliteOrderRepository
+
+ORDER = {"id": "o1", "pizza_id": 1, "address": {"city": "Leipzig", "street": "Main", "house_number": "1"},
+         "status": "received"}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def repository(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryOrderRepository()
+        return
+    repository = SqliteOrderRepository(str(tmp_path / "orders.sqlite"))
+    yield repository
+    repository.close()
+
+
+def test_interface_is_abstract():
+    with pytest.raises(TypeError):
+        OrderRepository()
+
+
+def test_orders_by_status(repository):
+    async def run():
+        await repository.add(dict(ORDER))
+        await repository.add(dict(ORDER, id="o2"))
+        updated = await repository.set_status("o1", "preparing")
+        return (updated, await repository.get("o1"), await repository.set_status("missing", "preparing"),
+                await repository.list_by_status("received"), await repository.list_by_status("preparing"))
+
+    updated, stored, missing, received, preparing = asyncio.run(run())
+    assert updated["status"] == stored["status"] == "preparing"
+    assert stored["address"] == ORDER["address"]
+    assert missing is None
+    assert [order["id"] for order in received] == ["o2"]
+    assert [order["id"] for order in preparing] == ["o1"]
+
+
+def test_idempotency_key_is_claimed_once_and_replayed(repository):
+    async def run():
+        first = await repository.claim_idempotency_key("key", "fingerprint")
+        pending = await repository.claim_idempotency_key("key", "fingerprint")
+        await repository.complete_idempotency_key("key", {"order_id": "o1"})
+        #a completed key is never released
+        await repository.release_idempotency_key("key")
+        return first, pending, await repository.claim_idempotency_key("key", "other")
+
+    first, pending, replayed = asyncio.run(run())
+    assert first is None
+    assert pending == {"fingerprint": "fingerprint", "response": None}
+    assert replayed == {"fingerprint": "fingerprint", "response": {"order_id": "o1"}}
+
+
+def test_released_idempotency_key_can_be_claimed_again(repository):
+    async def run():
+        await repository.claim_idempotency_key("key", "fingerprint")
+        await repository.release_idempotency_key("key")
+        return await repository.claim_idempotency_key("key", "fingerprint")
+
+    assert asyncio.run(run()) is None
+
+
+def test_stale_claim_is_taken_over(repository, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(order_repository.time, "time", lambda: now[0])
+
+    async def run():
+        await repository.claim_idempotency_key("key", "fingerprint")
+        now[0] += order_repository.IDEMPOTENCY_CLAIM_TIMEOUT - 1
+        pending = await repository.claim_idempotency_key("key", "fingerprint")
+        now[0] += 2
+        return pending, await repository.claim_idempotency_key("key", "fingerprint")
+
+    pending, taken_over = asyncio.run(run())
+    assert pending is not None
+    assert taken_over is None
+
+
+def test_sqlite_writes_are_group_committed(tmp_path):
+    repository = SqliteOrderRepository(str(tmp_path / "orders.sqlite"), batch_delay=0.01)
+
+    async def run():
+        await asyncio.gather(*(repository.add(dict(ORDER, id=f"o{i}")) for i in range(10)))
+        return await repository.list_by_status("received", limit=100)
+
+    assert len(asyncio.run(run())) == 10
+    metrics = repository.metrics()
+    assert metrics["writes"] == 10
+    assert metrics["batches"] == 1
+    repository.close()
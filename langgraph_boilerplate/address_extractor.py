@@ -0,0 +1,138 @@
+"""
+Extraction of the delivery address (city, street, house number) from a user turn.
+
+The extractor runs a chain of backends and returns the first complete address:
+
+* `spacy`: the NER model trained in `spacy_address_model/` (`model-best`), loaded once per process,
+  answers in milliseconds on the CPU
+* `llm`: the few-shot prompt `customer_address_messages`, used as fallback
+
+`ADDRESS_EXTRACTOR` selects the chain, e.g. `spacy+llm` (default), `spacy` or `llm`.
+"""
+import logging
+import threading
+from os import environ, path
+
+from classifier import parse_address_entities, ADDRESS_FIELDS
+from response_decoder import decode, ADDRESS_ENTITIES
+from prompts import customer_address_messages
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKENDS = "spacy+llm"
+DEFAULT_MODEL_PATH = path.join(path.dirname(path.abspath(__file__)), "..", "spacy_address_model", "model-best")
+
+#spaCy label -> address field
+SPACY_LABELS = {
+    "CITY": "CITY",
+    "STREET": "STREET",
+    "HOUSE_NR": "HOUSE_NUMBER",
+}
+
+
+class SpacyBackend:
+    """
+    Named entity recognition with the trained address model
+    """
+    name = "spacy"
+    local = True
+
+    def __init__(self, model_path: str = DEFAULT_MODEL_PATH):
+        self.model_path = model_path
+        self._nlp = None
+        self._unavailable = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._nlp is None and not self._unavailable:
+            with self._lock:
+                if self._nlp is None and not self._unavailable:
+                    try:
+                        import spacy
+                        self._nlp = spacy.load(self.model_path)
+                    except (ImportError, OSError) as e:
+                        logger.warning("spaCy address model not available (%s), skipping it", e)
+                        self._unavailable = True
+        return self._nlp
+
+    def extract(self, text: str, client=None):
+        nlp = self.load()
+        if nlp is None:
+            return None
+
+        entities = {}
+        for ent in nlp(text).ents:
+            field = SPACY_LABELS.get(ent.label_)
+            #first entity per label, e.g. the street before a second mentioned street
+            if field and field not in entities:
+                entities[field] = ent.text.strip(" ,.")
+        if not all(entities.get(field) for field in ADDRESS_FIELDS):
+            return None
+        return tuple(entities[field] for field in ADDRESS_FIELDS)
+
+
+class LlmBackend:
+    """
+    Few-shot NER with the LLM, needs the client of the caller
+    """
+    name = "llm"
+    local = False
+
+    def extract(self, text: str, client=None):
+        if client is None:
+            return None
+        return parse_address_entities(decode(client, customer_address_messages(text), ADDRESS_ENTITIES))
+
+
+BACKENDS = {
+    "spacy": SpacyBackend,
+    "llm": LlmBackend,
+}
+
+
+class AddressExtractor:
+    """
+    Returns `(city, street, house_number)` of the first backend that finds all three fields, or None
+    """
+
+    def __init__(self, backends: list):
+        self.backends = backends
+        self._lock = threading.Lock()
+        self._metrics = {backend.name: {"hits": 0, "misses": 0} for backend in backends}
+
+    def extract(self, text: str, client=None, local_only: bool = False):
+        for backend in self.backends:
+            if local_only and not backend.local:
+                continue
+            address = backend.extract(text, client)
+            with self._lock:
+                self._metrics[backend.name]["hits" if address else "misses"] += 1
+            if address:
+                return address
+        return None
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._metrics.items()}
+
+
+_extractor = None
+
+
+def get_address_extractor() -> AddressExtractor:
+    """
+    Returns the shared address extractor, configured via ADDRESS_EXTRACTOR and ADDRESS_MODEL_PATH
+    """
+    global _extractor
+    if _extractor is None:
+        backends = []
+        for name in environ.get("ADDRESS_EXTRACTOR", DEFAULT_BACKENDS).split("+"):
+            name = name.strip()
+            if name == "spacy":
+                backends.append(SpacyBackend(environ.get("ADDRESS_MODEL_PATH", DEFAULT_MODEL_PATH)))
+            elif name in BACKENDS:
+                backends.append(BACKENDS[name]())
+            else:
+                raise ValueError(f"Unknown address extractor backend: {name}")
+        _extractor = AddressExtractor(backends)
+    return _extractor
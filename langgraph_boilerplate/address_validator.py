@@ -0,0 +1,156 @@
+"""
+Client-side validation of delivery addresses.
+
+The Pizza API publishes the rules of `/address/validate` as a versioned payload (`GET /address/rules`).
+The validator fetches them, refetches them every `rules_ttl` seconds and checks addresses locally.
+Results are kept in an LRU keyed by the rules version and the address, so repeat customers and retries
+skip even the local check. If the API does not publish rules, the validator falls back to
+`/address/validate` and caches its results.
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict
+from os import environ
+
+from pizza_api import get_api_client, get_async_api_client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 1024
+RETRY_INTERVAL = 5 * 60  # wait before fetching the rules again after a failure
+DEFAULT_RULES_TTL = 10 * 60  # refetch the rules to pick up a new version
+
+
+def check_rules(rules: dict, city: str, street: str, house_number: str) -> bool:
+    """
+    Mirrors `validate_address` of `common/main.py`
+    """
+    if city not in rules["valid_cities"]:
+        return False
+    if len(street) < rules["min_street_length"]:
+        return False
+    if rules["house_number_required"] and not house_number:
+        return False
+    return True
+
+
+class AddressValidator:
+
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE, rules_ttl: float = DEFAULT_RULES_TTL):
+        self.cache_size = cache_size
+        self.rules_ttl = rules_ttl
+        self._rules = None
+        self._next_attempt = 0.0  # time.time() of the next rules fetch
+        self._cache = OrderedDict()  # (rules version, city, street, house_number) -> bool
+        self._lock = threading.Lock()
+        self._metrics = {"cache_hits": 0, "local": 0, "remote": 0}
+
+    @property
+    def version(self):
+        return self._rules["version"] if self._rules else None
+
+    def validate(self, city: str, street: str, house_number: str) -> bool:
+        if time.time() >= self._next_attempt:
+            self._set_rules(get_api_client().get_address_rules())
+
+        cached = self._cached(city, street, house_number)
+        if cached is not None:
+            return cached
+
+        if self._rules is not None:
+            valid = check_rules(self._rules, city, street, house_number)
+            self._count("local")
+        else:
+            valid = get_api_client().validate_address(city, street, house_number)
+            self._count("remote")
+        self._remember(city, street, house_number, valid)
+        return valid
+
+    async def avalidate(self, city: str, street: str, house_number: str) -> bool:
+        if time.time() >= self._next_attempt:
+            self._set_rules(await get_async_api_client().get_address_rules())
+
+        cached = self._cached(city, street, house_number)
+        if cached is not None:
+            return cached
+
+        if self._rules is not None:
+            valid = check_rules(self._rules, city, street, house_number)
+            self._count("local")
+        else:
+            valid = await get_async_api_client().validate_address(city, street, house_number)
+            self._count("remote")
+        self._remember(city, street, house_number, valid)
+        return valid
+
+    def invalidate(self):
+        """
+        Drops the rules and cached results, e.g. after the API announced a new rules version
+        """
+        with self._lock:
+            self._rules = None
+            self._next_attempt = 0.0
+            self._cache.clear()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self._metrics, "cached": len(self._cache), "rules_version": self.version}
+
+    def _set_rules(self, rules):
+        required = ("version", "valid_cities", "min_street_length", "house_number_required")
+        if rules is None or not all(key in rules for key in required):
+            #not published (older API) or unreachable, keep the known rules (or validate remotely) for a while
+            self._next_attempt = time.time() + RETRY_INTERVAL
+            return
+        self._next_attempt = time.time() + self.rules_ttl
+        if rules["version"] == self.version:
+            return
+        logger.info("Using address rules version %s", rules["version"])
+        with self._lock:
+            #results of the old version can't be hit any more
+            self._cache.clear()
+            self._rules = rules
+
+    def _key(self, city, street, house_number) -> tuple:
+        return (self.version, city, street, house_number)
+
+    def _cached(self, city, street, house_number):
+        key = self._key(city, street, house_number)
+        with self._lock:
+            if key not in self._cache:
+                return None
+            self._cache.move_to_end(key)
+            self._metrics["cache_hits"] += 1
+            return self._cache[key]
+
+    def _remember(self, city, street, house_number, valid: bool):
+        if not valid and self._rules is None:
+            #remote failures may be network errors, don't pin them
+            return
+        key = self._key(city, street, house_number)
+        with self._lock:
+            self._cache[key] = valid
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._metrics[name] += 1
+
+
+_validator = None
+
+
+def get_address_validator() -> AddressValidator:
+    """
+    Returns the shared address validator, configured via ADDRESS_CACHE_SIZE and ADDRESS_RULES_TTL
+    """
+    global _validator
+    if _validator is None:
+        _validator = AddressValidator(
+            cache_size=int(environ.get("ADDRESS_CACHE_SIZE", DEFAULT_CACHE_SIZE)),
+            rules_ttl=float(environ.get("ADDRESS_RULES_TTL", DEFAULT_RULES_TTL)),
+        )
+    return _validator
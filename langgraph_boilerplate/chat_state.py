@@ -0,0 +1,56 @@
+"""
+Reducers of the chatbot state.
+
+Nodes only return the messages and slots they add, LangGraph merges them into the state with the
+reducers below. The message list is bounded: only the last `MESSAGE_WINDOW` messages are kept and older
+ones are folded into a single summary message, so a long conversation does not grow the state per turn.
+"""
+from os import environ
+
+from langchain_core.messages import SystemMessage
+from langgraph.graph.message import add_messages
+
+MESSAGE_WINDOW = int(environ.get("CHAT_MESSAGE_WINDOW", 20))
+SUMMARY_ID = "conversation-summary"
+SUMMARY_MAX_CHARS = 1000
+SUMMARY_LINE_CHARS = 120
+
+
+def merge_slots(left: dict, right: dict) -> dict:
+    """
+    Adds or overrides the returned slots, slots that are not returned stay untouched
+    """
+    if not right:
+        return left
+    return {**(left or {}), **right}
+
+
+def summarize(summary: str, messages: list) -> str:
+    """
+    Appends one shortened line per dropped message and keeps the most recent `SUMMARY_MAX_CHARS`
+    """
+    lines = [summary] if summary else []
+    for message in messages:
+        content = " ".join(str(message.content).split())
+        if len(content) > SUMMARY_LINE_CHARS:
+            content = content[:SUMMARY_LINE_CHARS].rsplit(" ", 1)[0] + "..."
+        lines.append(f"{message.type}: {content}")
+    text = "\n".join(lines)
+    if len(text) > SUMMARY_MAX_CHARS:
+        text = text[-SUMMARY_MAX_CHARS:].split("\n", 1)[-1]
+    return text
+
+
+def window_messages(left: list, right: list) -> list:
+    """
+    Appends the new messages and folds everything older than the window into the summary message
+    """
+    messages = add_messages(left, right)
+    summary = next((m for m in messages if m.id == SUMMARY_ID), None)
+    turns = [m for m in messages if m.id != SUMMARY_ID]
+    if len(turns) <= MESSAGE_WINDOW:
+        return messages
+
+    dropped, kept = turns[:-MESSAGE_WINDOW], turns[-MESSAGE_WINDOW:]
+    text = summarize(summary.content if summary else "", dropped)
+    return [SystemMessage(content=text, id=SUMMARY_ID)] + kept
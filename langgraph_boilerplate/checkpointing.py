@@ -0,0 +1,132 @@
+"""
+Checkpointer of the dialogue server.
+
+`TieredCheckpointSaver` wraps a persistent LangGraph checkpointer (SQLite) with an in-memory LRU of the
+latest checkpoint per session, so a turn of an active dialogue reads its state from memory and only
+writes through to SQLite. Each worker keeps its own hot tier, route a session to the same worker
+(e.g. by hashing the session id) or set the hot tier size to 0 when sessions move between workers.
+"""
+import threading
+from collections import OrderedDict
+
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple, copy_checkpoint
+
+DEFAULT_HOT_SESSIONS = 1024
+
+
+class TieredCheckpointSaver(BaseCheckpointSaver):
+    """
+    Write-through LRU in front of `backend`, only the latest checkpoint of a session is cached
+    """
+
+    def __init__(self, backend: BaseCheckpointSaver, max_sessions: int = DEFAULT_HOT_SESSIONS):
+        super().__init__(serde=backend.serde)
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._hot = OrderedDict()  # (thread_id, checkpoint_ns) -> CheckpointTuple
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def config_specs(self):
+        return self.backend.config_specs
+
+    def get_next_version(self, current, channel):
+        return self.backend.get_next_version(current, channel)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {"hot_sessions": len(self._hot), "hits": self.hits, "misses": self.misses}
+
+    # sync API
+
+    def get_tuple(self, config):
+        cached = self._get_hot(config)
+        if cached is not None:
+            return cached
+        return self._remember(config, self.backend.get_tuple(config))
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        return self.backend.list(config, filter=filter, before=before, limit=limit)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = self.backend.put(config, checkpoint, metadata, new_versions)
+        self._put_hot(config, next_config, checkpoint, metadata)
+        return next_config
+
+    def put_writes(self, config, writes, task_id, *args, **kwargs):
+        self._drop_hot(config)
+        return self.backend.put_writes(config, writes, task_id, *args, **kwargs)
+
+    # async API
+
+    async def aget_tuple(self, config):
+        cached = self._get_hot(config)
+        if cached is not None:
+            return cached
+        return self._remember(config, await self.backend.aget_tuple(config))
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        async for item in self.backend.alist(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        next_config = await self.backend.aput(config, checkpoint, metadata, new_versions)
+        self._put_hot(config, next_config, checkpoint, metadata)
+        return next_config
+
+    async def aput_writes(self, config, writes, task_id, *args, **kwargs):
+        #pending writes are only needed to resume an interrupted run, read them from the backend
+        self._drop_hot(config)
+        return await self.backend.aput_writes(config, writes, task_id, *args, **kwargs)
+
+    # hot tier
+
+    @staticmethod
+    def _key(config) -> tuple:
+        configurable = config["configurable"]
+        return configurable["thread_id"], configurable.get("checkpoint_ns", "")
+
+    def _get_hot(self, config):
+        if not self.max_sessions:
+            return None
+        key = self._key(config)
+        checkpoint_id = config["configurable"].get("checkpoint_id")
+        with self._lock:
+            cached = self._hot.get(key)
+            if cached is not None and checkpoint_id in (None, cached.checkpoint["id"]):
+                self._hot.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        return None
+
+    def _remember(self, config, checkpoint_tuple):
+        #only cache the latest checkpoint, not explicitly requested older ones
+        if checkpoint_tuple is not None and config["configurable"].get("checkpoint_id") is None:
+            self._set_hot(self._key(config), checkpoint_tuple)
+        return checkpoint_tuple
+
+    def _put_hot(self, config, next_config, checkpoint, metadata):
+        parent_config = config if config["configurable"].get("checkpoint_id") else None
+        self._set_hot(self._key(next_config), CheckpointTuple(
+            config=next_config,
+            checkpoint=copy_checkpoint(checkpoint),
+            metadata=metadata,
+            parent_config=parent_config,
+            pending_writes=[],
+        ))
+
+    def _set_hot(self, key, checkpoint_tuple):
+        if not self.max_sessions:
+            return
+        with self._lock:
+            self._hot[key] = checkpoint_tuple
+            self._hot.move_to_end(key)
+            while len(self._hot) > self.max_sessions:
+                self._hot.popitem(last=False)
+
+    def _drop_hot(self, config):
+        with self._lock:
+            self._hot.pop(self._key(config), None)
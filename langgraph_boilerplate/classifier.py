@@ -0,0 +1,114 @@
+"""
+Classification of a user turn for the CheckerNode.
+
+`classify_turn` asks the LLM for order intention, description intention, the mentioned pizza
+and the address entities in one single request instead of one round trip per check.
+`fan_out_checks` runs the separate few-shot checks concurrently with an `AsyncOpenAI` client instead,
+an async CheckerNode uses it with `CHECKER_FAN_OUT=1`.
+"""
+import asyncio
+import logging
+from os import environ
+
+from response_decoder import decode, adecode, TURN, INTENTION, PIZZA, ADDRESS_ENTITIES
+from prompts import (
+    classify_turn_messages,
+    order_intention_messages,
+    description_intention_messages,
+    customer_address_messages,
+    resolve_pizza_messages,
+)
+
+logger = logging.getLogger(__name__)
+
+CHECKER_FAN_OUT = environ.get("CHECKER_FAN_OUT", "0").lower() in ("1", "true", "yes")
+
+ADDRESS_FIELDS = ["CITY", "STREET", "HOUSE_NUMBER"]
+
+EMPTY_TURN = {
+    "order_intention": False,
+    "description_intention": False,
+    "pizza": None,
+    "address": None,
+}
+
+
+def parse_turn(data) -> dict:
+    """
+    Maps the decoded `TURN` response (or None) onto the turn dict
+    """
+    if not isinstance(data, dict):
+        return dict(EMPTY_TURN)
+
+    address = data.get("address")
+    if isinstance(address, dict) and all(address.get(field) for field in ADDRESS_FIELDS):
+        address = tuple(str(address[field]) for field in ADDRESS_FIELDS)
+    else:
+        address = None
+
+    return {
+        "order_intention": data.get("order_intention") is True,
+        "description_intention": data.get("description_intention") is True,
+        "pizza": data.get("pizza") or None,
+        "address": address,
+    }
+
+
+def parse_address_entities(data):
+    """
+    Maps the decoded NER output `[{"Leipzig": "CITY"}, ...]` (or None) onto a (city, street, house_number) tuple
+    """
+    if not isinstance(data, list):
+        return None
+
+    response_dictionary = {}
+    for d in data:
+        if isinstance(d, dict):
+            response_dictionary.update(d)
+
+    by_label = {v: k for (k, v) in response_dictionary.items()}
+    if not all(field in by_label for field in ADDRESS_FIELDS):
+        return None
+    return tuple(str(by_label[field]) for field in ADDRESS_FIELDS)
+
+
+def classify_turn(client, _input, expected=None) -> dict:
+    """
+    Returns order intention, description intention, pizza and address of the input with one LLM call
+    """
+    return parse_turn(decode(client, classify_turn_messages(_input, expected), TURN))
+
+
+async def aclassify_turn(async_client, _input, expected=None) -> dict:
+    return parse_turn(await adecode(async_client, classify_turn_messages(_input, expected), TURN))
+
+
+#check name (key within the turn dict) -> (prompt, schema, value of the decoded response)
+FAN_OUT_CHECKS = {
+    "order_intention": (order_intention_messages, INTENTION, lambda data: data["intention"]),
+    "description_intention": (description_intention_messages, INTENTION, lambda data: data["intention"]),
+    "pizza": (resolve_pizza_messages, PIZZA, lambda data: data["pizza"] or None),
+    "address": (customer_address_messages, ADDRESS_ENTITIES, parse_address_entities),
+}
+
+
+async def fan_out_checks(async_client, _input, checks=("order_intention", "description_intention")) -> dict:
+    """
+    Runs the separate few-shot checks at the same time, the turn takes as long as the slowest check.
+    Failed checks keep their default value of `EMPTY_TURN`.
+    """
+    responses = await asyncio.gather(
+        *(adecode(async_client, FAN_OUT_CHECKS[check][0](_input), FAN_OUT_CHECKS[check][1]) for check in checks),
+        return_exceptions=True
+    )
+
+    turn = dict(EMPTY_TURN)
+    for check, data in zip(checks, responses):
+        if isinstance(data, Exception):
+            logger.warning("Check %s failed: %r", check, data)
+            continue
+        if data is None:
+            #undecodable answers are logged by the decoder
+            continue
+        turn[check] = FAN_OUT_CHECKS[check][2](data)
+    return turn
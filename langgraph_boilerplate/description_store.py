@@ -0,0 +1,256 @@
+"""
+Local store of the Wikidata pizza descriptions.
+
+The SPARQL result is persisted to a JSON file and indexed by pizza label and aliases. Reads are served
+from memory; once the data is older than `max_age` a background thread revalidates it while the stale
+copy keeps being served, so Wikidata is queried about once a day instead of once per description turn.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from os import environ
+
+from SPARQLWrapper import SPARQLWrapper, JSON
+
+from fuzzywuzzy import fuzz
+
+from name_index import NameIndex, EMPTY_INDEX, normalize
+
+logger = logging.getLogger(__name__)
+
+SPARQL_ENDPOINT = "https://query.wikidata.org/bigdata/namespace/wdq/sparql"
+DEFAULT_PATH = "pizza_descriptions.json"
+DEFAULT_MAX_AGE = 24 * 60 * 60  # refresh once per day
+RETRY_INTERVAL = 15 * 60  # wait after a failed refresh (e.g. HTTP 429)
+DEFAULT_MATCH_THRESHOLD = 85  # minimum fuzz.ratio of a fuzzy label match
+
+DESCRIPTION_QUERY = """
+PREFIX schema: <http://schema.org/>
+PREFIX wdt: <http://www.wikidata.org/prop/direct/>
+PREFIX wd: <http://www.wikidata.org/entity/>
+PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
+SELECT ?pizza ?label ?description (GROUP_CONCAT(DISTINCT ?alias; separator="|") AS ?aliases) WHERE {
+    ?pizza wdt:P31 wd:Q116392487 . # get all entities URIs that are an instance of the pizza type
+    ?pizza rdfs:label ?label .     # get the names of the pizza
+      FILTER (lang(?label) = 'en')   # fitler for English pizza names only
+    ?pizza schema:description ?description # get the descriptions of the pizza
+      FILTER (lang(?description) = 'en')     # fitler for English pizza description only
+    OPTIONAL { ?pizza skos:altLabel ?alias FILTER (lang(?alias) = 'en') } # alternative names of the pizza
+}
+GROUP BY ?pizza ?label ?description
+ORDER BY ?label # sort by name
+"""
+
+
+def execute_sparql(query: str, endpoint_url: str = SPARQL_ENDPOINT):
+    """
+    https://query.wikidata.org/bigdata/namespace/wdq/sparql
+    """
+    try:
+        sparql = SPARQLWrapper(endpoint_url)
+        sparql.timeout = 20
+        sparql.setQuery(query)
+        sparql.setReturnFormat(JSON)
+        response = sparql.query().convert()
+        return response
+    except Exception as e:
+        e = str(e)
+        logger.error(f"Execute error: {e}")
+        if 'MalformedQueryException' in e or 'bad formed' in e:
+            logger.error(query + str('\n' + e))
+        return {'error': e}
+
+
+def fetch_descriptions() -> list:
+    """
+    Queries Wikidata for all pizzas, raises RuntimeError if the query failed
+    """
+    result = execute_sparql(DESCRIPTION_QUERY)
+    if "error" in result:
+        raise RuntimeError(result["error"])
+
+    entries = []
+    for dictionary in result["results"]["bindings"]:
+        aliases = dictionary.get("aliases", {}).get("value", "")
+        entries.append({
+            "uri": dictionary["pizza"]["value"],
+            "label": str(dictionary["label"]["value"]),
+            "description": str(dictionary["description"]["value"]),
+            "aliases": [alias for alias in aliases.split("|") if alias],
+        })
+    return entries
+
+
+def names_of(entry: dict) -> list:
+    """
+    Label, Wikidata aliases and the label without the word "pizza" ("Pizza Margherita" -> "Margherita")
+    """
+    names = [entry["label"]] + entry.get("aliases", [])
+    for name in list(names):
+        stripped = " ".join(token for token in normalize(name).split() if token != "pizza")
+        if stripped:
+            names.append(stripped)
+    return names
+
+
+class DescriptionStore:
+    """
+    Pizza descriptions persisted on disk and indexed by label and aliases
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, max_age: float = DEFAULT_MAX_AGE, fetch=fetch_descriptions,
+                 match_threshold: int = DEFAULT_MATCH_THRESHOLD):
+        self.path = path
+        self.max_age = max_age
+        self.match_threshold = match_threshold
+        self.fetch = fetch
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._next_attempt = 0.0
+        self._fetched_at = 0.0
+        self._entries = []
+        self._index = EMPTY_INDEX
+        self._load_file()
+
+    def entries(self) -> list:
+        """
+        All label/description entries, possibly stale while a refresh is running in the background
+        """
+        self._ensure_fresh()
+        return self._entries
+
+    async def aentries(self) -> list:
+        # only the very first load blocks, so keep it off the event loop
+        if not self._entries:
+            return await asyncio.to_thread(self.entries)
+        return self.entries()
+
+    def lookup(self, label: str):
+        """
+        Returns the entry with exactly this (normalized) label or alias, or None
+        """
+        match = self.match(label)
+        return match[0] if match and match[2] != "fuzzy" else None
+
+    def match(self, name: str, threshold: int = None):
+        """
+        Returns `(entry, score, kind)` of the best exact, alias or fuzzy label match, or None
+        """
+        threshold = self.match_threshold if threshold is None else threshold
+        self._ensure_fresh()
+        match = self._index.match(name)
+        if match is None or (match[2] == "fuzzy" and match[1] < threshold):
+            return None
+        return match
+
+    def refresh(self):
+        """
+        Fetches the descriptions synchronously and persists them
+        """
+        try:
+            entries = self.fetch()
+        except Exception as e:
+            logger.warning("Could not refresh pizza descriptions: %s", e)
+            self._next_attempt = time.time() + RETRY_INTERVAL
+            return False
+
+        self._set(entries, time.time())
+        self._save_file()
+        return True
+
+    def refresh_if_stale(self, max_age: float = None):
+        """
+        Refreshes unless the data is younger than `max_age` (default `max_age` of the store).
+        Only one refresh runs at a time, a caller that waited for another refresh finds the data fresh.
+        """
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            now = time.time()
+            if (self._entries and now - self._fetched_at < max_age) or now < self._next_attempt:
+                return False
+            return self.refresh()
+
+    def start_background_refresh(self, interval: float = None):
+        """
+        Starts a daemon thread that refreshes the store every `interval` seconds (default `max_age`)
+        """
+        interval = interval or self.max_age
+
+        def run():
+            while True:
+                wait = max(self._fetched_at + interval - time.time(), self._next_attempt - time.time(), 0)
+                time.sleep(wait)
+                self.refresh_if_stale(interval)
+
+        thread = threading.Thread(target=run, name="description-store-refresh", daemon=True)
+        thread.start()
+        return thread
+
+    def _ensure_fresh(self):
+        now = time.time()
+        if self._entries and now - self._fetched_at < self.max_age:
+            return
+        if now < self._next_attempt:
+            return
+
+        if not self._entries:
+            #nothing to serve yet, the first load has to block (or wait for the background thread's load)
+            self.refresh_if_stale()
+            return
+
+        #stale-while-revalidate: serve the old data and refresh in the background,
+        #a second revalidation that slips through finds the data fresh in refresh_if_stale
+        if self._refreshing:
+            return
+        self._refreshing = True
+
+        def run():
+            try:
+                self.refresh_if_stale()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="description-store-revalidate", daemon=True).start()
+
+    def _set(self, entries: list, fetched_at: float):
+        index = NameIndex(entries, names_of, scorer=fuzz.ratio)
+        self._entries, self._index, self._fetched_at = entries, index, fetched_at
+
+    def _load_file(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self._set(data["entries"], data["fetched_at"])
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError) as e:
+            logger.warning("Ignoring corrupt description store %s: %s", self.path, e)
+
+    def _save_file(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": self._fetched_at, "entries": self._entries}, f, ensure_ascii=False)
+        #atomic swap, concurrent readers never see a half written file
+        os.replace(tmp_path, self.path)
+
+
+_store = None
+
+
+def get_description_store() -> DescriptionStore:
+    """
+    Returns the shared description store, configured via DESCRIPTION_STORE_* environment variables
+    """
+    global _store
+    if _store is None:
+        _store = DescriptionStore(
+            path=environ.get("DESCRIPTION_STORE_PATH", DEFAULT_PATH),
+            max_age=float(environ.get("DESCRIPTION_STORE_MAX_AGE", DEFAULT_MAX_AGE)),
+            match_threshold=int(environ.get("DESCRIPTION_MATCH_THRESHOLD", DEFAULT_MATCH_THRESHOLD)),
+        )
+    return _store
@@ -0,0 +1,181 @@
+"""
+Local intent pre-classifier for the CheckerNode.
+
+Obvious inputs ("I want to order a pizza", "what is a Hawaiian") are answered by keyword/regex rules
+and, if scikit-learn is installed, by a small TF-IDF model trained on the turns the LLM classified
+before. Only inputs below the confidence threshold are sent to the LLM. The LLM answers are appended to
+`INTENT_LOG_PATH`, so the model improves with every restart.
+"""
+import re
+import json
+import logging
+import threading
+from os import environ
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.9
+RULE_CONFIDENCE = 0.95
+MIN_TRAINING_SAMPLES = 50  # per check, with both answers present
+MAX_TRAINING_SAMPLES = 5000  # most recent logged turns
+
+CHECKS = ("order_intention", "description_intention")
+
+#check -> (patterns for True, patterns for False)
+#an input matching both lists is not decided by the rules (model or LLM)
+RULES = {
+    "order_intention": (
+        [
+            r"\border(ing)?\b",
+            r"\b(i want|i'd like|i would like|i'll have|i will have|i'll take|can i (get|have)|could i (get|have)|give me|get me|bring me)\b.*\bpizza",
+            r"\b(hungry|deliver(y)?)\b.*\bpizza",
+        ],
+        [
+            r"^(hi|hello|hey|good (morning|evening)|thanks|thank you|bye|ok|okay)\W*$",
+            r"^(no|nope|nothing)\b",
+            #negated or about an existing order
+            r"\b(don't|dont|do not|doesn't|does not|didn't|did not|won't|will not|never|not)\b",
+            r"\b(cancel\w*|where is|where's|status|track\w*|when will|how long|my order)\b",
+        ],
+    ),
+    "description_intention": (
+        [
+            r"^(what|what's|whats|which|describe|explain)\b",
+            r"\b(tell me (more )?about|more (information|info|details) (about|on)|information (about|on)|what is|what's|whats|what are)\b",
+            r"\b(ingredients|toppings? (of|on)|made (of|with)|contains?|comes with)\b",
+            r"\b(know|learn|hear) (more )?about\b",
+        ],
+        [
+            r"\b(i want|i'd like|i would like|i'll take|i will take|i'll have|i will have|give me|order)\b",
+            r"\b(can|could|may) i (get|have|take|order)\b",
+            r"^(?!(what|which|is|are|does|do|can|tell|describe|explain)\b)\w+([' -]\w+){0,2}( please)?[.!]?$",  # a bare pizza name
+        ],
+    ),
+}
+
+
+def _compile(patterns: list) -> re.Pattern:
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
+
+
+class IntentClassifier:
+    """
+    `short_circuit(text, check)` returns the intention if it is known with `threshold` confidence, else None
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, log_path: str = None):
+        self.threshold = threshold
+        self.log_path = log_path
+        self._rules = {check: (_compile(positive), _compile(negative)) for check, (positive, negative) in RULES.items()}
+        self._models = {}
+        self._lock = threading.Lock()
+        self._metrics = {"turns": 0, "short_circuited": 0, "escalated": 0, "by_rules": 0, "by_model": 0}
+        if log_path:
+            self.train(self.read_log(log_path))
+
+    def predict(self, text: str, check: str):
+        """
+        Returns `(intention, confidence, source)`, rules win over the model
+        """
+        text = " ".join(text.split())
+        positive, negative = self._rules[check]
+        is_positive, is_negative = bool(positive.search(text)), bool(negative.search(text))
+        if is_positive != is_negative:
+            return is_positive, RULE_CONFIDENCE, "rules"
+
+        model = self._models.get(check)
+        if model is not None:
+            probability = model.predict_proba([text])[0][list(model.classes_).index(True)]
+            return probability >= 0.5, max(probability, 1 - probability), "model"
+
+        return None, 0.0, None
+
+    def short_circuit(self, text: str, check: str, accept=None):
+        """
+        `accept(intention)` lets the caller escalate a confident answer anyway, e.g. if it needs more from the LLM
+        """
+        intention, confidence, source = self.predict(text, check)
+        confident = source is not None and confidence >= self.threshold and (accept is None or accept(intention))
+        with self._lock:
+            self._metrics["turns"] += 1
+            if confident:
+                self._metrics["short_circuited"] += 1
+                self._metrics["by_" + source] += 1
+            else:
+                self._metrics["escalated"] += 1
+        return intention if confident else None
+
+    def log(self, text: str, check: str, intention: bool):
+        """
+        Records an LLM classified turn as training data
+        """
+        if not self.log_path:
+            return
+        line = json.dumps({"text": text, "check": check, "intention": bool(intention)}, ensure_ascii=False)
+        with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    @staticmethod
+    def read_log(path: str) -> list:
+        try:
+            with open(path, encoding="utf-8") as f:
+                lines = f.readlines()[-MAX_TRAINING_SAMPLES:]
+        except FileNotFoundError:
+            return []
+
+        samples = []
+        for line in lines:
+            try:
+                samples.append(json.loads(line))
+            except ValueError:
+                continue
+        return samples
+
+    def train(self, samples: list):
+        """
+        Fits one TF-IDF + logistic regression model per check, skipped without scikit-learn or enough data
+        """
+        try:
+            from sklearn.pipeline import make_pipeline
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            from sklearn.linear_model import LogisticRegression
+        except ImportError:
+            return
+
+        models = {}
+        for check in CHECKS:
+            texts = [sample["text"] for sample in samples if sample.get("check") == check]
+            labels = [bool(sample["intention"]) for sample in samples if sample.get("check") == check]
+            if len(texts) < MIN_TRAINING_SAMPLES or len(set(labels)) < 2:
+                continue
+            model = make_pipeline(
+                TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 4), lowercase=True, sublinear_tf=True),
+                LogisticRegression(max_iter=1000, class_weight="balanced"),
+            )
+            model.fit(texts, labels)
+            models[check] = model
+            logger.info("Trained %s model on %s logged turns", check, len(texts))
+        self._models = models
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["short_circuit_rate"] = metrics["short_circuited"] / metrics["turns"] if metrics["turns"] else 0.0
+        metrics["models"] = sorted(self._models)
+        return metrics
+
+
+_classifier = None
+
+
+def get_intent_classifier() -> IntentClassifier:
+    """
+    Returns the shared intent classifier, configured via INTENT_* environment variables
+    """
+    global _classifier
+    if _classifier is None:
+        _classifier = IntentClassifier(
+            threshold=float(environ.get("INTENT_CONFIDENCE_THRESHOLD", DEFAULT_THRESHOLD)),
+            log_path=environ.get("INTENT_LOG_PATH") or None,
+        )
+    return _classifier
@@ -0,0 +1,323 @@
+"""
+Persistent response cache for the few-shot LLM helpers.
+
+The helpers send a fixed few-shot prompt followed by the user input, so a response is keyed on
+(model, request options, prompt template, normalized input). Entries live in SQLite, are evicted
+least recently used once `max_entries` or `max_bytes` is exceeded, and an optional n-gram
+near-duplicate tier answers inputs that differ from a cached one only by a few characters
+("I want a pizza!" / "i want pizza").
+
+Hits only update the LRU order in memory, the access times are written in batches with the next write
+(or every `TOUCH_FLUSH_INTERVAL` seconds). The async helpers run the SQLite work in a worker thread.
+"""
+import re
+import asyncio
+import inspect
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from os import environ
+from collections import defaultdict, Counter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = "llm_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 10_000
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_NEAR_THRESHOLD = 0.9  # minimum jaccard similarity of the input trigrams
+TOUCH_BATCH_SIZE = 256
+TOUCH_FLUSH_INTERVAL = 5.0
+
+
+def normalize_input(text: str) -> str:
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def template_hash(messages: list) -> str:
+    """
+    Hash of everything but the final user message, i.e. the system prompt and the few-shot examples
+    """
+    return hashlib.sha256(json.dumps(messages[:-1], sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+class NearDuplicateIndex:
+    """
+    Inverted trigram index over the cached inputs of every prompt template
+    """
+
+    def __init__(self, threshold: float = DEFAULT_NEAR_THRESHOLD):
+        self.threshold = threshold
+        self._grams = {}  # key -> (template, trigrams)
+        self._buckets = defaultdict(set)  # (template, trigram) -> keys
+
+    def add(self, key: str, template: str, text: str):
+        grams = trigrams(text)
+        self._grams[key] = (template, grams)
+        for gram in grams:
+            self._buckets[(template, gram)].add(key)
+
+    def remove(self, key: str):
+        template, grams = self._grams.pop(key, (None, ()))
+        for gram in grams:
+            bucket = self._buckets.get((template, gram))
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[(template, gram)]
+
+    def lookup(self, template: str, text: str):
+        grams = trigrams(text)
+        shared = Counter()
+        for gram in grams:
+            for key in self._buckets.get((template, gram), ()):
+                shared[key] += 1
+
+        best_key, best_score = None, 0.0
+        for key, overlap in shared.items():
+            score = overlap / (len(grams) + len(self._grams[key][1]) - overlap)
+            if score > best_score:
+                best_key, best_score = key, score
+        return best_key if best_score >= self.threshold else None
+
+
+class ResponseCache:
+    """
+    LRU response cache backed by a SQLite file, with hit-rate counters
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES, near_duplicates: bool = False,
+                 near_threshold: float = DEFAULT_NEAR_THRESHOLD):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._touched = {}  # key -> last access not yet written
+        self._flushed_at = time.monotonic()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                template TEXT NOT NULL,
+                input TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+        self._entries, self._bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+
+        self._near = None
+        if near_duplicates:
+            self._near = NearDuplicateIndex(near_threshold)
+            for key, template, text in self._conn.execute("SELECT key, template, input FROM responses"):
+                self._near.add(key, template, text)
+
+    @staticmethod
+    def make_key(model: str, messages: list, options: dict = None):
+        #options such as response_format or temperature change the answer
+        options = json.dumps(options or {}, sort_keys=True, default=str)
+        template = hashlib.sha256(f"{model}\0{options}\0{template_hash(messages)}".encode()).hexdigest()
+        text = normalize_input(messages[-1]["content"])
+        return hashlib.sha256(f"{template}\0{text}".encode()).hexdigest(), template, text
+
+    def get(self, model: str, messages: list, options: dict = None):
+        key, template, text = self.make_key(model, messages, options)
+        with self._lock:
+            row = self._touch(key)
+            if row is not None:
+                self.hits += 1
+                return row
+            if self._near is not None:
+                near_key = self._near.lookup(template, text)
+                row = self._touch(near_key) if near_key else None
+                if row is not None:
+                    self.near_hits += 1
+                    return row
+            self.misses += 1
+            return None
+
+    def put(self, model: str, messages: list, response: str, options: dict = None):
+        key, template, text = self.make_key(model, messages, options)
+        size = len(response.encode()) + len(text.encode())
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, template, input, response, size, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, template, text, response, size, time.time()))
+            if old:
+                self._bytes -= old[0]
+            else:
+                self._entries += 1
+            self._bytes += size
+            if self._near is not None:
+                self._near.add(key, template, text)
+            self._write_touched()
+            self._evict()
+            self._conn.commit()
+
+    async def aget(self, model: str, messages: list, options: dict = None):
+        return await asyncio.to_thread(self.get, model, messages, options)
+
+    async def aput(self, model: str, messages: list, response: str, options: dict = None):
+        await asyncio.to_thread(self.put, model, messages, response, options)
+
+    def flush(self):
+        """
+        Writes the pending access times
+        """
+        with self._lock:
+            self._write_touched()
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "entries": self._entries,
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._touched.clear()
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._entries, self._bytes = 0, 0
+            if self._near is not None:
+                self._near = NearDuplicateIndex(self._near.threshold)
+
+    def _touch(self, key):
+        row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._touched[key] = time.time()
+        if len(self._touched) >= TOUCH_BATCH_SIZE or time.monotonic() - self._flushed_at > TOUCH_FLUSH_INTERVAL:
+            self._write_touched()
+            self._conn.commit()
+        return row[0]
+
+    def _write_touched(self):
+        if self._touched:
+            self._conn.executemany("UPDATE responses SET last_access = ? WHERE key = ?",
+                                   [(accessed, key) for key, accessed in self._touched.items()])
+            self._touched.clear()
+        self._flushed_at = time.monotonic()
+
+    def _evict(self):
+        while self._entries > self.max_entries or self._bytes > self.max_bytes:
+            # evict in small batches of the least recently used entries
+            overflow = max(self._entries - self.max_entries, 1)
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT ?", (overflow,)).fetchall()
+            if not rows:
+                break
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key, _ in rows])
+            for key, size in rows:
+                self._entries -= 1
+                self._bytes -= size
+                self.evictions += 1
+                if self._near is not None:
+                    self._near.remove(key)
+
+
+_cache = None
+
+
+def get_cache() -> ResponseCache:
+    """
+    Returns the shared response cache, configured via LLM_CACHE_* environment variables
+    """
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache(
+            path=environ.get("LLM_CACHE_PATH", DEFAULT_PATH),
+            max_entries=int(environ.get("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+            max_bytes=int(environ.get("LLM_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+            near_duplicates=environ.get("LLM_CACHE_NEAR_DUPLICATES", "").lower() in ("1", "true", "yes"),
+        )
+    return _cache
+
+
+def complete(client, messages: list, cacheable=bool, cache: ResponseCache = None, on_token=None, **options) -> str:
+    """
+    Returns the content of the chat completion for `messages`, answered from the cache if possible.
+    Only responses for which `cacheable(content)` holds get stored, so malformed outputs are not replayed.
+    With `on_token` the completion is streamed and `on_token(delta)` is called for every received piece
+    (once with the whole content on a cache hit). `options` are passed to the API, e.g. `response_format`.
+    """
+    cache = cache or get_cache()
+    model = environ.get("MODEL_NAME")
+    cached = cache.get(model, messages, options)
+    if cached is not None:
+        if on_token is not None:
+            on_token(cached)
+        return cached
+
+    if on_token is None:
+        chat_response = client.chat.completions.create(model=model, messages=messages, **options)
+        received_message = chat_response.choices[0].message.content
+    else:
+        pieces = []
+        for chunk in client.chat.completions.create(model=model, messages=messages, stream=True, **options):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                pieces.append(delta)
+                on_token(delta)
+        received_message = "".join(pieces)
+    if received_message and cacheable(received_message):
+        cache.put(model, messages, received_message, options)
+    return received_message
+
+
+async def acomplete(async_client, messages: list, cacheable=bool, cache: ResponseCache = None, on_token=None, **options) -> str:
+    """
+    Async `complete`, `on_token` may be a coroutine function
+    """
+    cache = cache or get_cache()
+    model = environ.get("MODEL_NAME")
+    cached = await cache.aget(model, messages, options)
+    if cached is not None:
+        if on_token is not None:
+            await _notify(on_token, cached)
+        return cached
+
+    if on_token is None:
+        chat_response = await async_client.chat.completions.create(model=model, messages=messages, **options)
+        received_message = chat_response.choices[0].message.content
+    else:
+        pieces = []
+        async for chunk in await async_client.chat.completions.create(model=model, messages=messages, stream=True, **options):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                pieces.append(delta)
+                await _notify(on_token, delta)
+        received_message = "".join(pieces)
+    if received_message and cacheable(received_message):
+        await cache.aput(model, messages, received_message, options)
+    return received_message
+
+
+async def _notify(on_token, delta: str):
+    result = on_token(delta)
+    if inspect.isawaitable(result):
+        await result
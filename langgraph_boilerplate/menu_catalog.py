@@ -0,0 +1,133 @@
+import time
+import logging
+import threading
+
+import requests
+
+from name_index import NameIndex, EMPTY_INDEX
+from pizza_api import get_api_client, get_async_api_client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300  # seconds until the menu gets revalidated against the API
+DEFAULT_THRESHOLD = 80  # minimum fuzz.partial_ratio for a menu item to count as a match
+
+
+class MenuCatalog:
+    """
+    Process-wide cache of the pizza menu.
+
+    The menu is fetched once and revalidated with the API's ETag after `ttl` seconds.
+    Every item is held in a `NameIndex`, so `resolve` only scores the few items that share
+    a bucket with the user input instead of running fuzzywuzzy against the whole menu on every turn.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, threshold: int = DEFAULT_THRESHOLD):
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._etag = None
+        self._fetched_at = 0.0
+        self._index = EMPTY_INDEX
+
+    def items(self) -> list:
+        self._refresh_if_stale()
+        return list(self._index.items)
+
+    def names(self) -> list:
+        return [item["name"] for item in self.items()]
+
+    def resolve(self, text: str, threshold: int = None):
+        """
+        Returns the menu item mentioned in `text` or None
+        """
+        self._refresh_if_stale()
+        threshold = self.threshold if threshold is None else threshold
+        match = self._index.match(text, threshold)
+        return match[0] if match else None
+
+    def invalidate(self):
+        self._fetched_at = 0.0
+
+    async def aitems(self) -> list:
+        await self.arefresh_if_stale()
+        return list(self._index.items)
+
+    async def anames(self) -> list:
+        return [item["name"] for item in await self.aitems()]
+
+    async def aresolve(self, text: str, threshold: int = None):
+        """
+        Same as `resolve`, but revalidates the menu with the async API client
+        """
+        await self.arefresh_if_stale()
+        return self.resolve(text, threshold)
+
+    def _is_fresh(self) -> bool:
+        return bool(self._index.items) and time.monotonic() - self._fetched_at < self.ttl
+
+    def _conditional_headers(self) -> dict:
+        return {"If-None-Match": self._etag} if self._etag and self._index.items else {}
+
+    def _refresh_if_stale(self):
+        if self._is_fresh():
+            return
+        with self._lock:
+            # another thread might have refreshed while we were waiting
+            if self._is_fresh():
+                return
+            try:
+                response = get_api_client().list_pizzas(headers=self._conditional_headers())
+            except requests.RequestException as e:
+                self._refresh_failed(e)
+                return
+            self._apply(response)
+
+    async def arefresh_if_stale(self):
+        # concurrent refreshes are harmless, the index is swapped atomically
+        if self._is_fresh():
+            return
+        try:
+            response = await get_async_api_client().list_pizzas(headers=self._conditional_headers())
+        except Exception as e:
+            self._refresh_failed(e)
+            return
+        self._apply(response)
+
+    def _refresh_failed(self, reason):
+        # serve the stale menu rather than failing the turn
+        logger.warning("Could not refresh pizza menu: %s", reason)
+        if self._index.items:
+            self._fetched_at = time.monotonic()
+
+    def _apply(self, response):
+        """
+        Applies a `requests` or `httpx` response of the menu endpoint
+        """
+        if response.status_code == 304:
+            self._fetched_at = time.monotonic()
+            return
+        if response.status_code != 200:
+            self._refresh_failed(f"HTTP {response.status_code}")
+            return
+
+        self._build_index(response.json())
+        self._etag = response.headers.get("ETag")
+        self._fetched_at = time.monotonic()
+
+    def _build_index(self, menu: list):
+        # swap the whole index at once so concurrent readers never see a partial one
+        self._index = NameIndex(menu, lambda item: [item["name"]])
+
+
+_catalog = None
+
+
+def get_catalog() -> MenuCatalog:
+    """
+    Returns the shared menu catalog of this process
+    """
+    global _catalog
+    if _catalog is None:
+        _catalog = MenuCatalog()
+    return _catalog
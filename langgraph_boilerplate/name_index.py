@@ -0,0 +1,111 @@
+"""
+In-memory fuzzy index over item names (pizza menu, Wikidata pizza labels).
+
+Every name is indexed by its normalized form, its tokens and its character n-grams, so a lookup only
+scores the few items that share a bucket with the query instead of every item. Buckets shared by
+most names (e.g. the token "pizza") are skipped, they would make every lookup linear again.
+"""
+import re
+from collections import defaultdict, Counter
+
+from fuzzywuzzy import fuzz
+
+MAX_CANDIDATES = 10  # number of index hits that get scored with fuzzywuzzy
+MAX_BUCKET_SIZE = 64  # larger token/n-gram buckets are not counted
+NGRAM_SIZE = 3
+
+
+def normalize(text: str) -> str:
+    """
+    Lowercases the text and removes everything but letters, digits and single spaces
+    """
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def char_ngrams(text: str, n: int = NGRAM_SIZE) -> set:
+    """
+    Character n-grams of every token, padded so that short tokens still produce buckets
+    """
+    grams = set()
+    for token in text.split():
+        padded = f" {token} "
+        for i in range(max(len(padded) - n + 1, 1)):
+            grams.add(padded[i:i + n])
+    return grams
+
+
+class NameIndex:
+    """
+    Immutable index, build a new one instead of updating it so concurrent readers never see a partial index.
+
+    `names_of(item)` returns the names of an item, the first one is its label and all others are aliases.
+    `match` returns `(item, score, kind)` with kind "exact", "alias" or "fuzzy", or None.
+    """
+
+    def __init__(self, items: list, names_of, scorer=fuzz.partial_ratio, max_bucket_size: int = MAX_BUCKET_SIZE):
+        self.items = list(items)
+        self.scorer = scorer
+        self.max_bucket_size = max_bucket_size
+        self._names = []  # (normalized name, item index, is label)
+        self._by_name = {}
+        by_token, by_ngram = defaultdict(set), defaultdict(set)
+
+        for idx, item in enumerate(self.items):
+            for position, name in enumerate(names_of(item)):
+                name = normalize(name)
+                if not name:
+                    continue
+                name_idx = len(self._names)
+                self._names.append((name, idx, position == 0))
+                self._by_name.setdefault(name, name_idx)
+                for token in name.split():
+                    by_token[token].add(name_idx)
+                for gram in char_ngrams(name):
+                    by_ngram[gram].add(name_idx)
+
+        self._by_token, self._by_ngram = dict(by_token), dict(by_ngram)
+
+    def __len__(self):
+        return len(self.items)
+
+    def match(self, text: str, threshold: int = 0):
+        query = normalize(text)
+        if not query:
+            return None
+
+        if query in self._by_name:
+            _, idx, is_label = self._names[self._by_name[query]]
+            return self.items[idx], 100, "exact" if is_label else "alias"
+
+        # count shared buckets per name, exact token hits weigh more than n-gram hits
+        hits = Counter()
+        skipped = []
+        buckets = [(self._by_token.get(token, ()), NGRAM_SIZE) for token in query.split()]
+        buckets += [(self._by_ngram.get(gram, ()), 1) for gram in char_ngrams(query)]
+        for bucket, weight in buckets:
+            if len(bucket) > self.max_bucket_size:
+                skipped.append(bucket)
+                continue
+            for name_idx in bucket:
+                hits[name_idx] += weight
+
+        candidates = [name_idx for name_idx, _ in hits.most_common(MAX_CANDIDATES)]
+        if not candidates and skipped:
+            # the query only shares common buckets, score a few names of the smallest one
+            candidates = sorted(min(skipped, key=len))[:MAX_CANDIDATES]
+
+        best, best_score = None, -1
+        for name_idx in candidates:
+            name, idx, _ = self._names[name_idx]
+            score = self.scorer(query, name)
+            # prefer the earlier item on ties, e.g. the menu order
+            if score > best_score or (score == best_score and idx < best):
+                best, best_score = idx, score
+
+        if best is None or best_score < threshold:
+            return None
+        return self.items[best], best_score, "fuzzy"
+
+
+EMPTY_INDEX = NameIndex([], lambda item: [])
@@ -0,0 +1,100 @@
+"""
+Cached order status lookup.
+
+`get` answers from a short-lived cache instead of calling `GET /order/{order_id}` on every question
+about the order, a delivered order never changes and stays cached. `await_change` follows the order
+with the long-poll endpoint of the Pizza API (`GET /order/{order_id}/status?since=...`), so clients that
+track an order get each transition as it happens instead of polling in a loop.
+"""
+import time
+import threading
+from collections import OrderedDict
+from os import environ
+
+from pizza_api import get_api_client, get_async_api_client
+
+DEFAULT_TTL = 10.0
+DEFAULT_CACHE_SIZE = 1024
+FINAL_STATUS = "delivered"
+
+
+class OrderStatusCache:
+
+    def __init__(self, ttl: float = DEFAULT_TTL, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # order_id -> (expires, order)
+        self._lock = threading.Lock()
+        self._metrics = {"cache_hits": 0, "lookups": 0, "long_polls": 0, "transitions": 0}
+
+    def get(self, order_id: str):
+        """
+        Returns the order (`order_id`, `status`, `pizza_id`, `address`) or None if it is unknown
+        """
+        cached = self._cached(order_id)
+        if cached is not None:
+            return cached
+        self._count("lookups")
+        return self._remember(order_id, get_api_client().get_order(order_id))
+
+    async def aget(self, order_id: str):
+        cached = self._cached(order_id)
+        if cached is not None:
+            return cached
+        self._count("lookups")
+        return self._remember(order_id, await get_async_api_client().get_order(order_id))
+
+    async def await_change(self, order_id: str, wait: float = 25.0):
+        """
+        Waits until the status differs from the last known one or `wait` seconds passed, returns the order
+        """
+        order = await self.aget(order_id)
+        if order is None or order["status"] == FINAL_STATUS:
+            return order
+        self._count("long_polls")
+        changed = await get_async_api_client().wait_order_status(order_id, order["status"], wait)
+        return self._remember(order_id, changed, order)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self._metrics, "cached": len(self._cache)}
+
+    def _cached(self, order_id: str):
+        with self._lock:
+            entry = self._cache.get(order_id)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            self._cache.move_to_end(order_id)
+            self._metrics["cache_hits"] += 1
+            return entry[1]
+
+    def _remember(self, order_id: str, order, previous=None):
+        if order is None:
+            #lookup failed, keep answering with what we knew
+            return previous
+        expires = float("inf") if order["status"] == FINAL_STATUS else time.monotonic() + self.ttl
+        with self._lock:
+            if previous is not None and previous["status"] != order["status"]:
+                self._metrics["transitions"] += 1
+            self._cache[order_id] = (expires, order)
+            self._cache.move_to_end(order_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return order
+
+    def _count(self, name: str):
+        with self._lock:
+            self._metrics[name] += 1
+
+
+_cache = None
+
+
+def get_order_status_cache() -> OrderStatusCache:
+    """
+    Returns the shared order status cache, configured via ORDER_STATUS_TTL
+    """
+    global _cache
+    if _cache is None:
+        _cache = OrderStatusCache(ttl=float(environ.get("ORDER_STATUS_TTL", DEFAULT_TTL)))
+    return _cache
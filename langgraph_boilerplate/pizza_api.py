@@ -0,0 +1,391 @@
+"""
+Client of the Pizza API (`common/main.py`).
+
+One `PizzaApiClient` per process keeps its TCP/TLS connections alive in a `requests.Session` pool,
+retries transient failures with exponential backoff, applies a timeout per endpoint and records
+a latency histogram per endpoint. `AsyncPizzaApiClient` does the same on top of `httpx.AsyncClient`.
+
+Point `PIZZA_API_URL` to a local instance (`uvicorn main:app` in `common/` -> `http://localhost:8000`)
+to run the bot against it.
+"""
+import time
+import random
+import asyncio
+import logging
+import threading
+from os import environ
+from bisect import bisect_left
+from concurrent.futures import Future
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://demos.swe.htwk-leipzig.de/pizza-api"
+
+#(connect, read) timeouts in seconds per endpoint
+DEFAULT_TIMEOUTS = {
+    "list_pizzas": (3.05, 5),
+    "validate_address": (3.05, 5),
+    "address_rules": (3.05, 5),
+    "create_order": (3.05, 15),
+    "get_order": (3.05, 5),
+    "order_status": (3.05, 5),  # read timeout on top of the long-poll wait
+}
+
+RETRY_STATUS = (429, 502, 503, 504)
+#409: an earlier attempt with the same Idempotency-Key is still being processed
+ORDER_RETRY_STATUS = RETRY_STATUS + (409,)
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def backoff(backoff_factor: float, attempt: int) -> float:
+    """
+    Exponential backoff with jitter, so retrying clients don't hit the API in lockstep
+    """
+    return backoff_factor * (2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+class LatencyHistogram:
+    """
+    Latency histogram with fixed millisecond buckets (counts per bucket, not cumulative)
+    """
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.total_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed_ms: float):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, elapsed_ms)] += 1
+            self.count += 1
+            self.total_ms += elapsed_ms
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            labels = [f"<={bound}ms" for bound in self.buckets] + ["+Inf"]
+            return {
+                "count": self.count,
+                "mean_ms": self.total_ms / self.count if self.count else 0.0,
+                "buckets": dict(zip(labels, self.counts)),
+            }
+
+
+class _ApiMetrics:
+
+    def __init__(self):
+        self.histograms = {endpoint: LatencyHistogram() for endpoint in DEFAULT_TIMEOUTS}
+        self.errors = {endpoint: 0 for endpoint in DEFAULT_TIMEOUTS}
+
+    def observe(self, endpoint: str, started: float):
+        self.histograms[endpoint].observe((time.perf_counter() - started) * 1000)
+
+    def metrics(self) -> dict:
+        return {
+            endpoint: {**histogram.snapshot(), "errors": self.errors[endpoint]}
+            for endpoint, histogram in self.histograms.items()
+        }
+
+
+class PizzaApiClient(_ApiMetrics):
+
+    def __init__(self, base_url: str = None, timeouts: dict = None, retries: int = 3,
+                 backoff_factor: float = 0.2, pool_size: int = 10):
+        super().__init__()
+        self.base_url = (base_url or environ.get("PIZZA_API_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._inflight = {}  # Idempotency-Key -> Future of the running submission
+        self._inflight_lock = threading.Lock()
+
+        #POST /order is only retried with an Idempotency-Key (see create_order), never by the adapter
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=frozenset({"GET"}),
+            raise_on_status=False,
+        )
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        #address validation has no side effects, so it gets its own adapter that may retry POSTs
+        self._idempotent_post = requests.Session()
+        post_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False,
+        ))
+        self._idempotent_post.mount("http://", post_adapter)
+        self._idempotent_post.mount("https://", post_adapter)
+
+    def _request(self, endpoint: str, method: str, path: str, session=None, **kwargs):
+        session = session or self.session
+        started = time.perf_counter()
+        try:
+            return session.request(method, self.base_url + path, timeout=self.timeouts[endpoint], **kwargs)
+        except requests.RequestException:
+            self.errors[endpoint] += 1
+            raise
+        finally:
+            self.observe(endpoint, started)
+
+    def list_pizzas(self, headers: dict = None) -> requests.Response:
+        """
+        Returns the raw response, so callers can revalidate with `If-None-Match`
+        """
+        return self._request("list_pizzas", "GET", "/pizza", headers=headers)
+
+    def validate_address(self, city: str, street: str, house_number: str) -> bool:
+        post = {"city":city, "street":street, "house_number":house_number}
+        try:
+            response = self._request("validate_address", "POST", "/address/validate",
+                                     session=self._idempotent_post, json=post)
+        except requests.RequestException as e:
+            logger.warning("Address validation failed: %s", e)
+            return False
+        return response.status_code == 200
+
+    def get_address_rules(self):
+        """
+        Returns the versioned rules of /address/validate, or None if the API does not publish them
+        """
+        try:
+            response = self._request("address_rules", "GET", "/address/rules")
+        except requests.RequestException as e:
+            logger.warning("Address rules lookup failed: %s", e)
+            return None
+        if response.status_code != 200:
+            return None
+        return response.json()
+
+    def create_order(self, pizza_id, city: str, street: str, house_number: str, idempotency_key: str = None):
+        """
+        With an `idempotency_key` the submission is retried with jittered backoff and concurrent
+        submissions with the same key share one request. Without it the order is sent exactly once.
+        """
+        post = {"pizza_id":pizza_id, "city":city, "street":street, "house_number":house_number}
+        if idempotency_key is None:
+            return self._submit_order(post, None, attempts=1)
+
+        with self._inflight_lock:
+            future = self._inflight.get(idempotency_key)
+            owner = future is None
+            if owner:
+                future = self._inflight[idempotency_key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            order = self._submit_order(post, {"Idempotency-Key": idempotency_key}, attempts=self.retries + 1)
+            future.set_result(order)
+            return order
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(idempotency_key, None)
+
+    def _submit_order(self, post: dict, headers, attempts: int):
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            try:
+                response = self._request("create_order", "POST", "/order", json=post, headers=headers)
+            except requests.RequestException as e:
+                if last:
+                    logger.warning("Order submission failed: %s", e)
+                    return None
+            else:
+                if response.status_code not in ORDER_RETRY_STATUS or last:
+                    break
+            time.sleep(backoff(self.backoff_factor, attempt))
+
+        if response.status_code != 200:
+            return None
+        return response.json()
+
+    def get_order(self, order_id: str):
+        try:
+            response = self._request("get_order", "GET", "/order/" + order_id)
+        except requests.RequestException as e:
+            logger.warning("Order lookup failed: %s", e)
+            return None
+        if response.status_code != 200:
+            return None
+        return response.json()
+
+    def wait_order_status(self, order_id: str, since: str, wait: float = 25.0):
+        """
+        Long-polls the order until its status differs from `since`, returns the order after at most `wait` seconds
+        """
+        connect, read = self.timeouts["order_status"]
+        started = time.perf_counter()
+        try:
+            response = self.session.get(self.base_url + "/order/" + order_id + "/status",
+                                        params={"since": since, "timeout": wait}, timeout=(connect, read + wait))
+        except requests.RequestException as e:
+            self.errors["order_status"] += 1
+            logger.warning("Order status long-poll failed: %s", e)
+            return None
+        finally:
+            self.observe("order_status", started)
+        if response.status_code != 200:
+            return None
+        return response.json()
+
+    def close(self):
+        self.session.close()
+        self._idempotent_post.close()
+
+
+class AsyncPizzaApiClient(_ApiMetrics):
+
+    def __init__(self, base_url: str = None, timeouts: dict = None, retries: int = 3,
+                 backoff_factor: float = 0.2, pool_size: int = 100):
+        super().__init__()
+        self.base_url = (base_url or environ.get("PIZZA_API_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._inflight = {}  # Idempotency-Key -> task of the running submission
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=min(pool_size, 20)),
+        )
+
+    async def _request(self, endpoint: str, method: str, path: str, retry: bool = True,
+                       retry_status: tuple = RETRY_STATUS, **kwargs):
+        connect, read = self.timeouts[endpoint]
+        timeout = httpx.Timeout(read, connect=connect)
+        attempts = self.retries + 1 if retry else 1
+        started = time.perf_counter()
+        try:
+            for attempt in range(attempts):
+                try:
+                    response = await self.client.request(method, self.base_url + path, timeout=timeout, **kwargs)
+                except httpx.TransportError:
+                    if attempt == attempts - 1:
+                        self.errors[endpoint] += 1
+                        raise
+                else:
+                    if response.status_code not in retry_status or attempt == attempts - 1:
+                        return response
+                await asyncio.sleep(backoff(self.backoff_factor, attempt))
+        finally:
+            self.observe(endpoint, started)
+
+    async def list_pizzas(self, headers: dict = None) -> httpx.Response:
+        return await self._request("list_pizzas", "GET", "/pizza", headers=headers)
+
+    async def validate_address(self, city: str, street: str, house_number: str) -> bool:
+        post = {"city":city, "street":street, "house_number":house_number}
+        try:
+            response = await self._request("validate_address", "POST", "/address/validate", json=post)
+        except httpx.HTTPError as e:
+            logger.warning("Address validation failed: %s", e)
+            return False
+        return response.status_code == 200
+
+    async def get_address_rules(self):
+        try:
+            response = await self._request("address_rules", "GET", "/address/rules")
+        except httpx.HTTPError as e:
+            logger.warning("Address rules lookup failed: %s", e)
+            return None
+        if response.status_code != 200:
+            return None
+        return response.json()
+
+    async def create_order(self, pizza_id, city: str, street: str, house_number: str, idempotency_key: str = None):
+        post = {"pizza_id":pizza_id, "city":city, "street":street, "house_number":house_number}
+        if idempotency_key is None:
+            return await self._submit_order(post, None)
+
+        task = self._inflight.get(idempotency_key)
+        if task is None:
+            task = asyncio.ensure_future(self._submit_order(post, {"Idempotency-Key": idempotency_key}))
+            self._inflight[idempotency_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(idempotency_key, None))
+        #a cancelled caller must not cancel the submission the others are waiting for
+        return await asyncio.shield(task)
+
+    async def _submit_order(self, post: dict, headers):
+        try:
+            response = await self._request("create_order", "POST", "/order", retry=headers is not None,
+                                           retry_status=ORDER_RETRY_STATUS, json=post, headers=headers)
+        except httpx.HTTPError as e:
+            logger.warning("Order submission failed: %s", e)
+            return None
+        if response.status_code != 200:
+            return None
+        return response.json()
+
+    async def get_order(self, order_id: str):
+        try:
+            response = await self._request("get_order", "GET", "/order/" + order_id)
+        except httpx.HTTPError as e:
+            logger.warning("Order lookup failed: %s", e)
+            return None
+        if response.status_code != 200:
+            return None
+        return response.json()
+
+    async def wait_order_status(self, order_id: str, since: str, wait: float = 25.0):
+        connect, read = self.timeouts["order_status"]
+        started = time.perf_counter()
+        try:
+            response = await self.client.get(self.base_url + "/order/" + order_id + "/status",
+                                             params={"since": since, "timeout": wait},
+                                             timeout=httpx.Timeout(read + wait, connect=connect))
+        except httpx.HTTPError as e:
+            self.errors["order_status"] += 1
+            logger.warning("Order status long-poll failed: %s", e)
+            return None
+        finally:
+            self.observe("order_status", started)
+        if response.status_code != 200:
+            return None
+        return response.json()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_api_client = None
+_async_api_client = None
+
+
+def get_api_client() -> PizzaApiClient:
+    """
+    Returns the shared Pizza API client of this process
+    """
+    global _api_client
+    if _api_client is None:
+        _api_client = PizzaApiClient()
+    return _api_client
+
+
+def get_async_api_client() -> AsyncPizzaApiClient:
+    global _async_api_client
+    if _async_api_client is None:
+        _async_api_client = AsyncPizzaApiClient()
+    return _async_api_client
+
+
+def api_metrics() -> dict:
+    """
+    Latency histograms and error counts per endpoint of the clients created so far
+    """
+    clients = {"sync": _api_client, "async": _async_api_client}
+    return {name: client.metrics() for name, client in clients.items() if client is not None}
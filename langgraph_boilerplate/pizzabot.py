@@ -1,22 +1,37 @@
-from typing import TypedDict
-import requests
+from typing import TypedDict, Annotated
 from os import environ
-from openai import OpenAI
-from SPARQLWrapper import SPARQLWrapper, JSON
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
 import json
-
-from fuzzywuzzy import fuzz
+import uuid
+
+from menu_catalog import get_catalog
+from pizza_api import get_api_client
+from description_store import get_description_store
+from prompt_builder import get_prompt_builder
+from classifier import classify_turn, EMPTY_TURN
+from response_decoder import decode, PIZZA, DESCRIPTION
+from intent_rules import get_intent_classifier
+from address_extractor import get_address_extractor
+from address_validator import get_address_validator
+from order_status import get_order_status_cache
+from chat_state import window_messages, merge_slots
+from streaming import emit_reply, emit_update, JsonFieldStream, ReplyStream
+from prompts import (
+    resolve_pizza_messages,
+    resolve_description_messages,
+)
 
 from langgraph.graph import END, StateGraph
 from langchain_core.messages import (
     AIMessage,
-    FunctionMessage,
 )
 from enum import Enum
 
+GREETING = "Hi! I am a pizza bot. I can help you order a pizza. What would you like to order?"
+
 client = None
-cached_description = None
+async_client = None
 
 def load_llm():
     
@@ -27,21 +42,30 @@ def load_llm():
     #get model from http://gpu01.imn.htwk-leipzig.de:8081/v1/models
 
     #TODO probably a hack
-    global client 
+    global client, async_client
     client = OpenAI(
         api_key=openai_api_key,
         base_url=openai_api_base,
     )
+    async_client = AsyncOpenAI(
+        api_key=openai_api_key,
+        base_url=openai_api_base,
+    )
 
 class ChatbotState(TypedDict):
     """
-    Messages have the type "list". The `add_messages` function
+    Messages have the type "list". The `window_messages` function
     in the annotation defines how this state key should be updated
-    (in this case, it appends messages to the list, rather than overwriting them)
+    (in this case, it appends messages to the list, rather than overwriting them,
+    and folds messages older than the window into a summary message).
+    Nodes only return the keys they change, `slots` is merged key by key.
+    `awaiting` is the OrderSlots value the dialogue is waiting for (or None),
+    `order_key` the Idempotency-Key of the dialogue's order submission
     """
     input: str
-    slots: dict
-    messages: list
+    slots: Annotated[dict, merge_slots]
+    messages: Annotated[list, window_messages]
+    awaiting: str
     active_order: bool
     give_description: bool
     invalid: bool
@@ -49,6 +73,13 @@ class ChatbotState(TypedDict):
     pizza_id: str
     customer_address: tuple[str]
     order_id: str
+    order_key: str
+
+def initial_state(user_input: str) -> dict:
+    """
+    State of the first turn of a dialogue
+    """
+    return {"input": user_input, "slots": {}, "messages": [], "awaiting": None, "active_order": False, "give_description":False, "pizza_id":None, "customer_address":None, "order_id":None, "order_key": uuid.uuid4().hex, "invalid":False, "ended": False}
 
 class Nodes(Enum):
     ENTRY = "entry"
@@ -63,6 +94,12 @@ class OrderSlots(Enum):
     CUSTOMER_ADDRESS = "customer_address"
     ORDER_ID = "order_id"
 
+#hint for the turn classifier which input the dialogue is waiting for
+EXPECTED_INPUT = {
+    OrderSlots.PIZZA_NAME: "a pizza name or a question about a pizza",
+    OrderSlots.CUSTOMER_ADDRESS: "a delivery address",
+}
+
 class CheckerNode:
     """
     This node checks whether user input is valid
@@ -76,59 +113,97 @@ class CheckerNode:
         Checks whether the input is a valid request for pizza order
         """
         _input = state['input']
-        
-        if state['active_order']:
-            if OrderSlots.PIZZA_NAME.value in state["messages"][-1].content:
-                if check_description_intention(_input):
-                    state["give_description"] = True
-                    return {
-                        "messages": state["messages"],
-                        "give_description": state["give_description"]
-                    }
-                pizza_id = check_pizzas(_input)
-                if pizza_id is not None:
-                    #found pizza type
-                    state['pizza_id'] = pizza_id
-                    return {
-                        "messages": state["messages"],
-                        "pizza_id": state["pizza_id"]
-                    }
-                else:
-                    state["invalid"] = True
-                    state['messages'].append(AIMessage(content="Invalid pizza type. Please specify a valid type (e.g. a pizza Pepperoni)'."))
-                    return {
-                        "messages": state["messages"],
-                        "invalid": state["invalid"]
-                    }
-                    
-            elif OrderSlots.CUSTOMER_ADDRESS.value in state["messages"][-1].content:
-                customer_address = check_customer_address(_input)
-                if customer_address is not None:
-                    state['customer_address'] = customer_address
-                    return {
-                        "messages": state["messages"],
-                        "customer_address": state["customer_address"]
-                    }
-                else:
-                    state["invalid"] = True
-                    state['messages'].append(AIMessage(content="Invalid customer address. Please keep in mind, we only deliver to Halle, Leipzig and Dresden."))
-                    return {
-                        "messages": state["messages"],
-                        "invalid": state["invalid"]
-                    }
+        expected_slot = self.expected_slot(state)
+
+        #obvious inputs are answered locally, otherwise one LLM call for all checks of this turn
+        turn = self.quick_turn(_input, expected_slot)
+        if turn is None:
+            turn = classify_turn(client, _input, EXPECTED_INPUT.get(expected_slot))
+            self.log_turn(_input, expected_slot, turn)
+
+        customer_address = None
+        if expected_slot == OrderSlots.CUSTOMER_ADDRESS and turn["address"]:
+            customer_address = validate_customer_address(turn["address"])
+
+        return emit_update(self.apply_turn(state, expected_slot, turn, customer_address))
+
+    def quick_turn(self, _input, expected_slot):
+        """
+        Returns the turn if the local intent classifier is confident, None if the LLM is needed
+        """
+        if expected_slot == OrderSlots.CUSTOMER_ADDRESS:
+            #trained NER model, the LLM only runs if it misses a field
+            address = get_address_extractor().extract(_input, local_only=True)
+            return {**EMPTY_TURN, "address": address} if address else None
+        check = "description_intention" if expected_slot == OrderSlots.PIZZA_NAME else "order_intention"
+
+        def accept(intention):
+            #without the LLM the pizza has to be found in the input itself
+            return intention or expected_slot != OrderSlots.PIZZA_NAME or check_pizzas(_input) is not None
+
+        intention = get_intent_classifier().short_circuit(_input, check, accept)
+        if intention is None:
+            return None
+        return {**EMPTY_TURN, check: intention}
+
+    def log_turn(self, _input, expected_slot, turn: dict):
+        if expected_slot is None:
+            get_intent_classifier().log(_input, "order_intention", turn["order_intention"])
+        elif expected_slot == OrderSlots.PIZZA_NAME:
+            get_intent_classifier().log(_input, "description_intention", turn["description_intention"])
+
+    def expected_slot(self, state: ChatbotState):
+        """
+        Returns the slot the dialogue is currently waiting for
+        """
+        if state['active_order'] and state.get('awaiting'):
+            return OrderSlots(state['awaiting'])
+        return None
+
+    def apply_turn(self, state: ChatbotState, expected_slot, turn: dict, customer_address) -> dict:
+        """
+        Returns the state update for the classified turn and the validated address
+        """
+        _input = state['input']
+
+        if expected_slot == OrderSlots.PIZZA_NAME:
+            if turn["description_intention"]:
+                return {
+                    "give_description": True
+                }
+            pizza_id = check_pizzas(_input)
+            if pizza_id is None and turn["pizza"]:
+                pizza_id = check_pizzas(turn["pizza"])
+            if pizza_id is not None:
+                #found pizza type
+                return {
+                    "pizza_id": pizza_id
+                }
+            else:
+                return {
+                    "messages": [AIMessage(content="Invalid pizza type. Please specify a valid type (e.g. a pizza Pepperoni)'.")],
+                    "invalid": True
+                }
+
+        elif expected_slot == OrderSlots.CUSTOMER_ADDRESS:
+            if customer_address is not None:
+                return {
+                    "customer_address": customer_address
+                }
+            else:
+                return {
+                    "messages": [AIMessage(content="Invalid customer address. Please keep in mind, we only deliver to Halle, Leipzig and Dresden.")],
+                    "invalid": True
+                }
         
         #no other dialogue state -> implicit begin of conversation
-        if check_order_intention(_input):
-            state['active_order'] = True
-            # state['messages'].append(AIMessage(content="Your pizza order is valid."))
+        if turn["order_intention"]:
             return {
-                "messages": state["messages"],
-                "active_order": state["active_order"]
+                "active_order": True
             }
         else:
-            state['messages'].append(AIMessage(content="Invalid order. Please specify a pizza order. Try writing 'I want to order a pizza'."))
             return {
-                "messages": state["messages"]
+                "messages": [AIMessage(content="Invalid order. Please specify a pizza order. Try writing 'I want to order a pizza'.")]
             }
     
     def route(self, state: ChatbotState) -> str:
@@ -142,120 +217,18 @@ class CheckerNode:
         else:
             return END
 
-def check_order_intention(_input):
-    example_string_1 = "I wanna order a pizza."
-    assistant_docstring_1 = """{"intention": True}"""
-
-    example_string_2 = "How are you doing today?"
-    assistant_docstring_2 = """{"intention": False}"""
-
-    chat_response = client.chat.completions.create(
-        model=environ.get("MODEL_NAME"),
-        messages=[
-            {"role": "system", "content": """You are an Input Validation Tools.
-Recognize whether the user wants to order a pizza or he/she has another intention and output the structured data as a JSON. **Output ONLY the structured data.**
-Below is a text for you to analyze."""},
-            {"role": "user", "content": example_string_1},
-            {"role": "assistant", "content": assistant_docstring_1},
-            {"role": "user", "content": example_string_2},
-            {"role": "assistant", "content": assistant_docstring_2},
-            {"role": "user", "content": _input}
-        ]
-    )
-    
-    received_message = chat_response.choices[0].message.content
-    
-    #TODO use actual logging while in debug
-    #logger.info(received_message)
-    
-    return eval(received_message)["intention"]
-
-def check_description_intention(_input):
-    example_string_1 = "What is a Pizza Hawaiian?"
-    assistant_docstring_1 = """{"intention": True}"""
-
-    example_string_2 = "I want to order a pizza Pepperoni?"
-    assistant_docstring_2 = """{"intention": False}"""
-
-    chat_response = client.chat.completions.create(
-        model=environ.get("MODEL_NAME"),
-        messages=[
-            {"role": "system", "content": """You are an Input Validation Tools.
-Recognize whether the user wants receive further information about a specific pizza or he/she has another intention and output the structured data as a JSON. **Output ONLY the structured data.**
-Below is a text for you to analyze."""},
-            {"role": "user", "content": example_string_1},
-            {"role": "assistant", "content": assistant_docstring_1},
-            {"role": "user", "content": example_string_2},
-            {"role": "assistant", "content": assistant_docstring_2},
-            {"role": "user", "content": _input}
-        ]
-    )
-    
-    received_message = chat_response.choices[0].message.content
-    
-    return eval(received_message)["intention"]
-    
 def check_pizzas(input):
-    threshold = 80
-    response = requests.get("https://demos.swe.htwk-leipzig.de/pizza-api/pizza")
-    menu = response.json()
-    for item in menu:
-        current_ratio = fuzz.partial_ratio(input, list(item.values())[1])
-        if(current_ratio >= threshold):
-            #print("debugging: " + str(list(item.values())[1]) + " was determined type")
-            return str(list(item.values())[0])
-    return None
-
-def check_customer_address(input):
-    #use in-context-learning
-    example_string1 = "My address is Gustav-Freytag Straße 12A in Leipzig."
-    assistant_docstring1 = """[{"Leipzig": "CITY"}, {"Gustav-Freytag Straße": "STREET"}, {"12A": "HOUSE_NUMBER"}]"""
-    
-    example_string2 = "Leipziger Str. 3, Halle"
-    assistant_docstring2 = """[{"Halle": "CITY"}, {"Leipziger Str.": "STREET"}, {"3": "HOUSE_NUMBER"}]"""
-    
-    
-    #get current model from http://gpu01.imn.htwk-leipzig.de:8081/v1/models
-    chat_response = client.chat.completions.create(
-        model=environ.get('MODEL_NAME'),
-        messages=[
-            {"role": "system", "content": """You are a Named Entity Recognition Tool.
-Recognize named entities and output the structured data as a JSON. **Output ONLY the structured data.**
-Below is a text for you to analyze."""},
-            {"role": "user", "content": example_string1},
-            {"role": "assistant", "content": assistant_docstring1},
-            {"role": "user", "content": example_string2},
-            {"role": "assistant", "content": assistant_docstring2},
-            {"role": "user", "content": input}
-        ]
-    )
-    
-    receivedMessage = chat_response.choices[0].message.content
-    #receivedMessage = """[{"Leipzig": "CITY"}, {"Gustav-Freytag Straße": "STREET"}, {"12A": "HOUSE_NUMBER"}]"""
-    #print(receivedMessage)
-    
-    response_dictionary = {}
-    try:
-        for d in json.loads(receivedMessage):
-            response_dictionary.update(d)
-    except Exception as e:
-        #TODO log error
-        pass
-        
-    
-    necessary_fields = ["CITY", "STREET", "HOUSE_NUMBER"]    
-    #TODO do proper logging of errors
-    if not response_dictionary or not all(value in set(necessary_fields) for value in response_dictionary.values()):
+    #menu is cached and indexed by the catalog, no request per turn
+    item = get_catalog().resolve(input)
+    if item is None:
         return None
+    #print("debugging: " + item["name"] + " was determined type")
+    return str(item["id"])
 
-    city = [k for(k , v) in response_dictionary.items() if v == "CITY"][0]
-    street = [k for (k , v) in response_dictionary.items() if v == "STREET"][0]
-    house_number = [k for (k , v) in response_dictionary.items() if v == "HOUSE_NUMBER"][0]
-
-    post = {"city":city, "street":street, "house_number":house_number}
-    response = requests.post("https://demos.swe.htwk-leipzig.de/pizza-api/address/validate", json=post) 
-
-    if response.status_code != 200:
+def validate_customer_address(address):
+    city, street, house_number = address
+    #checked locally against the API's address rules, repeated addresses come from the cache
+    if not get_address_validator().validate(city, street, house_number):
         return None
 
     #print("debugging: Potential Address found: " + str((city, street, house_number)))
@@ -274,84 +247,86 @@ class OrderNode:
         Returns fallback message
         """
 
-        #use for additional information dialogue (not in correct order with order_id)
-        #required_slots = [..., OrderSlots.ADDITIONAL_INFORMATION, OrderSlots.ORDER_ID]
-        
-        required_slots = [OrderSlots.PIZZA_NAME, OrderSlots.CUSTOMER_ADDRESS, OrderSlots.ORDER_ID]
-        missing_slots = [slot.value for slot in required_slots if slot.value not in state['slots'].keys()]
+        missing_slots = self.missing_slots(state)
         
         #don't override invalidation ai messages
         if state["invalid"]:
-            last_function_message = [m for m in outputs["messages"] if isinstance(m, FunctionMessage) ][-1]
-            state["invalid"] = False
-            state["messages"].append(last_function_message)
-            return {
-                "messages": state["messages"],
-                "invalid": state["invalid"]
-            }
+            return self.repeat_question(state)
 
         next_slot = missing_slots[0]
         
         #try to end dialogue
         if next_slot == OrderSlots.ORDER_ID.value:
-            order_id = post_order(state["pizza_id"], state["customer_address"])
-            if order_id is not None:
-                state['order_id'] = order_id
-                state['messages'].append(AIMessage(content="Thank you for providing all the details. Your order is being processed! "
-                    + "Keep your order id ready incase you have further inquiries: " + state["order_id"] + " ."))
-                state['ended'] = True
-                return {
-                    "messages": state["messages"],
-                    "order_id": state["order_id"],
-                    "ended": state["ended"]
-                }
-            else:
-                #TODO better to properly set states for user to re-submit information  
-                state['messages'].append(AIMessage(content="Something went wrong while submitting your order, please try again."))
-                state['ended'] = True
-                return {
-                    "messages": state["messages"],
-                    "invalid": state["invalid"]
-                } 
+            order_id = post_order(state["pizza_id"], state["customer_address"], state.get("order_key"))
+            return emit_update(self.confirm_order(state, order_id))
+
+        menu_names = None
+        if next_slot == OrderSlots.PIZZA_NAME.value and not state["give_description"]:
+            menu_names = get_catalog().names()
+        return emit_update(self.ask_for_slot(state, next_slot, menu_names))
+
+    def missing_slots(self, state: ChatbotState) -> list:
+        #use for additional information dialogue (not in correct order with order_id)
+        #required_slots = [..., OrderSlots.ADDITIONAL_INFORMATION, OrderSlots.ORDER_ID]
+        
+        required_slots = [OrderSlots.PIZZA_NAME, OrderSlots.CUSTOMER_ADDRESS, OrderSlots.ORDER_ID]
+        return [slot.value for slot in required_slots if slot.value not in state['slots'].keys()]
+
+    def repeat_question(self, state: ChatbotState) -> dict:
+        #`awaiting` is unchanged, the invalidation message already asks again
+        return {
+            "invalid": False
+        }
 
+    def confirm_order(self, state: ChatbotState, order_id) -> dict:
+        if order_id is not None:
+            return {
+                "messages": [AIMessage(content="Thank you for providing all the details. Your order is being processed! "
+                    + "Keep your order id ready incase you have further inquiries: " + order_id + " .")],
+                "order_id": order_id,
+                "awaiting": None,
+                "ended": True
+            }
+        else:
+            #TODO better to properly set states for user to re-submit information  
+            return {
+                "messages": [AIMessage(content="Something went wrong while submitting your order, please try again.")],
+                "awaiting": None,
+                "ended": True
+            } 
+
+    def ask_for_slot(self, state: ChatbotState, next_slot: str, menu_names: list = None) -> dict:
         if next_slot == OrderSlots.PIZZA_NAME.value:
+            messages = []
             
             #TODO also give possibility to ask for pizza description
             if not state["give_description"]:    
-                response = requests.get("https://demos.swe.htwk-leipzig.de/pizza-api/pizza")
-                menu = response.json()
-                menu_str = ""
-                
-                for item in menu:
-                    menu_str += item["name"] + ", "
-                menu_str = menu_str[:-2]    
+                menu_str = ", ".join(menu_names)
             
-                state['messages'].append(AIMessage("What pizza would you like to order? We are currently delivering the following items: " + menu_str + 
-                                                   ".\n We can also provide further information about a pizza item, if you any questions."))
-            state["messages"].append(FunctionMessage(content=OrderSlots.PIZZA_NAME, name=OrderSlots.PIZZA_NAME.value))
+                messages.append(AIMessage("What pizza would you like to order? We are currently delivering the following items: " + menu_str + 
+                                          ".\n We can also provide further information about a pizza item, if you any questions."))
             return {
-                "messages": state["messages"]
+                "messages": messages,
+                "awaiting": OrderSlots.PIZZA_NAME.value
             }
         
         elif next_slot == OrderSlots.CUSTOMER_ADDRESS.value:
-            state['messages'].append(AIMessage("What is your delivery address?"))
-            state["messages"].append(FunctionMessage(content=OrderSlots.CUSTOMER_ADDRESS, name=OrderSlots.CUSTOMER_ADDRESS.value))
             return {
-                "messages": state["messages"]
+                "messages": [AIMessage("What is your delivery address?")],
+                "awaiting": OrderSlots.CUSTOMER_ADDRESS.value
             }
             
 
-def post_order(pizza_id, address):
+def post_order(pizza_id, address, idempotency_key=None):
     city, street, house_number = address
-    post = {"pizza_id":pizza_id, "city":city, "street":street, "house_number":house_number}
-    #TODO extract base URL into .env
-    response = requests.post("https://demos.swe.htwk-leipzig.de/pizza-api/order", json=post)
+    #retries and resubmissions with the same key never create a second order
+    order = get_api_client().create_order(pizza_id, city, street, house_number, idempotency_key)
 
-    if response.status_code != 200:
+    if order is None:
         return None
     
-    order_id = response.json()["order_id"]
-    status = response.json()["status"]
+    order_id = order["order_id"]
+    status = order["status"]
 
     if status != "received":
         return None
@@ -359,9 +334,10 @@ def post_order(pizza_id, address):
     return order_id
     
 def get_order(order_id):
-    response = requests.get("https://demos.swe.htwk-leipzig.de/pizza-api/address/validate/" + order_id)
-    order = response.json()
-    #TODO return order information if asked
+    """
+    Returns the order with its current status, answered from the order status cache
+    """
+    return get_order_status_cache().get(order_id)
 
 class RetrievalNode:
     """
@@ -375,33 +351,20 @@ class RetrievalNode:
         """
         Extracts the information from user input
         """
-        last_message = state["messages"][-1] if len(state["messages"]) > 0 else "No message"
+        awaiting = state.get("awaiting")
 
         #TODO instead don't enter RetrievalNode in case of inactive Order move into routing
-        if not state['active_order'] or not isinstance(last_message, FunctionMessage):
-            return {
-                "messages": state["messages"],
-                "slots": state["slots"],
-                "ended": state["ended"]
-            }
+        #nothing to fill if no slot was asked for or the checker rejected the input,
+        #langgraph rejects empty updates, an empty slots dict leaves the slots untouched
+        if not state['active_order'] or not awaiting or state["invalid"]:
+            return {"slots": {}}
         
         _input = state['input'].lower()
 
         #'slots' used to handle missing<->required fields
-        if last_message.content == OrderSlots.PIZZA_NAME.value:
-            state['slots'][OrderSlots.PIZZA_NAME.value] = _input
-            return {
-                "messages": state["messages"],
-                "slots": state["slots"],
-                "ended": state["ended"]
-            }
-        elif last_message.content == OrderSlots.CUSTOMER_ADDRESS.value:
-            state['slots'][OrderSlots.CUSTOMER_ADDRESS.value] = _input
-            return {
-                "messages": state["messages"],
-                "slots": state["slots"],
-                "ended": state["ended"]
-            }
+        return {
+            "slots": {awaiting: _input}
+        }
 
 class DescriptionNode:
     """
@@ -421,157 +384,111 @@ class DescriptionNode:
         #determine which pizza user want to get information for
         
         pizza_name = resolve_pizza(_input)
-        pizza_description = resolve_description(_input)
 
-        
+        #deterministic fast path: exact, alias or confident fuzzy label match
+        match = get_description_store().match(pizza_name or _input)
+        if match is not None:
+            entry, _, _ = match
+            return emit_update(self.answer(state, entry["label"], entry["description"]))
+
+        #low confidence -> let the LLM pick from all descriptions, its answer is streamed while it arrives
+        prefix = description_prefix(pizza_name or _input)
+        streamed = []
+
+        def on_text(text):
+            if not text:
+                return
+            if not streamed:
+                streamed.append(prefix)
+                emit_reply(prefix)
+            streamed.append(text)
+            emit_reply(text)
+
+        pizza_description = resolve_description(_input, on_text)
+
+        return emit_update(self.answer(state, pizza_name or _input, pizza_description), "".join(streamed))
+
+    def answer(self, state: ChatbotState, pizza_name, pizza_description) -> dict:
         if not pizza_description:
             #TODO give_description necessary?
             return {
-                "messages": state["messages"]
+                "give_description": False
             }
         
-        state['messages'].append(AIMessage("Further Information about '" + pizza_name + "': " + pizza_description + "."
-                                           + " Would you like more information on another pizza type?"))
-        state["messages"].append(FunctionMessage(content=OrderSlots.PIZZA_NAME, name=OrderSlots.PIZZA_NAME.value))
-        state["give_description"] = False
+        #still waiting for the pizza name (`awaiting` stays OrderSlots.PIZZA_NAME)
         return {
-            "messages": state["messages"],
-            "give_description": state["give_description"]
+            "messages": [AIMessage(description_prefix(pizza_name) + pizza_description + "."
+                                   + " Would you like more information on another pizza type?")],
+            "give_description": False
         }
 
-def resolve_description(_input):
-    
-    description_query = """
-PREFIX schema: <http://schema.org/>
-PREFIX wdt: <http://www.wikidata.org/prop/direct/>
-PREFIX wd: <http://www.wikidata.org/entity/>
-PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-SELECT * WHERE {
-    ?pizza wdt:P31 wd:Q116392487 . # get all entities URIs that are an instance of the pizza type 
-    ?pizza rdfs:label ?label .     # get the names of the pizza
-      FILTER (lang(?label) = 'en')   # fitler for English pizza names only
-    ?pizza schema:description ?description # get the descriptions of the pizza
-      FILTER (lang(?description) = 'en')     # fitler for English pizza description only
-} 
-ORDER BY ?label # sort by name
-"""
+def description_prefix(pizza_name):
+    return "Further Information about '" + pizza_name + "': "
+
+def resolve_description(_input, on_text=None):
+    """
+    `on_text(text)` receives the description while the LLM streams it
+    """
     
-    result = execute_sparql(description_query) if not cached_description else cached_description
+    #served from the local store, Wikidata is only queried when the store is stale
+    entries = get_description_store().entries()
     #TODO proper error handling
-    if "error" in result:
+    if not entries:
         return
+
+    #only the most similar candidates within the token budget
+    pizza_desc_pairs = get_prompt_builder().description_pairs(
+        _input, entries, lambda pairs: resolve_description_messages(_input, pairs))
     
-    pizza_desc_pairs = []
-    for dictionary in result["results"]["bindings"]:
-        pizza_desc_pairs.append(str(dictionary['label']['value']) +':'+ str(dictionary['description']['value']))
-        
-    desc = resolve_description_for_pizza(_input, pizza_desc_pairs)
+    desc = resolve_description_for_pizza(_input, pizza_desc_pairs, on_text)
     
     return desc
 
 
-def resolve_description_for_pizza(_input, pizza_desc_pairs):
-    example_input_1 = "I want to know more about a Margherita"
-    example_string_1 = """["'Magherita':'A pizza with only tomato sauce and cheese'","'Hawaiian':'a pizza with pineapples and ham'","'Pepperoni':'A pizza with pepperoni slices and tomato sauce'"]"""
-    assistant_docstring_1 = """{"desc": "A pizza with only tomato sauce and cheese"}"""
-
-    chat_response = client.chat.completions.create(
-        model=environ.get("MODEL_NAME"),
-        messages=[
-            {"role": "system", "content": """You are an Input Detection Tool.
-Recognize which pizza from a selected amount of labels, the user has selected and return the description for that pizza and output the structured data as a JSON. **Output ONLY the structured data.**
-Below is a text for you to analyze."""},
-            {"role": "user", "content": example_input_1 + ";" + example_string_1},
-            {"role": "assistant", "content": assistant_docstring_1},
-            {"role": "user", "content": _input + ";" + str(pizza_desc_pairs)}
-        ]
-    )
-    
-    received_message = chat_response.choices[0].message.content
+def resolve_description_for_pizza(_input, pizza_desc_pairs, on_text=None):
+    on_token = None
+    if on_text is not None:
+        #the completion is a dict, only the value of "desc" is shown to the user
+        field = JsonFieldStream("desc")
+        on_token = lambda delta: on_text(field.feed(delta))
+
+    data = decode(client, resolve_description_messages(_input, pizza_desc_pairs), DESCRIPTION, on_token=on_token)
     
     #TODO use actual logging while in debug
-    #logger.info(received_message)
-    
-    return_message = ""
+    #logger.info(data)
     
-    try:
-        return_message = eval(received_message)["desc"]
-    except Exception as e:
-        return_message = "No Description found"
+    if data is None:
+        return "No Description found"
     
-    return return_message
+    return data["desc"]
 
 
 def resolve_pizza(_input):
-    
-    #TODO add correct labels
-    #requires the example pizzas to be within the result set
-    example_string_1 = "I want to know more about a Margherita."
-    assistant_docstring_1 = """{"pizza": "Margherita"}"""
-
-    example_string_2 = "What are the toppings on a pizza Pepperoni."
-    assistant_docstring_2 = """{"pizza": "Pepperoni"}"""
-
-    example_string_3 = "What's a Chicaco style."
-    assistant_docstring_3 = """{"pizza": "Chicago style pizza"}"""
-
-
-    chat_response = client.chat.completions.create(
-        model=environ.get("MODEL_NAME"),
-        messages=[
-            {"role": "system", "content": """You are an Input Detection Tool.
-Recognize which pizza from a given input, the user has selected or he/she has another intention and output the structured data as a JSON. **Output ONLY the structured data.**
-Below is a text for you to analyze."""},
-            {"role": "user", "content": example_string_1},
-            {"role": "assistant", "content": assistant_docstring_1},
-            {"role": "user", "content": example_string_2},
-            {"role": "assistant", "content": assistant_docstring_2},
-            {"role": "user", "content": example_string_3},
-            {"role": "assistant", "content": assistant_docstring_3},
-            {"role": "user", "content": _input}
-        ]
-    )
-    
-    received_message = chat_response.choices[0].message.content
+    data = decode(client, resolve_pizza_messages(_input), PIZZA)
     
     #TODO use actual logging while in debug
-    #logger.info(received_message)
+    #logger.info(data)
     
-    return eval(received_message)["pizza"]
+    return data["pizza"] if data is not None else None
     
-def execute_sparql(query: str, endpoint_url: str = 'https://query.wikidata.org/bigdata/namespace/wdq/sparql'):
+def build_graph(checkpointer=None, node_classes=None, method: str = "invoke"):
     """
-    https://query.wikidata.org/bigdata/namespace/wdq/sparql
+    Wires and compiles the dialogue graph, shared by the console, streamlit and the async graph.
+    `node_classes` are the (checker, retrieval, order form, description) node classes,
+    `method` the name of their node function ("invoke" or "ainvoke")
     """
-    try:
-        #TODO cache awnsers to file? (once per day) -> otherwise HTTP Code too many requests
-        #for now once per session
-        sparql = SPARQLWrapper(endpoint_url)
-        sparql.timeout = 20
-        sparql.setQuery(query)
-        sparql.setReturnFormat(JSON)
-        response = sparql.query().convert()
-        return response
-    except Exception as e:
-        #TODO logging
-        #logger.error(str(e))
-        if 'MalformedQueryException' in e or 'bad formed' in e:
-            return {'error': str(e)}
-        return {'error': str(e)}
-
-if __name__ == "__main__":
-    # Initialize nodes
-    order_node = OrderNode()
-    checker_node = CheckerNode()
-    retrieval_node = RetrievalNode()
-    description_node = DescriptionNode()
+    checker_class, retrieval_class, order_class, description_class = node_classes or (
+        CheckerNode, RetrievalNode, OrderNode, DescriptionNode)
+    checker_node = checker_class()
+    retrieval_node = retrieval_class()
+    order_node = order_class()
+    description_node = description_class()
 
     workflow = StateGraph(ChatbotState)
-    workflow.add_node(Nodes.CHECKER.value, checker_node.invoke)
-    workflow.add_node(Nodes.RETRIEVAL.value, retrieval_node.invoke)
-    workflow.add_node(Nodes.ORDER_FORM.value, order_node.invoke)
-    workflow.add_node(Nodes.DESCRIPTION.value, description_node.invoke)
+    workflow.add_node(Nodes.CHECKER.value, getattr(checker_node, method))
+    workflow.add_node(Nodes.RETRIEVAL.value, getattr(retrieval_node, method))
+    workflow.add_node(Nodes.ORDER_FORM.value, getattr(order_node, method))
+    workflow.add_node(Nodes.DESCRIPTION.value, getattr(description_node, method))
 
     workflow.add_conditional_edges(
         Nodes.CHECKER.value,
@@ -589,23 +506,33 @@ if __name__ == "__main__":
     workflow.add_edge(Nodes.ORDER_FORM.value, END)
     
     workflow.set_entry_point(Nodes.CHECKER.value)
-    graph = workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
+    
+if __name__ == "__main__":
+    graph = build_graph()
     
     # load llm
     load_llm()
+    get_description_store().start_background_refresh()
     
     # START DIALOGUE: first message
-    print("-- Chatbot: ", "Hi! I am a pizza bot. I can help you order a pizza. What would you like to order?")
-    user_input = input("-> Your response: ")
-    outputs = graph.invoke({"input": user_input, "slots": {}, "messages": [], "active_order": False, "give_description":False, "pizza_id":None, "customer_address":None, "invalid":False, "ended": False})
+    print("-- Chatbot: ", GREETING)
+    outputs = None
 
     while True:
-        print("-- Chatbot: ", [m.content for m in outputs["messages"] if isinstance(m, AIMessage) ][-1]) # print chatbot response
         user_input = input("-> Your response: ")
 
-        outputs = graph.invoke({"input": user_input, "slots": outputs["slots"], "messages": outputs["messages"], "active_order": outputs["active_order"], "give_description":outputs["give_description"], "pizza_id":outputs["pizza_id"], "customer_address":outputs["customer_address"], "invalid":outputs["invalid"], "ended": outputs["ended"]})
+        #messages are bounded by the window, the other keys are scalars
+        inputs = initial_state(user_input) if outputs is None else {**outputs, "input": user_input}
+        reply = ReplyStream(graph, inputs)
+
+        # print chatbot response while it is generated
+        print("-- Chatbot: ", end=" ", flush=True)
+        for text in reply:
+            print(text, end="", flush=True)
+        print()
+        outputs = reply.outputs
 
         # check if the conversation has ended
         if outputs["ended"]:
-            print("-- Chatbot: ", [m.content for m in outputs["messages"] if isinstance(m, AIMessage) ][-1]) # print chatbot response
-            break
\ No newline at end of file
+            break
@@ -0,0 +1,233 @@
+"""
+Async variant of the pizzabot graph.
+
+The nodes reuse the dialogue logic of `pizzabot.py`, but every LLM call goes through `AsyncOpenAI`
+and every Pizza API call through the pooled `AsyncPizzaApiClient`, so a single worker can run many
+dialogues concurrently with `graph.ainvoke` / `graph.astream`.
+"""
+import asyncio
+
+from langchain_core.messages import AIMessage
+
+import pizzabot
+from pizzabot import (
+    ChatbotState,
+    GREETING,
+    OrderSlots,
+    EXPECTED_INPUT,
+    CheckerNode,
+    OrderNode,
+    RetrievalNode,
+    DescriptionNode,
+    build_graph,
+    description_prefix,
+    initial_state,
+    load_llm,
+)
+from menu_catalog import get_catalog
+from pizza_api import get_async_api_client
+from address_validator import get_address_validator
+from description_store import get_description_store
+from prompt_builder import get_prompt_builder
+from classifier import CHECKER_FAN_OUT, aclassify_turn, fan_out_checks
+from response_decoder import adecode, PIZZA, DESCRIPTION
+from prompts import resolve_pizza_messages, resolve_description_messages
+from streaming import aemit_reply, aemit_update, JsonFieldStream, ReplyStream
+
+
+async def avalidate_customer_address(address):
+    city, street, house_number = address
+    if not await get_address_validator().avalidate(city, street, house_number):
+        return None
+
+    return (city, street, house_number)
+
+
+async def apost_order(pizza_id, address, idempotency_key=None):
+    city, street, house_number = address
+    order = await get_async_api_client().create_order(pizza_id, city, street, house_number, idempotency_key)
+
+    if order is None or order["status"] != "received":
+        return None
+
+    return order["order_id"]
+
+
+async def aresolve_pizza(_input):
+    data = await adecode(pizzabot.async_client, resolve_pizza_messages(_input), PIZZA)
+    return data["pizza"] if data is not None else None
+
+
+async def aresolve_description(_input, on_text=None):
+    """
+    `on_text(text)` (a coroutine function) receives the description while the LLM streams it
+    """
+    entries = await get_description_store().aentries()
+    #TODO proper error handling
+    if not entries:
+        return
+
+    pizza_desc_pairs = get_prompt_builder().description_pairs(
+        _input, entries, lambda pairs: resolve_description_messages(_input, pairs))
+    on_token = None
+    if on_text is not None:
+        field = JsonFieldStream("desc")
+        on_token = lambda delta: on_text(field.feed(delta))
+
+    data = await adecode(
+        pizzabot.async_client,
+        resolve_description_messages(_input, pizza_desc_pairs),
+        DESCRIPTION,
+        on_token=on_token
+    )
+    if data is None:
+        return "No Description found"
+    return data["desc"]
+
+
+#checks of the fan-out mode that apply_turn reads for the expected slot
+FAN_OUT_SLOT_CHECKS = {
+    None: ("order_intention", "description_intention"),
+    OrderSlots.PIZZA_NAME: ("description_intention", "pizza"),
+    OrderSlots.CUSTOMER_ADDRESS: ("address",),
+}
+
+
+class AsyncCheckerNode(CheckerNode):
+
+    def __init__(self, fan_out: bool = None, **kwargs):
+        super().__init__(**kwargs)
+        self.fan_out = CHECKER_FAN_OUT if fan_out is None else fan_out
+
+    async def aclassify(self, _input, expected_slot) -> dict:
+        if self.fan_out:
+            return await fan_out_checks(pizzabot.async_client, _input,
+                                        FAN_OUT_SLOT_CHECKS.get(expected_slot, FAN_OUT_SLOT_CHECKS[None]))
+        return await aclassify_turn(pizzabot.async_client, _input, EXPECTED_INPUT.get(expected_slot))
+
+    async def ainvoke(self, state: ChatbotState) -> dict:
+        _input = state['input']
+        expected_slot = self.expected_slot(state)
+
+        if expected_slot == OrderSlots.PIZZA_NAME:
+            #the quick turn resolves the pizza from the menu
+            await get_catalog().arefresh_if_stale()
+
+        #obvious inputs are answered locally, otherwise one LLM call for all checks of this turn.
+        #spaCy, the local rules and the menu lookup (which falls back to a blocking menu refresh)
+        #run in a worker thread to keep the event loop free for the other dialogues
+        turn = await asyncio.to_thread(self.quick_turn, _input, expected_slot)
+        if turn is None:
+            turn = await self.aclassify(_input, expected_slot)
+            await asyncio.to_thread(self.log_turn, _input, expected_slot, turn)
+
+        customer_address = None
+        if expected_slot == OrderSlots.CUSTOMER_ADDRESS and turn["address"]:
+            customer_address = await avalidate_customer_address(turn["address"])
+
+        update = await asyncio.to_thread(self.apply_turn, state, expected_slot, turn, customer_address)
+        return await aemit_update(update)
+
+
+class AsyncOrderNode(OrderNode):
+
+    async def ainvoke(self, state: ChatbotState) -> dict:
+        missing_slots = self.missing_slots(state)
+
+        #don't override invalidation ai messages
+        if state["invalid"]:
+            return self.repeat_question(state)
+
+        next_slot = missing_slots[0]
+
+        #try to end dialogue
+        if next_slot == OrderSlots.ORDER_ID.value:
+            order_id = await apost_order(state["pizza_id"], state["customer_address"], state.get("order_key"))
+            return await aemit_update(self.confirm_order(state, order_id))
+
+        menu_names = None
+        if next_slot == OrderSlots.PIZZA_NAME.value and not state["give_description"]:
+            menu_names = await get_catalog().anames()
+        return await aemit_update(self.ask_for_slot(state, next_slot, menu_names))
+
+
+class AsyncRetrievalNode(RetrievalNode):
+
+    async def ainvoke(self, state: ChatbotState) -> dict:
+        #no I/O, only slot bookkeeping
+        return self.invoke(state)
+
+
+class AsyncDescriptionNode(DescriptionNode):
+
+    async def ainvoke(self, state: ChatbotState) -> dict:
+        _input = state['input'].lower()
+
+        pizza_name = await aresolve_pizza(_input)
+
+        #deterministic fast path: exact, alias or confident fuzzy label match
+        await get_description_store().aentries()
+        match = get_description_store().match(pizza_name or _input)
+        if match is not None:
+            entry, _, _ = match
+            return await aemit_update(self.answer(state, entry["label"], entry["description"]))
+
+        #low confidence -> let the LLM pick from all descriptions, its answer is streamed while it arrives
+        prefix = description_prefix(pizza_name or _input)
+        streamed = []
+
+        async def on_text(text):
+            if not text:
+                return
+            if not streamed:
+                streamed.append(prefix)
+                await aemit_reply(prefix)
+            streamed.append(text)
+            await aemit_reply(text)
+
+        pizza_description = await aresolve_description(_input, on_text)
+        return await aemit_update(self.answer(state, pizza_name or _input, pizza_description), "".join(streamed))
+
+
+def build_async_graph(checkpointer=None):
+    """
+    With a `checkpointer` the state is kept per `thread_id`, callers only send the new input
+    """
+    return build_graph(
+        checkpointer=checkpointer,
+        node_classes=(AsyncCheckerNode, AsyncRetrievalNode, AsyncOrderNode, AsyncDescriptionNode),
+        method="ainvoke",
+    )
+
+
+async def main():
+    graph = build_async_graph()
+    load_llm()
+    get_description_store().start_background_refresh()
+
+    print("-- Chatbot: ", GREETING)
+    outputs = None
+
+    try:
+        while True:
+            user_input = await asyncio.to_thread(input, "-> Your response: ")
+
+            inputs = initial_state(user_input) if outputs is None else {**outputs, "input": user_input}
+            reply = ReplyStream(graph, inputs)
+
+            # print chatbot response while it is generated
+            print("-- Chatbot: ", end=" ", flush=True)
+            async for text in reply:
+                print(text, end="", flush=True)
+            print()
+            outputs = reply.outputs
+
+            # check if the conversation has ended
+            if outputs["ended"]:
+                break
+    finally:
+        await get_async_api_client().aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
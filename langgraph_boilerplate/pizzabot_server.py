@@ -0,0 +1,188 @@
+"""
+HTTP/WebSocket server of the pizzabot.
+
+The async graph is compiled once per worker and every dialogue is a LangGraph thread keyed by its
+session id. The state lives in the checkpointer (SQLite with an in-memory hot tier), so clients only
+send the new input and any worker with access to the database can resume a dialogue.
+
+Run with `uvicorn pizzabot_server:app --port 8080`.
+"""
+import uuid
+import asyncio
+import logging
+import weakref
+from os import environ
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from pizzabot import GREETING, initial_state, load_llm
+from pizzabot_async import build_async_graph
+from streaming import ReplyStream
+from checkpointing import TieredCheckpointSaver, DEFAULT_HOT_SESSIONS
+from description_store import get_description_store
+from pizza_api import get_async_api_client, api_metrics
+from order_status import get_order_status_cache
+from prompt_builder import get_prompt_builder
+from llm_cache import get_cache
+from intent_rules import get_intent_classifier
+from response_decoder import get_decoder
+from address_extractor import get_address_extractor
+from address_validator import get_address_validator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_PATH = "checkpoints.sqlite"
+
+graph = None
+checkpointer = None
+#one turn at a time per session, the lock disappears with the last waiting request
+_session_locks = weakref.WeakValueDictionary()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global graph, checkpointer
+    async with AsyncSqliteSaver.from_conn_string(environ.get("CHECKPOINT_PATH", DEFAULT_CHECKPOINT_PATH)) as saver:
+        checkpointer = TieredCheckpointSaver(
+            saver, max_sessions=int(environ.get("CHECKPOINT_HOT_SESSIONS", DEFAULT_HOT_SESSIONS)))
+        graph = build_async_graph(checkpointer=checkpointer)
+        load_llm()
+        get_description_store().start_background_refresh()
+        try:
+            yield
+        finally:
+            await get_async_api_client().aclose()
+            get_cache().flush()
+
+
+app = FastAPI(title="Pizzabot", lifespan=lifespan)
+
+
+class Turn(BaseModel):
+    input: str
+
+
+def thread_config(session_id: str) -> dict:
+    return {"configurable": {"thread_id": session_id}}
+
+
+def last_reply(state: dict):
+    return next((m.content for m in reversed(state["messages"]) if isinstance(m, AIMessage)), None)
+
+
+async def run_turn(session_id: str, user_input: str, on_text=None) -> dict:
+    """
+    Runs one turn of the session, `on_text(text)` (a coroutine function) receives the reply while it is generated
+    """
+    config = thread_config(session_id)
+    lock = _session_locks.setdefault(session_id, asyncio.Lock())
+    async with lock:
+        snapshot = await graph.aget_state(config)
+        if not snapshot.values:
+            inputs = initial_state(user_input)
+        elif snapshot.values["ended"]:
+            raise HTTPException(status_code=409, detail="Dialogue has ended")
+        else:
+            #all other keys are restored from the checkpoint
+            inputs = {"input": user_input}
+
+        if on_text is None:
+            outputs = await graph.ainvoke(inputs, config)
+        else:
+            reply = ReplyStream(graph, inputs, config)
+            async for text in reply:
+                await on_text(text)
+            outputs = reply.outputs
+
+    return {
+        "session_id": session_id,
+        "reply": last_reply(outputs),
+        "slots": outputs["slots"],
+        "ended": outputs["ended"],
+    }
+
+
+@app.post("/sessions")
+async def create_session():
+    return {"session_id": uuid.uuid4().hex, "reply": GREETING}
+
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    snapshot = await graph.aget_state(thread_config(session_id))
+    if not snapshot.values:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {
+        "session_id": session_id,
+        "reply": last_reply(snapshot.values),
+        "slots": snapshot.values["slots"],
+        "ended": snapshot.values["ended"],
+    }
+
+
+@app.post("/sessions/{session_id}/messages")
+async def post_message(session_id: str, turn: Turn):
+    return await run_turn(session_id, turn.input)
+
+
+@app.get("/sessions/{session_id}/order")
+async def get_session_order(session_id: str, wait: float = Query(default=0, ge=0, le=60)):
+    """
+    Status of the order placed in the dialogue; with `wait` the request is held until the status changes
+    """
+    snapshot = await graph.aget_state(thread_config(session_id))
+    order_id = snapshot.values.get("order_id") if snapshot.values else None
+    if not order_id:
+        raise HTTPException(status_code=404, detail="No order placed in this session")
+    orders = get_order_status_cache()
+    order = await (orders.await_change(order_id, wait) if wait else orders.aget(order_id))
+    if order is None:
+        raise HTTPException(status_code=502, detail="Order status not available")
+    return order
+
+
+@app.websocket("/sessions/{session_id}/ws")
+async def dialogue_socket(websocket: WebSocket, session_id: str):
+    await websocket.accept()
+    try:
+        if (await graph.aget_state(thread_config(session_id))).values:
+            await websocket.send_json(await get_session(session_id))
+        else:
+            await websocket.send_json({"session_id": session_id, "reply": GREETING})
+
+        async def send_delta(text):
+            await websocket.send_json({"session_id": session_id, "delta": text})
+
+        while True:
+            user_input = await websocket.receive_text()
+            try:
+                #the reply is sent in "delta" frames while it is generated, followed by the result of the turn
+                result = await run_turn(session_id, user_input, on_text=send_delta)
+            except HTTPException as e:
+                await websocket.send_json({"session_id": session_id, "error": e.detail})
+                break
+            await websocket.send_json(result)
+            if result["ended"]:
+                break
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.debug("Session %s disconnected", session_id)
+
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "checkpointer": checkpointer.metrics(),
+        "order_status": get_order_status_cache().metrics(),
+        "prompt": get_prompt_builder().metrics(),
+        "pizza_api": api_metrics(),
+        "llm_cache": get_cache().stats(),
+        "intent_rules": get_intent_classifier().metrics(),
+        "response_decoder": get_decoder().metrics(),
+        "address_extractor": get_address_extractor().metrics(),
+        "address_validator": get_address_validator().metrics(),
+    }
@@ -0,0 +1,147 @@
+"""
+Token-budgeted assembly of the description prompt.
+
+Instead of sending every Wikidata label:description pair, the candidates are ranked by lexical
+similarity to the user input, only the top-k are kept, long descriptions are shortened and pairs are
+added until the configured token budget of the whole prompt is reached. Token counts use `tiktoken`
+if it is installed and a character based estimate otherwise.
+"""
+import logging
+import threading
+from os import environ
+
+from name_index import normalize, char_ngrams
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = 1024  # tokens of the whole prompt (system prompt, few-shot examples and context)
+DEFAULT_TOP_K = 20
+DEFAULT_MAX_DESCRIPTION_TOKENS = 40
+MESSAGE_OVERHEAD_TOKENS = 4  # role and separators per chat message
+
+#words that appear in almost every question about a pizza and carry no signal for ranking
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "what", "whats", "s", "about", "more", "know", "tell", "me", "i",
+    "want", "to", "of", "on", "with", "pizza", "pizzas", "please", "like", "would", "do", "you", "toppings",
+}
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(text: str) -> int:
+        return len(_encoding.encode(text))
+
+    def truncate_tokens(text: str, max_tokens: int) -> str:
+        tokens = _encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return _encoding.decode(tokens[:max_tokens]).rstrip() + "..."
+except ImportError:
+    def count_tokens(text: str) -> int:
+        # roughly 4 characters per token for English text
+        return (len(text) + 3) // 4
+
+    def truncate_tokens(text: str, max_tokens: int) -> str:
+        if count_tokens(text) <= max_tokens:
+            return text
+        return text[:max_tokens * 4].rsplit(" ", 1)[0].rstrip() + "..."
+
+
+def count_message_tokens(messages: list) -> int:
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def compress_description(description: str, max_tokens: int = DEFAULT_MAX_DESCRIPTION_TOKENS) -> str:
+    return truncate_tokens(" ".join(description.split()), max_tokens)
+
+
+def similarity(query_tokens: set, query_grams: set, entry: dict) -> float:
+    """
+    Token overlap with the label (and weaker with the description) plus trigram similarity of the label
+    """
+    label = normalize(entry["label"])
+    label_tokens = set(label.split()) - STOPWORDS
+    description_tokens = set(normalize(entry["description"]).split()) - STOPWORDS
+    label_grams = char_ngrams(label)
+    union = len(query_grams | label_grams)
+    jaccard = len(query_grams & label_grams) / union if union else 0.0
+    return 2 * len(query_tokens & label_tokens) + 0.5 * len(query_tokens & description_tokens) + jaccard
+
+
+class PromptBuilder:
+    """
+    Selects the description candidates within the token budget and records prompt size metrics
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET, top_k: int = DEFAULT_TOP_K,
+                 max_description_tokens: int = DEFAULT_MAX_DESCRIPTION_TOKENS):
+        self.token_budget = token_budget
+        self.top_k = top_k
+        self.max_description_tokens = max_description_tokens
+        self._lock = threading.Lock()
+        self._metrics = {
+            "prompts": 0,
+            "prompt_tokens_total": 0,
+            "prompt_tokens_max": 0,
+            "last_prompt_tokens": 0,
+            "candidates_seen": 0,
+            "candidates_kept": 0,
+            "budget_exhausted": 0,
+        }
+
+    def description_pairs(self, _input: str, entries: list, render) -> list:
+        """
+        Returns the 'label:description' pairs to send for `_input`.
+        `render(pairs)` builds the chat messages, it is used to measure the fixed part of the prompt.
+        """
+        query = normalize(_input)
+        query_tokens = set(query.split()) - STOPWORDS
+        query_grams = char_ngrams(" ".join(query_tokens) or query)
+
+        ranked = sorted(entries, key=lambda entry: similarity(query_tokens, query_grams, entry), reverse=True)
+
+        used = count_message_tokens(render([]))
+        pairs, exhausted = [], False
+        for entry in ranked[:self.top_k]:
+            pair = entry["label"] + ":" + compress_description(entry["description"], self.max_description_tokens)
+            cost = count_tokens(repr(pair)) + 1  # quotes and list separator
+            if used + cost > self.token_budget:
+                exhausted = True
+                break
+            pairs.append(pair)
+            used += cost
+
+        with self._lock:
+            self._metrics["prompts"] += 1
+            self._metrics["prompt_tokens_total"] += used
+            self._metrics["prompt_tokens_max"] = max(self._metrics["prompt_tokens_max"], used)
+            self._metrics["last_prompt_tokens"] = used
+            self._metrics["candidates_seen"] += len(entries)
+            self._metrics["candidates_kept"] += len(pairs)
+            self._metrics["budget_exhausted"] += int(exhausted)
+        logger.debug("Description prompt: %s tokens, %s of %s candidates", used, len(pairs), len(entries))
+        return pairs
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["mean_prompt_tokens"] = metrics["prompt_tokens_total"] / metrics["prompts"] if metrics["prompts"] else 0.0
+        return metrics
+
+
+_builder = None
+
+
+def get_prompt_builder() -> PromptBuilder:
+    """
+    Returns the shared prompt builder, configured via PROMPT_* environment variables
+    """
+    global _builder
+    if _builder is None:
+        _builder = PromptBuilder(
+            token_budget=int(environ.get("PROMPT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET)),
+            top_k=int(environ.get("PROMPT_TOP_K", DEFAULT_TOP_K)),
+            max_description_tokens=int(environ.get("PROMPT_MAX_DESCRIPTION_TOKENS", DEFAULT_MAX_DESCRIPTION_TOKENS)),
+        )
+    return _builder
@@ -0,0 +1,146 @@
+"""
+Few-shot prompts used by the LLM helpers of the pizzabot.
+
+Every function returns the `messages` list for `client.chat.completions.create`,
+so the synchronous helpers, the async fan-out and the combined classifier share one prompt.
+"""
+
+ORDER_INTENTION_SYSTEM = """You are an Input Validation Tools.
+Recognize whether the user wants to order a pizza or he/she has another intention and output the structured data as a JSON. **Output ONLY the structured data.**
+Below is a text for you to analyze."""
+
+DESCRIPTION_INTENTION_SYSTEM = """You are an Input Validation Tools.
+Recognize whether the user wants receive further information about a specific pizza or he/she has another intention and output the structured data as a JSON. **Output ONLY the structured data.**
+Below is a text for you to analyze."""
+
+CUSTOMER_ADDRESS_SYSTEM = """You are a Named Entity Recognition Tool.
+Recognize named entities and output the structured data as a JSON. **Output ONLY the structured data.**
+Below is a text for you to analyze."""
+
+RESOLVE_PIZZA_SYSTEM = """You are an Input Detection Tool.
+Recognize which pizza from a given input, the user has selected or he/she has another intention and output the structured data as a JSON. **Output ONLY the structured data.**
+Below is a text for you to analyze."""
+
+RESOLVE_DESCRIPTION_SYSTEM = """You are an Input Detection Tool.
+Recognize which pizza from a selected amount of labels, the user has selected and return the description for that pizza and output the structured data as a JSON. **Output ONLY the structured data.**
+Below is a text for you to analyze."""
+
+CLASSIFY_TURN_SYSTEM = """You are an Input Validation and Named Entity Recognition Tool for a pizza delivery.
+Analyze the user message and output ONE JSON object with the keys:
+"order_intention": true if the user wants to order a pizza, otherwise false,
+"description_intention": true if the user wants further information about a specific pizza, otherwise false,
+"pizza": the pizza the user mentions or null,
+"address": an object with the keys "CITY", "STREET" and "HOUSE_NUMBER" if the user gives a delivery address, otherwise null.
+The dialogue currently expects: {expected}. **Output ONLY the structured data.**
+Below is a text for you to analyze."""
+
+
+def order_intention_messages(_input):
+    example_string_1 = "I wanna order a pizza."
+    assistant_docstring_1 = """{"intention": true}"""
+
+    example_string_2 = "How are you doing today?"
+    assistant_docstring_2 = """{"intention": false}"""
+
+    return [
+        {"role": "system", "content": ORDER_INTENTION_SYSTEM},
+        {"role": "user", "content": example_string_1},
+        {"role": "assistant", "content": assistant_docstring_1},
+        {"role": "user", "content": example_string_2},
+        {"role": "assistant", "content": assistant_docstring_2},
+        {"role": "user", "content": _input}
+    ]
+
+
+def description_intention_messages(_input):
+    example_string_1 = "What is a Pizza Hawaiian?"
+    assistant_docstring_1 = """{"intention": true}"""
+
+    example_string_2 = "I want to order a pizza Pepperoni?"
+    assistant_docstring_2 = """{"intention": false}"""
+
+    return [
+        {"role": "system", "content": DESCRIPTION_INTENTION_SYSTEM},
+        {"role": "user", "content": example_string_1},
+        {"role": "assistant", "content": assistant_docstring_1},
+        {"role": "user", "content": example_string_2},
+        {"role": "assistant", "content": assistant_docstring_2},
+        {"role": "user", "content": _input}
+    ]
+
+
+def customer_address_messages(_input):
+    #use in-context-learning
+    example_string1 = "My address is Gustav-Freytag Straße 12A in Leipzig."
+    assistant_docstring1 = """[{"Leipzig": "CITY"}, {"Gustav-Freytag Straße": "STREET"}, {"12A": "HOUSE_NUMBER"}]"""
+
+    example_string2 = "Leipziger Str. 3, Halle"
+    assistant_docstring2 = """[{"Halle": "CITY"}, {"Leipziger Str.": "STREET"}, {"3": "HOUSE_NUMBER"}]"""
+
+    return [
+        {"role": "system", "content": CUSTOMER_ADDRESS_SYSTEM},
+        {"role": "user", "content": example_string1},
+        {"role": "assistant", "content": assistant_docstring1},
+        {"role": "user", "content": example_string2},
+        {"role": "assistant", "content": assistant_docstring2},
+        {"role": "user", "content": _input}
+    ]
+
+
+def resolve_pizza_messages(_input):
+    #TODO add correct labels
+    #requires the example pizzas to be within the result set
+    example_string_1 = "I want to know more about a Margherita."
+    assistant_docstring_1 = """{"pizza": "Margherita"}"""
+
+    example_string_2 = "What are the toppings on a pizza Pepperoni."
+    assistant_docstring_2 = """{"pizza": "Pepperoni"}"""
+
+    example_string_3 = "What's a Chicaco style."
+    assistant_docstring_3 = """{"pizza": "Chicago style pizza"}"""
+
+    return [
+        {"role": "system", "content": RESOLVE_PIZZA_SYSTEM},
+        {"role": "user", "content": example_string_1},
+        {"role": "assistant", "content": assistant_docstring_1},
+        {"role": "user", "content": example_string_2},
+        {"role": "assistant", "content": assistant_docstring_2},
+        {"role": "user", "content": example_string_3},
+        {"role": "assistant", "content": assistant_docstring_3},
+        {"role": "user", "content": _input}
+    ]
+
+
+def resolve_description_messages(_input, pizza_desc_pairs):
+    example_input_1 = "I want to know more about a Margherita"
+    example_string_1 = """["'Magherita':'A pizza with only tomato sauce and cheese'","'Hawaiian':'a pizza with pineapples and ham'","'Pepperoni':'A pizza with pepperoni slices and tomato sauce'"]"""
+    assistant_docstring_1 = """{"desc": "A pizza with only tomato sauce and cheese"}"""
+
+    return [
+        {"role": "system", "content": RESOLVE_DESCRIPTION_SYSTEM},
+        {"role": "user", "content": example_input_1 + ";" + example_string_1},
+        {"role": "assistant", "content": assistant_docstring_1},
+        {"role": "user", "content": _input + ";" + str(pizza_desc_pairs)}
+    ]
+
+
+def classify_turn_messages(_input, expected=None):
+    example_string_1 = "I wanna order a pizza."
+    assistant_docstring_1 = """{"order_intention": true, "description_intention": false, "pizza": null, "address": null}"""
+
+    example_string_2 = "What is a Pizza Hawaiian?"
+    assistant_docstring_2 = """{"order_intention": false, "description_intention": true, "pizza": "Hawaiian", "address": null}"""
+
+    example_string_3 = "Please deliver a Pepperoni to Gustav-Freytag Straße 12A in Leipzig."
+    assistant_docstring_3 = """{"order_intention": true, "description_intention": false, "pizza": "Pepperoni", "address": {"CITY": "Leipzig", "STREET": "Gustav-Freytag Straße", "HOUSE_NUMBER": "12A"}}"""
+
+    return [
+        {"role": "system", "content": CLASSIFY_TURN_SYSTEM.format(expected=expected or "the start of a pizza order")},
+        {"role": "user", "content": example_string_1},
+        {"role": "assistant", "content": assistant_docstring_1},
+        {"role": "user", "content": example_string_2},
+        {"role": "assistant", "content": assistant_docstring_2},
+        {"role": "user", "content": example_string_3},
+        {"role": "assistant", "content": assistant_docstring_3},
+        {"role": "user", "content": _input}
+    ]
@@ -0,0 +1,261 @@
+"""
+Decoding of the structured LLM responses.
+
+Every helper declares a `Schema` of the JSON it expects. `decode` requests JSON mode where the schema
+is a JSON object, parses the answer strictly and, if that fails, tolerantly (code fences, text around
+the JSON, Python literals such as True/None, single quotes). An answer that still does not match the
+schema is re-asked a bounded number of times inside the same turn instead of costing the user a
+dialogue round trip. Parse results are counted per schema.
+"""
+import re
+import ast
+import json
+import logging
+import threading
+from os import environ
+
+import openai
+
+from llm_cache import complete, acomplete
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_REASKS = 1
+JSON_MODE = {"type": "json_object"}
+REASK_MESSAGE = "Your answer could not be used. Output ONLY the JSON {shape} with the keys {keys}, nothing else."
+
+_PYTHON_LITERALS = {"true": "True", "false": "False", "null": "None"}
+
+
+def _extract(text: str):
+    """
+    First balanced JSON object or array of `text`, quotes and brackets within strings are skipped
+    """
+    start = next((i for i, char in enumerate(text) if char in "{["), None)
+    if start is None:
+        return None
+    stack, quote, escaped = [], None, False
+    for i in range(start, len(text)):
+        char = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if not stack or stack.pop() != char:
+                return None
+            if not stack:
+                return text[start:i + 1]
+    return None
+
+
+def _pythonize(text: str) -> str:
+    """
+    Replaces JSON true/false/null outside of strings with their Python literals
+    """
+    return re.sub(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|\b(true|false|null)\b""",
+                  lambda m: m.group(1) or _PYTHON_LITERALS[m.group(2)], text)
+
+
+def parse_lenient(received_message):
+    """
+    Parses JSON, JSON embedded in text or code fences and Python literals, returns None if nothing parses
+    """
+    if not isinstance(received_message, str):
+        return None
+    try:
+        return json.loads(received_message)
+    except ValueError:
+        pass
+
+    candidate = _extract(received_message)
+    if candidate is None:
+        return None
+    for parse in (json.loads, ast.literal_eval, lambda text: ast.literal_eval(_pythonize(text))):
+        try:
+            return parse(candidate)
+        except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+            continue
+    return None
+
+
+class Schema:
+    """
+    Expected shape of a response: a JSON object with typed `fields` (None allowed where listed in
+    `nullable`), or a JSON array for `container=list`
+    """
+
+    def __init__(self, name: str, fields: dict = None, nullable=(), container=dict):
+        self.name = name
+        self.fields = fields or {}
+        self.nullable = set(nullable)
+        self.container = container
+
+    @property
+    def json_mode(self) -> bool:
+        #JSON mode only guarantees objects, not arrays
+        return self.container is dict
+
+    def validate(self, data):
+        """
+        Returns the data with coerced field types, or None if it does not match
+        """
+        if not isinstance(data, self.container):
+            return None
+        if self.container is not dict:
+            return data
+
+        validated = dict(data)
+        for field, field_type in self.fields.items():
+            if field not in data:
+                return None
+            value = data[field]
+            if value is None:
+                if field not in self.nullable:
+                    return None
+                continue
+            if field_type is bool and isinstance(value, str) and value.lower() in ("true", "false"):
+                value = value.lower() == "true"
+            if not isinstance(value, field_type):
+                return None
+            validated[field] = value
+        return validated
+
+    def accepts(self, received_message) -> bool:
+        return self.validate(parse_lenient(received_message)) is not None
+
+    def reask_messages(self, messages: list, received_message) -> list:
+        shape = "object" if self.container is dict else "array"
+        keys = ", ".join(f'"{field}"' for field in self.fields) or "of the examples"
+        return messages + [
+            {"role": "assistant", "content": received_message or ""},
+            {"role": "user", "content": REASK_MESSAGE.format(shape=shape, keys=keys)},
+        ]
+
+
+INTENTION = Schema("intention", {"intention": bool})
+PIZZA = Schema("pizza", {"pizza": str}, nullable=("pizza",))
+DESCRIPTION = Schema("description", {"desc": str})
+TURN = Schema("turn", {"order_intention": bool, "description_intention": bool, "pizza": str, "address": dict},
+              nullable=("pizza", "address"))
+ADDRESS_ENTITIES = Schema("address_entities", container=list)
+
+
+class ResponseDecoder:
+
+    def __init__(self, max_reasks: int = DEFAULT_MAX_REASKS, json_mode: bool = True):
+        self.max_reasks = max_reasks
+        self.json_mode = json_mode
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _count(self, schema: Schema, outcome: str):
+        with self._lock:
+            counts = self._metrics.setdefault(
+                schema.name, {"responses": 0, "strict": 0, "lenient": 0, "invalid": 0, "reasks": 0, "failures": 0})
+            counts[outcome] += 1
+
+    def _parse(self, schema: Schema, received_message):
+        self._count(schema, "responses")
+        try:
+            data = json.loads(received_message)
+            outcome = "strict"
+        except (TypeError, ValueError):
+            data = parse_lenient(received_message)
+            outcome = "lenient"
+        validated = schema.validate(data)
+        self._count(schema, outcome if validated is not None else "invalid")
+        return validated
+
+    def _request_options(self, schema: Schema) -> dict:
+        return {"response_format": JSON_MODE} if self.json_mode and schema.json_mode else {}
+
+    def _disable_json_mode(self, e):
+        #OpenAI compatible servers without JSON mode reject the parameter
+        logger.warning("LLM endpoint rejected JSON mode, continuing without it: %s", e)
+        self.json_mode = False
+
+    def decode(self, client, messages: list, schema: Schema, on_token=None):
+        """
+        Returns the validated response of `messages`, or None after `max_reasks` re-asks
+        """
+        for attempt in range(self.max_reasks + 1):
+            if attempt:
+                self._count(schema, "reasks")
+            try:
+                received_message = complete(client, messages, cacheable=schema.accepts, on_token=on_token,
+                                            **self._request_options(schema))
+            except openai.BadRequestError as e:
+                if not self._request_options(schema):
+                    raise
+                self._disable_json_mode(e)
+                received_message = complete(client, messages, cacheable=schema.accepts, on_token=on_token)
+
+            data = self._parse(schema, received_message)
+            if data is not None:
+                return data
+            #the streamed tokens of a re-ask would repeat the answer
+            on_token = None
+            messages = schema.reask_messages(messages, received_message)
+
+        self._count(schema, "failures")
+        logger.warning("Could not decode %s response: %r", schema.name, received_message)
+        return None
+
+    async def adecode(self, async_client, messages: list, schema: Schema, on_token=None):
+        for attempt in range(self.max_reasks + 1):
+            if attempt:
+                self._count(schema, "reasks")
+            try:
+                received_message = await acomplete(async_client, messages, cacheable=schema.accepts,
+                                                   on_token=on_token, **self._request_options(schema))
+            except openai.BadRequestError as e:
+                if not self._request_options(schema):
+                    raise
+                self._disable_json_mode(e)
+                received_message = await acomplete(async_client, messages, cacheable=schema.accepts, on_token=on_token)
+
+            data = self._parse(schema, received_message)
+            if data is not None:
+                return data
+            on_token = None
+            messages = schema.reask_messages(messages, received_message)
+
+        self._count(schema, "failures")
+        logger.warning("Could not decode %s response: %r", schema.name, received_message)
+        return None
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._metrics.items()}
+
+
+_decoder = None
+
+
+def get_decoder() -> ResponseDecoder:
+    """
+    Returns the shared decoder, configured via LLM_MAX_REASKS and LLM_JSON_MODE
+    """
+    global _decoder
+    if _decoder is None:
+        _decoder = ResponseDecoder(
+            max_reasks=int(environ.get("LLM_MAX_REASKS", DEFAULT_MAX_REASKS)),
+            json_mode=environ.get("LLM_JSON_MODE", "true").lower() == "true",
+        )
+    return _decoder
+
+
+def decode(client, messages: list, schema: Schema, on_token=None):
+    return get_decoder().decode(client, messages, schema, on_token)
+
+
+async def adecode(async_client, messages: list, schema: Schema, on_token=None):
+    return await get_decoder().adecode(async_client, messages, schema, on_token)
@@ -0,0 +1,167 @@
+"""
+Streaming of the bot reply.
+
+Nodes emit the text of their reply as LangGraph custom events (`REPLY_EVENT`) while they produce it:
+LLM generated text token by token, template messages at once. `ReplyStream` runs one turn with
+`astream_events` and yields these pieces, so the UIs can render the reply before the turn has finished.
+"""
+import re
+import queue
+import asyncio
+import threading
+
+from langchain_core.callbacks.manager import dispatch_custom_event, adispatch_custom_event
+from langchain_core.messages import AIMessage
+
+REPLY_EVENT = "bot_reply"
+ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+_DONE = object()
+
+
+def emit_reply(text: str):
+    if not text:
+        return
+    try:
+        dispatch_custom_event(REPLY_EVENT, {"text": text})
+    except RuntimeError:
+        #called outside of a graph run, nobody listens
+        pass
+
+
+async def aemit_reply(text: str):
+    if not text:
+        return
+    try:
+        await adispatch_custom_event(REPLY_EVENT, {"text": text})
+    except RuntimeError:
+        pass
+
+
+def unsent_reply(update: dict, streamed: str = "") -> str:
+    """
+    Text of the AI messages in a node update that has not been streamed yet
+    """
+    text = "".join(m.content for m in update.get("messages", []) if isinstance(m, AIMessage))
+    return text[len(streamed):] if streamed and text.startswith(streamed) else text
+
+
+def emit_update(update: dict, streamed: str = "") -> dict:
+    emit_reply(unsent_reply(update, streamed))
+    return update
+
+
+async def aemit_update(update: dict, streamed: str = "") -> dict:
+    await aemit_reply(unsent_reply(update, streamed))
+    return update
+
+
+class JsonFieldStream:
+    """
+    Incrementally decodes the string value of `field` from a streamed JSON (or Python dict) completion,
+    `feed(delta)` returns the newly decoded characters
+    """
+
+    def __init__(self, field: str):
+        self._start = re.compile(r"""["']%s["']\s*:\s*(["'])""" % re.escape(field))
+        self._buffer = ""
+        self._pos = None
+        self._quote = None
+        self.done = False
+
+    def feed(self, delta: str) -> str:
+        self._buffer += delta
+        if self.done:
+            return ""
+        if self._pos is None:
+            match = self._start.search(self._buffer)
+            if match is None:
+                return ""
+            self._quote, self._pos = match.group(1), match.end()
+
+        buffer, i, decoded = self._buffer, self._pos, []
+        while i < len(buffer):
+            char = buffer[i]
+            if char == "\\":
+                #wait for the rest of an escape sequence
+                if i + 1 >= len(buffer):
+                    break
+                escaped = buffer[i + 1]
+                if escaped == "u":
+                    if i + 6 > len(buffer):
+                        break
+                    try:
+                        decoded.append(chr(int(buffer[i + 2:i + 6], 16)))
+                    except ValueError:
+                        decoded.append(buffer[i:i + 6])
+                    i += 6
+                    continue
+                decoded.append(ESCAPES.get(escaped, escaped))
+                i += 2
+                continue
+            if char == self._quote:
+                self.done = True
+                i += 1
+                break
+            decoded.append(char)
+            i += 1
+        self._pos = i
+        return "".join(decoded)
+
+
+class ReplyStream:
+    """
+    Runs one turn of `graph` and yields the reply text while it is produced, iterable with `for` and
+    `async for`. `outputs` holds the final state once the stream is exhausted.
+    """
+
+    def __init__(self, graph, inputs: dict, config: dict = None):
+        self.graph = graph
+        self.inputs = inputs
+        self.config = config
+        self.outputs = None
+        self.text = ""
+
+    async def _events(self):
+        async for event in self.graph.astream_events(self.inputs, self.config, version="v2"):
+            if event["event"] == "on_custom_event" and event["name"] == REPLY_EVENT:
+                self.text += event["data"]["text"]
+                yield event["data"]["text"]
+            elif event["event"] == "on_chain_end" and not event.get("parent_ids"):
+                self.outputs = event["data"]["output"]
+
+        if self.outputs is None:
+            #e.g. a graph that was interrupted, read the state from the checkpointer
+            self.outputs = (await self.graph.aget_state(self.config)).values
+
+        if not self.text:
+            #nothing new to say this turn, repeat the last reply
+            last = next((m.content for m in reversed(self.outputs.get("messages", [])) if isinstance(m, AIMessage)), "")
+            self.text = last
+            if last:
+                yield last
+
+    def __aiter__(self):
+        return self._events()
+
+    def __iter__(self):
+        #run the async stream in its own thread and event loop, e.g. for streamlit and the console
+        chunks = queue.Queue()
+
+        def run():
+            async def consume():
+                async for text in self:
+                    chunks.put(text)
+            try:
+                asyncio.run(consume())
+                chunks.put(_DONE)
+            except BaseException as e:
+                chunks.put(e)
+
+        threading.Thread(target=run, name="reply-stream", daemon=True).start()
+        while True:
+            item = chunks.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
@@ -0,0 +1,123 @@
+"""
+Shared fixtures: the Pizza API of `common/main.py` served on a local port and a scripted LLM client.
+
+Run with `python -m pytest tests` from `langgraph_boilerplate/`.
+"""
+import os
+import sys
+import json
+import socket
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(HERE, "..", "..", "common"))
+
+#no files outside of tmp, no spaCy model, no OpenAI endpoint
+_tmp = tempfile.mkdtemp(prefix="pizzabot-tests-")
+os.environ.update({
+    "ORDER_REPOSITORY": "memory",
+    "LLM_CACHE_PATH": os.path.join(_tmp, "llm_cache.sqlite"),
+    "DESCRIPTION_STORE_PATH": os.path.join(_tmp, "pizza_descriptions.json"),
+    "ADDRESS_EXTRACTOR": "llm",
+    "INTENT_LOG_PATH": "",
+    "MODEL_NAME": "test-model",
+})
+
+import uvicorn
+
+import pizza_api
+import menu_catalog
+import address_extractor
+import address_validator
+import intent_rules
+import llm_cache
+import order_status
+import prompt_builder
+import response_decoder
+
+SINGLETONS = [
+    (pizza_api, "_api_client"),
+    (pizza_api, "_async_api_client"),
+    (menu_catalog, "_catalog"),
+    (address_extractor, "_extractor"),
+    (address_validator, "_validator"),
+    (intent_rules, "_classifier"),
+    (llm_cache, "_cache"),
+    (order_status, "_cache"),
+    (prompt_builder, "_builder"),
+    (response_decoder, "_decoder"),
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def pizza_api_url():
+    """
+    Base URL of `common/main.py` running in a background thread
+    """
+    import main
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("Pizza API did not start")
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(5)
+
+
+@pytest.fixture(autouse=True)
+def fresh_singletons(monkeypatch, tmp_path):
+    """
+    Every test gets new clients, caches and classifiers (and its own LLM cache file)
+    """
+    monkeypatch.setenv("LLM_CACHE_PATH", str(tmp_path / "llm_cache.sqlite"))
+    for module, name in SINGLETONS:
+        monkeypatch.setattr(module, name, None)
+    yield
+    if pizza_api._api_client is not None:
+        pizza_api._api_client.close()
+
+
+def _completion(content: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeLLM:
+    """
+    OpenAI client double, `answer(messages)` returns the completion (a dict is sent as JSON)
+    """
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _content(self, messages) -> str:
+        self.calls.append(messages)
+        content = self.answer(messages)
+        return content if isinstance(content, str) else json.dumps(content)
+
+    def create(self, model=None, messages=None, **options):
+        return _completion(self._content(messages))
+
+
+class FakeAsyncLLM(FakeLLM):
+
+    async def create(self, model=None, messages=None, **options):
+        return _completion(self._content(messages))
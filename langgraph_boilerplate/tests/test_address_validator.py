@@ -0,0 +1,53 @@
+"""
+Local address validation against the rules published by the Pizza API.
+"""
+import address_validator
+from address_validator import AddressValidator
+
+RULES = {"version": "v1", "valid_cities": ["Leipzig"], "min_street_length": 3, "house_number_required": True}
+
+
+class RulesApi:
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.fetches = 0
+
+    def get_address_rules(self):
+        self.fetches += 1
+        return self.rules
+
+
+def test_rules_are_refetched_after_the_ttl(monkeypatch):
+    api = RulesApi(RULES)
+    monkeypatch.setattr(address_validator, "get_api_client", lambda: api)
+    now = [1000.0]
+    monkeypatch.setattr(address_validator.time, "time", lambda: now[0])
+    validator = AddressValidator(rules_ttl=60)
+
+    assert validator.validate("Leipzig", "Hauptstraße", "5")
+    assert not validator.validate("Dresden", "Hauptstraße", "5")
+    assert api.fetches == 1 and validator.version == "v1"
+
+    #the API starts delivering to Dresden
+    api.rules = {**RULES, "version": "v2", "valid_cities": ["Leipzig", "Dresden"]}
+    now[0] += 30
+    assert not validator.validate("Dresden", "Hauptstraße", "5")
+    now[0] += 31
+    assert validator.validate("Dresden", "Hauptstraße", "5")
+    assert api.fetches == 2 and validator.version == "v2"
+
+
+def test_known_rules_are_kept_while_the_api_is_unreachable(monkeypatch):
+    api = RulesApi(RULES)
+    monkeypatch.setattr(address_validator, "get_api_client", lambda: api)
+    now = [1000.0]
+    monkeypatch.setattr(address_validator.time, "time", lambda: now[0])
+    validator = AddressValidator(rules_ttl=60)
+    assert validator.validate("Leipzig", "Hauptstraße", "5")
+
+    api.rules = None
+    now[0] += 61
+    assert not validator.validate("Halle", "Hauptstraße", "5")
+    assert validator.version == "v1"
+    assert validator.metrics()["local"] == 2
@@ -0,0 +1,54 @@
+"""
+Refreshes of the description store with a scripted Wikidata fetch.
+"""
+import time
+import threading
+
+from description_store import DescriptionStore
+
+ENTRIES = [{"uri": "http://www.wikidata.org/entity/Q1", "label": "Pizza Margherita",
+            "description": "pizza with tomatoes and mozzarella", "aliases": []}]
+
+
+class SlowFetch:
+
+    def __init__(self, delay: float = 0.2):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return ENTRIES
+
+
+def test_startup_queries_wikidata_once(tmp_path):
+    fetch = SlowFetch()
+    store = DescriptionStore(path=str(tmp_path / "descriptions.json"), fetch=fetch)
+    store.start_background_refresh()
+
+    readers = [threading.Thread(target=store.entries) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+
+    assert store.entries() == ENTRIES
+    time.sleep(0.1)
+    assert fetch.calls == 1
+
+
+def test_stale_data_is_served_while_revalidating(tmp_path):
+    fetch = SlowFetch()
+    store = DescriptionStore(path=str(tmp_path / "descriptions.json"), fetch=fetch, max_age=3600)
+    assert store.lookup("margherita") == ENTRIES[0]
+
+    store._fetched_at -= 7200
+    started = time.monotonic()
+    assert store.entries() == ENTRIES
+    assert time.monotonic() - started < fetch.delay
+    time.sleep(fetch.delay * 2)
+    assert fetch.calls == 2
+    assert store.refresh_if_stale() is False
@@ -0,0 +1,121 @@
+"""
+Drives whole order dialogues through the compiled graphs against the local Pizza API.
+"""
+import asyncio
+
+import pytest
+
+import pizzabot
+import pizzabot_async
+import prompts
+from classifier import fan_out_checks
+from pizza_api import get_api_client
+from conftest import FakeLLM, FakeAsyncLLM
+
+ADDRESS = "Please deliver to Hauptstraße 5 in Leipzig"
+
+#address turns the LLM classifies, everything else is answered by the local rules
+TURNS = {
+    ADDRESS: {"order_intention": False, "description_intention": False, "pizza": None,
+              "address": {"CITY": "Leipzig", "STREET": "Hauptstraße", "HOUSE_NUMBER": "5"}},
+    "Atlantis 1": {"order_intention": False, "description_intention": False, "pizza": None,
+                   "address": {"CITY": "Atlantis", "STREET": "Main", "HOUSE_NUMBER": "1"}},
+}
+
+
+def answer(messages):
+    _input = messages[-1]["content"]
+    if _input not in TURNS:
+        raise AssertionError(f"unexpected LLM call: {_input}")
+    return TURNS[_input]
+
+
+#answers of the separate few-shot checks of the fan-out mode
+FAN_OUT_TURNS = {
+    ADDRESS: [{"Leipzig": "CITY"}, {"Hauptstraße": "STREET"}, {"5": "HOUSE_NUMBER"}],
+    "Atlantis 1": [{"Atlantis": "CITY"}, {"Main": "STREET"}, {"1": "HOUSE_NUMBER"}],
+}
+
+
+def fan_out_answer(messages):
+    assert messages[0]["content"] == prompts.CUSTOMER_ADDRESS_SYSTEM, "only the address check may reach the LLM"
+    return FAN_OUT_TURNS[messages[-1]["content"]]
+
+
+def last_reply(state) -> str:
+    return state["messages"][-1].content
+
+
+@pytest.fixture
+def llm(pizza_api_url, monkeypatch):
+    monkeypatch.setenv("PIZZA_API_URL", pizza_api_url)
+    monkeypatch.setattr(pizzabot, "client", FakeLLM(answer))
+    monkeypatch.setattr(pizzabot, "async_client", FakeAsyncLLM(answer))
+
+
+def assert_order_dialogue(turn):
+    state = turn(pizzabot.initial_state("I want to order a pizza"))
+    assert state["active_order"] and not state["ended"]
+    assert state["awaiting"] == pizzabot.OrderSlots.PIZZA_NAME.value
+    assert "Margherita" in last_reply(state)
+
+    state = turn({**state, "input": "Margherita"})
+    assert state["pizza_id"] == "1"
+    assert state["awaiting"] == pizzabot.OrderSlots.CUSTOMER_ADDRESS.value
+
+    state = turn({**state, "input": "Atlantis 1"})
+    assert "we only deliver to" in last_reply(state)
+    assert state["awaiting"] == pizzabot.OrderSlots.CUSTOMER_ADDRESS.value
+    assert not state["ended"]
+
+    state = turn({**state, "input": ADDRESS})
+    assert state["ended"]
+    assert state["customer_address"] == ("Leipzig", "Hauptstraße", "5")
+    assert state["order_id"] in last_reply(state)
+
+    order = get_api_client().get_order(state["order_id"])
+    assert order["pizza_id"] == 1 and order["status"] == "received"
+
+
+def test_order_dialogue(llm):
+    graph = pizzabot.build_graph()
+    assert_order_dialogue(graph.invoke)
+
+
+def run_async_dialogue():
+    graph = pizzabot_async.build_async_graph()
+    #one loop for the whole dialogue, the pooled async API client is bound to it
+    loop = asyncio.new_event_loop()
+    try:
+        assert_order_dialogue(lambda state: loop.run_until_complete(graph.ainvoke(state)))
+    finally:
+        loop.close()
+
+
+def test_order_dialogue_async(llm):
+    run_async_dialogue()
+
+
+def test_order_dialogue_fan_out(llm, monkeypatch):
+    monkeypatch.setattr(pizzabot_async, "CHECKER_FAN_OUT", True)
+    monkeypatch.setattr(pizzabot, "async_client", FakeAsyncLLM(fan_out_answer))
+    run_async_dialogue()
+
+
+def test_fan_out_keeps_defaults_of_failed_checks(caplog):
+    def answer(messages):
+        if messages[0]["content"] == prompts.ORDER_INTENTION_SYSTEM:
+            raise ConnectionError("LLM down")
+        return {"intention": True}
+
+    turn = asyncio.run(fan_out_checks(FakeAsyncLLM(answer), "What is a Hawaiian?"))
+    assert turn["order_intention"] is False
+    assert turn["description_intention"] is True
+    assert "order_intention failed" in caplog.text
+
+
+def test_greeting_without_order(llm):
+    graph = pizzabot.build_graph()
+    state = graph.invoke(pizzabot.initial_state("hello"))
+    assert not state["active_order"] and not state["ended"]
+    assert "I want to order a pizza" in last_reply(state)
@@ -0,0 +1,40 @@
+"""
+The local rules must only decide inputs they are sure about, everything else goes to the LLM (None).
+"""
+import pytest
+
+from intent_rules import IntentClassifier
+
+CASES = [
+    #order_intention
+    ("order_intention", "I want to order a pizza", True),
+    ("order_intention", "I'd like a pizza please", True),
+    ("order_intention", "Can I get a pizza delivered?", True),
+    ("order_intention", "hello", False),
+    ("order_intention", "No thanks", False),
+    ("order_intention", "I don't want to order anything", None),
+    ("order_intention", "Where is my order?", None),
+    ("order_intention", "Cancel my order", None),
+    ("order_intention", "What is the status of my order?", None),
+    #description_intention, asked while the dialogue waits for the pizza name
+    ("description_intention", "What is a Hawaiian?", True),
+    ("description_intention", "Tell me more about the Margherita", True),
+    ("description_intention", "Which toppings are on the Pepperoni?", True),
+    ("description_intention", "Margherita", False),
+    ("description_intention", "Quattro Formaggi please", False),
+    ("description_intention", "Can I get a Margherita?", False),
+    ("description_intention", "Could I have a Pepperoni please?", False),
+    ("description_intention", "May I have a Hawaiian?", False),
+    ("description_intention", "I'll take the Hawaiian", False),
+    ("description_intention", "Is the Pepperoni spicy?", None),
+]
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return IntentClassifier(log_path=None)
+
+
+@pytest.mark.parametrize("check, text, expected", CASES)
+def test_short_circuit(classifier, check, text, expected):
+    assert classifier.short_circuit(text, check) is expected
@@ -0,0 +1,65 @@
+"""
+The LLM response cache in front of a scripted client.
+"""
+import asyncio
+import threading
+
+from llm_cache import ResponseCache, complete, acomplete
+from conftest import FakeLLM, FakeAsyncLLM
+
+MESSAGES = [{"role": "system", "content": "Answer in JSON."}, {"role": "user", "content": "I want a pizza!"}]
+JSON_MODE = {"type": "json_object"}
+
+
+def test_repeated_call_is_answered_from_the_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    llm = FakeLLM(lambda messages: {"intention": True})
+    first = complete(llm, MESSAGES, cache=cache, response_format=JSON_MODE)
+    assert complete(llm, MESSAGES, cache=cache, response_format=JSON_MODE) == first
+    assert len(llm.calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_options_are_part_of_the_key(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    answers = iter(['{"intention": true}', "Sure, one pizza.", '{"intention": false}'])
+    llm = FakeLLM(lambda messages: next(answers))
+
+    assert complete(llm, MESSAGES, cache=cache, response_format=JSON_MODE) == '{"intention": true}'
+    #a free-text call must not replay the JSON mode answer
+    assert complete(llm, MESSAGES, cache=cache) == "Sure, one pizza."
+    assert complete(llm, MESSAGES, cache=cache, temperature=0.0, response_format=JSON_MODE) == '{"intention": false}'
+    assert cache.stats()["misses"] == 3
+
+
+def test_async_complete_shares_the_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    complete(FakeLLM(lambda messages: "cached"), MESSAGES, cache=cache)
+    llm = FakeAsyncLLM(lambda messages: "not cached")
+    assert asyncio.run(acomplete(llm, MESSAGES, cache=cache)) == "cached"
+    assert not llm.calls
+
+
+def last_access(cache):
+    return cache._conn.execute("SELECT last_access FROM responses").fetchone()[0]
+
+
+def test_hits_are_written_in_batches(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    cache.put("model", MESSAGES, "cached")
+    stored = last_access(cache)
+
+    assert cache.get("model", MESSAGES) == "cached"
+    assert last_access(cache) == stored
+    cache.flush()
+    assert last_access(cache) > stored
+
+
+def test_async_lookups_run_off_the_event_loop(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    threads = []
+    get = cache.get
+    monkeypatch.setattr(cache, "get", lambda *args: threads.append(threading.current_thread()) or get(*args))
+
+    asyncio.run(acomplete(FakeAsyncLLM(lambda messages: "answer"), MESSAGES, cache=cache))
+    assert threads and threading.main_thread() not in threads
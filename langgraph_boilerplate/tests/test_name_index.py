@@ -0,0 +1,44 @@
+"""
+Lookups of the in-memory name index.
+"""
+import name_index
+from name_index import NameIndex
+
+MENU = ["Margherita", "Pepperoni", "Hawaiian", "Quattro Formaggi"]
+
+
+def names_of(item):
+    return [item, item + " pizza"]
+
+
+def test_exact_alias_and_fuzzy_matches():
+    index = NameIndex(MENU, names_of)
+    assert index.match("margherita") == ("Margherita", 100, "exact")
+    assert index.match("Hawaiian Pizza") == ("Hawaiian", 100, "alias")
+    item, score, kind = index.match("peperoni")
+    assert (item, kind) == ("Pepperoni", "fuzzy") and score > 80
+    assert index.match("") is None
+
+
+def test_common_buckets_are_not_counted(monkeypatch):
+    updates = []
+
+    class CountingCounter(name_index.Counter):
+        def __setitem__(self, key, value):
+            updates.append(key)
+            super().__setitem__(key, value)
+
+    monkeypatch.setattr(name_index, "Counter", CountingCounter)
+    items = [f"Special {i}" for i in range(200)] + ["Margherita"]
+    index = NameIndex(items, names_of)
+
+    item, _, kind = index.match("margherta pizza")
+    assert (item, kind) == ("Margherita", "fuzzy")
+    #"pizza" and its n-grams are shared by all 402 names and are not counted
+    assert len(updates) < 50
+
+
+def test_query_of_common_tokens_only_still_matches():
+    index = NameIndex([f"Special {i}" for i in range(200)], names_of, max_bucket_size=16)
+    item, _, _ = index.match("speciall")
+    assert item.startswith("Special")
@@ -0,0 +1,157 @@
+"""
+The Pizza API clients against `common/main.py`, behind a proxy that fails requests on demand.
+"""
+import time
+import uuid
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from pizza_api import PizzaApiClient, AsyncPizzaApiClient
+
+ADDRESS = ("Leipzig", "Hauptstraße", "5")
+
+
+class FlakyProxy(ThreadingHTTPServer):
+    """
+    Forwards to the Pizza API. `fail(method, path, *faults)` queues the faults of the next requests:
+    "unavailable" answers 503 without forwarding, "lost" forwards and then answers 503 (the response
+    got lost), "slow" forwards after a delay.
+    """
+    daemon_threads = True
+
+    def __init__(self, target: str):
+        super().__init__(("127.0.0.1", 0), ProxyHandler)
+        self.target = target
+        self.faults = {}
+        self.requests = []  # (method, path, Idempotency-Key)
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def fail(self, method: str, path: str, *faults):
+        self.faults.setdefault((method, path), []).extend(faults)
+
+    def seen(self, method: str, path: str) -> list:
+        return [key for m, p, key in self.requests if (m, p) == (method, path)]
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+
+    def forward(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        path = self.path.split("?")[0]
+        with self.server.lock:
+            self.server.requests.append((self.command, path, self.headers.get("Idempotency-Key")))
+            faults = self.server.faults.get((self.command, path))
+            fault = faults.pop(0) if faults else None
+
+        if fault == "unavailable":
+            return self.reply(503, b'{"detail": "unavailable"}')
+        if fault == "slow":
+            time.sleep(0.3)
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in ("host", "content-length")}
+        response = requests.request(self.command, self.server.target + self.path, data=body, headers=headers)
+        if fault == "lost":
+            return self.reply(503, b'{"detail": "lost"}')
+        self.reply(response.status_code, response.content)
+
+    def reply(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = forward
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def proxy(pizza_api_url):
+    server = FlakyProxy(pizza_api_url)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def api(proxy):
+    client = PizzaApiClient(base_url=proxy.url, backoff_factor=0.01)
+    yield client
+    client.close()
+
+
+def test_get_is_retried_on_unavailable(api, proxy):
+    proxy.fail("GET", "/pizza", "unavailable", "unavailable")
+    response = api.list_pizzas()
+    assert response.status_code == 200
+    assert any(pizza["name"] == "Margherita" for pizza in response.json())
+    assert len(proxy.seen("GET", "/pizza")) == 3
+
+
+def test_order_is_retried_with_the_same_key(api, proxy, pizza_api_url):
+    key = str(uuid.uuid4())
+    proxy.fail("POST", "/order", "lost", "unavailable")
+    order = api.create_order(1, *ADDRESS, idempotency_key=key)
+
+    assert order is not None
+    assert proxy.seen("POST", "/order") == [key] * 3
+    #the lost first attempt created the order, the retries got it back instead of a second one
+    replay = requests.post(pizza_api_url + "/order", headers={"Idempotency-Key": key},
+                           json={"pizza_id": 1, "city": ADDRESS[0], "street": ADDRESS[1], "house_number": ADDRESS[2]})
+    assert replay.json()["order_id"] == order["order_id"]
+    assert api.get_order(order["order_id"])["pizza_id"] == 1
+
+
+def test_order_without_key_is_sent_once(api, proxy):
+    proxy.fail("POST", "/order", "lost")
+    assert api.create_order(1, *ADDRESS) is None
+    assert proxy.seen("POST", "/order") == [None]
+
+
+def test_key_reused_for_another_order_is_rejected(api, proxy):
+    key = str(uuid.uuid4())
+    first = api.create_order(1, *ADDRESS, idempotency_key=key)
+    assert api.create_order(1, *ADDRESS, idempotency_key=key)["order_id"] == first["order_id"]
+    #422, not retried
+    assert api.create_order(2, *ADDRESS, idempotency_key=key) is None
+    assert len(proxy.seen("POST", "/order")) == 3
+
+
+def test_concurrent_submissions_share_one_request(api, proxy):
+    key = str(uuid.uuid4())
+    proxy.fail("POST", "/order", "slow")
+    with ThreadPoolExecutor(4) as pool:
+        orders = list(pool.map(lambda _: api.create_order(1, *ADDRESS, idempotency_key=key), range(4)))
+
+    assert len({order["order_id"] for order in orders}) == 1
+    assert proxy.seen("POST", "/order") == [key]
+
+
+def test_async_order_is_retried_with_the_same_key(proxy):
+    key = str(uuid.uuid4())
+    proxy.fail("POST", "/order", "lost")
+
+    async def run():
+        client = AsyncPizzaApiClient(base_url=proxy.url, backoff_factor=0.01)
+        try:
+            orders = await asyncio.gather(*(client.create_order(1, *ADDRESS, idempotency_key=key) for _ in range(3)))
+            return orders, await client.get_order(orders[0]["order_id"])
+        finally:
+            await client.aclose()
+
+    orders, stored = asyncio.run(run())
+    assert len({order["order_id"] for order in orders}) == 1
+    assert stored["status"] == "received"
+    assert proxy.seen("POST", "/order") == [key] * 2
@@ -0,0 +1,37 @@
+"""
+The server endpoints without the lifespan (no SQLite checkpoints, no Wikidata refresh).
+"""
+import pytest
+from fastapi.testclient import TestClient
+from langgraph.checkpoint.memory import MemorySaver
+
+import pizzabot_server
+from checkpointing import TieredCheckpointSaver
+from pizza_api import get_api_client
+from prompt_builder import get_prompt_builder
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(pizzabot_server, "checkpointer", TieredCheckpointSaver(MemorySaver()))
+    return TestClient(pizzabot_server.app)
+
+
+def test_metrics_expose_prompt_sizes(client):
+    render = lambda pairs: [{"role": "user", "content": str(pairs)}]
+    get_prompt_builder().description_pairs("Margherita", [{"label": "Margherita", "description": "tomato sauce and cheese"}], render)
+
+    metrics = client.get("/metrics").json()
+    assert metrics["prompt"]["prompts"] == 1
+    assert metrics["prompt"]["candidates_kept"] == 1
+    assert set(metrics) >= {"checkpointer", "order_status", "llm_cache", "intent_rules", "response_decoder", "address_extractor", "address_validator"}
+
+
+def test_metrics_expose_pizza_api_latencies(client, pizza_api_url, monkeypatch):
+    monkeypatch.setenv("PIZZA_API_URL", pizza_api_url)
+    assert client.get("/metrics").json()["pizza_api"] == {}
+
+    get_api_client().list_pizzas()
+    latencies = client.get("/metrics").json()["pizza_api"]["sync"]
+    assert latencies["list_pizzas"]["count"] == 1
+    assert sum(latencies["list_pizzas"]["buckets"].values()) == 1
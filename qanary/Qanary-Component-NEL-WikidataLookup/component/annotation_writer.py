@@ -0,0 +1,127 @@
+"""
+Batched writes of Qanary annotations.
+
+The annotations of one request are collected, de-duplicated and written with a single SPARQL
+`INSERT DATA` (or one per ANNOTATION_CHUNK_SIZE annotations) instead of one update per annotation.
+The annotation IRIs and timestamps are generated here, so the update does not need a WHERE clause.
+
+The same module is used by the NEL and the QueryBuilder component, keep both copies in sync.
+"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+
+from qanary_helpers.qanary_queries import insert_into_triplestore
+
+ANNOTATION_CHUNK_SIZE = int(os.environ.get('ANNOTATION_CHUNK_SIZE', 100))
+
+PREFIXES = """
+PREFIX qa: <http://www.wdaqua.eu/qa#>
+PREFIX oa: <http://www.w3.org/ns/openannotation/core/>
+PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+"""
+
+metrics_lock = threading.Lock()
+metrics = {"requests": 0, "annotations": 0, "duplicates": 0, "updates": 0, "failures": 0, "write_ms": 0.0}
+
+
+def iri(value: str) -> str:
+    return f"<{value}>"
+
+
+def literal(value: str) -> str:
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r")
+    return f'"{escaped}"'
+
+
+class AnnotationWriter:
+    """
+    Collects the annotations of one request for `graph`, `flush` writes them
+    """
+
+    def __init__(self, triplestore_endpoint: str, graph: str, annotated_by: str,
+                 chunk_size: int = ANNOTATION_CHUNK_SIZE):
+        self.triplestore_endpoint = triplestore_endpoint
+        self.graph = graph
+        self.annotated_by = annotated_by
+        self.chunk_size = chunk_size
+        self.annotations = {}  # (type, body, target) -> (annotation IRI, score)
+
+    def add(self, annotation_type: str, body: str, target: str, score: float = 1.0,
+            prefix: str = "urn:qanary:annotation:") -> bool:
+        """
+        `body` and `target` are serialized RDF terms, e.g. `iri(entity)` or `literal(text)`.
+        Returns False for a duplicate, the higher score of both is kept.
+        """
+        key = (annotation_type, body, target)
+        if key in self.annotations:
+            annotation, previous = self.annotations[key]
+            self.annotations[key] = (annotation, max(previous, score))
+            with metrics_lock:
+                metrics["duplicates"] += 1
+            return False
+        self.annotations[key] = (iri(prefix + str(uuid.uuid4())), score)
+        return True
+
+    def triples(self, key, annotation: str, score: float, annotated_at: str) -> str:
+        annotation_type, body, target = key
+        return (
+            f"{annotation} rdf:type {annotation_type} ;\n"
+            f"    oa:hasBody {body} ;\n"
+            f"    oa:hasTarget {target} ;\n"
+            f"    qa:score \"{score}\"^^xsd:float ;\n"
+            f"    oa:annotatedAt \"{annotated_at}\"^^xsd:dateTime ;\n"
+            f"    oa:annotatedBy {iri(self.annotated_by)} ."
+        )
+
+    def updates(self) -> list:
+        annotated_at = datetime.now(timezone.utc).isoformat()
+        items = list(self.annotations.items())
+        updates = []
+        for start in range(0, len(items), self.chunk_size):
+            triples = "\n".join(self.triples(key, annotation, score, annotated_at)
+                                for key, (annotation, score) in items[start:start + self.chunk_size])
+            updates.append(f"{PREFIXES}\nINSERT DATA {{\n  GRAPH <{self.graph}> {{\n{triples}\n  }}\n}}")
+        return updates
+
+    def flush(self) -> int:
+        """
+        Writes the collected annotations and returns their number
+        """
+        updates = self.updates()
+        count = len(self.annotations)
+        started = time.perf_counter()
+        try:
+            for update in updates:
+                insert_into_triplestore(self.triplestore_endpoint, update)
+        except Exception:
+            with metrics_lock:
+                metrics["failures"] += 1
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with metrics_lock:
+                metrics["requests"] += 1
+                metrics["updates"] += len(updates)
+                metrics["write_ms"] += elapsed_ms
+        with metrics_lock:
+            metrics["annotations"] += count
+        self.annotations = {}
+        logging.info(f"Wrote {count} annotations with {len(updates)} update(s) in {elapsed_ms:.1f} ms")
+        return count
+
+    async def aflush(self) -> int:
+        # insert_into_triplestore blocks, keep it off the event loop
+        return await asyncio.to_thread(self.flush)
+
+
+def get_metrics() -> dict:
+    with metrics_lock:
+        result = dict(metrics)
+    result["avg_write_ms"] = result["write_ms"] / result["requests"] if result["requests"] else 0.0
+    return result
@@ -0,0 +1,105 @@
+"""
+Selection of the n-grams worth an entity search and ranking of the found entities.
+
+`candidate_spans` keeps only n-grams that may name an entity: they must not start or end with a
+stopword, and must contain a capitalized word (not counting the first word of the question), a number
+or a noun. `NGramSearch` searches the longest n-grams first and skips shorter n-grams inside a span
+that already matched ("Lord of the Rings" -> not "the Rings"). `rank_entities` scores every entity by
+the similarity of its label to the n-gram and by its position in the search result (popularity) and
+keeps the best `top_k`.
+"""
+import re
+from difflib import SequenceMatcher
+
+LABEL_WEIGHT = 0.7  # the rest of the score is the popularity
+NOUN_TAGS = ("NN", "CD", "FW")  # prefixes of the Penn Treebank tags, NN covers NNP/NNS
+
+
+def tokenize(text: str) -> list:
+    return re.findall(r"[^\W_]+", text)
+
+
+def is_informative(token: str, index: int, tag: str, has_case: bool) -> bool:
+    if token.isdigit():
+        return True
+    if tag and tag.startswith(NOUN_TAGS):
+        return True
+    if has_case:
+        return index > 0 and token[0].isupper()
+    # all lowercase question without POS tags: capitalization tells nothing
+    return tag is None
+
+
+def candidate_spans(text: str, min_n: int, max_n: int, stop_words: set, pos_tag=None) -> list:
+    """
+    Returns `(start, end, ngram)` token spans, longest first
+    """
+    tokens = tokenize(text)
+    tags = [tag for _, tag in pos_tag(tokens)] if pos_tag and tokens else [None] * len(tokens)
+    # sentence case questions: only capitals after the first word hint at names
+    has_case = any(token[0].isupper() for token in tokens[1:])
+    stop = [token.lower() in stop_words for token in tokens]
+    informative = [not stop[i] and is_informative(token, i, tags[i], has_case) for i, token in enumerate(tokens)]
+
+    spans = []
+    for n in range(max_n, min_n - 1, -1):
+        for start in range(len(tokens) - n + 1):
+            end = start + n
+            if stop[start] or stop[end - 1] or not any(informative[start:end]):
+                continue
+            spans.append((start, end, " ".join(tokens[start:end])))
+    return spans
+
+
+def is_subsumed(span: tuple, matched: list) -> bool:
+    return any(start <= span[0] and span[1] <= end for start, end in matched)
+
+
+def label_similarity(ngram: str, label: str) -> float:
+    return SequenceMatcher(None, ngram.casefold(), (label or "").casefold()).ratio()
+
+
+def popularity(rank: int) -> float:
+    # wbsearchentities orders equally good matches by the number of sitelinks
+    return 1.0 / (1 + rank)
+
+
+def score(ngram: str, entity: dict) -> float:
+    similarity = max(label_similarity(ngram, entity.get("label")), label_similarity(ngram, entity.get("match")))
+    return round(LABEL_WEIGHT * similarity + (1 - LABEL_WEIGHT) * popularity(entity["rank"]), 4)
+
+
+def rank_entities(results: list, top_k: int, min_score: float = 0.0) -> list:
+    """
+    `results` are `(ngram, entities)` pairs, returns the `top_k` best `(uri, score)`, one per entity
+    """
+    best = {}
+    for ngram, entities in results:
+        for entity in entities:
+            entity_score = score(ngram, entity)
+            if entity_score >= min_score and entity_score > best.get(entity["uri"], -1.0):
+                best[entity["uri"]] = entity_score
+    return sorted(best.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+class NGramSearch:
+    """
+    Searches the candidate spans by length, longest first, each length concurrently via `search_all`
+    """
+
+    def __init__(self, search_all):
+        self.search_all = search_all  # async (list of ngrams) -> list of entity lists, in order
+
+    async def run(self, spans: list) -> list:
+        matched = []  # (start, end) of spans with entities
+        results = []
+        for length in sorted({end - start for start, end, _ in spans}, reverse=True):
+            batch = [span for span in spans if span[1] - span[0] == length and not is_subsumed(span, matched)]
+            if not batch:
+                continue
+            found = await self.search_all([ngram for _, _, ngram in batch])
+            for (start, end, ngram), entities in zip(batch, found):
+                if entities:
+                    matched.append((start, end))
+                    results.append((ngram, entities))
+        return results
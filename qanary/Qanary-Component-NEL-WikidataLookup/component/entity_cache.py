@@ -0,0 +1,148 @@
+"""
+Cache of the Wikidata entity searches (wbsearchentities).
+
+Results are keyed by (normalized n-gram, lang, limit) and kept in two tiers: an in-process LRU and a
+SQLite file with a TTL that all workers (and restarts) share. Empty results are cached as well, with a
+shorter TTL, as most n-grams of a question do not name an entity. Failed searches are not cached.
+`aget`/`aput` run the SQLite work in a worker thread, so it never blocks the event loop.
+"""
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+ENTITY_CACHE_SIZE = int(os.environ.get('ENTITY_CACHE_SIZE', 4096))
+ENTITY_CACHE_PATH = os.environ.get('ENTITY_CACHE_PATH', 'entity_cache.sqlite')
+ENTITY_CACHE_TTL = float(os.environ.get('ENTITY_CACHE_TTL', 7 * 24 * 3600))
+ENTITY_CACHE_NEGATIVE_TTL = float(os.environ.get('ENTITY_CACHE_NEGATIVE_TTL', 24 * 3600))
+
+
+def normalize(ngram: str) -> str:
+    return " ".join(ngram.casefold().split())
+
+
+class EntityCache:
+
+    def __init__(self, path: str = ENTITY_CACHE_PATH, size: int = ENTITY_CACHE_SIZE,
+                 ttl: float = ENTITY_CACHE_TTL, negative_ttl: float = ENTITY_CACHE_NEGATIVE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory = OrderedDict()  # key -> (expires, entities)
+        self.lock = threading.Lock()
+        self.metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "negative_hits": 0, "stores": 0}
+        self.conn = None
+        if path:
+            try:
+                self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+                self.conn.execute("PRAGMA busy_timeout = 5000")
+                self.conn.execute("PRAGMA journal_mode = WAL")
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS entity_search "
+                    "(key TEXT PRIMARY KEY, entities TEXT NOT NULL, expires REAL NOT NULL)"
+                )
+            except sqlite3.Error as e:
+                logging.warning(f"Entity cache file {path} not usable, caching in memory only: {e}")
+                self.conn = None
+
+    @staticmethod
+    def key(ngram: str, lang: str, limit: int) -> str:
+        # v2: entity records (uri, label, match, rank) instead of plain URIs
+        return f"v2|{lang}|{limit}|{normalize(ngram)}"
+
+    async def aget(self, ngram: str, lang: str, limit: int):
+        """
+        Returns the cached entity records (possibly empty) or None on a miss. Memory hits are answered on
+        the event loop, the file lookup runs in a worker thread.
+        """
+        key = self.key(ngram, lang, limit)
+        entities = self.get_memory(key)
+        if entities is None:
+            entities = await asyncio.to_thread(self.get_disk, key)
+        return entities
+
+    def get_memory(self, key: str):
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is None or entry[0] <= time.time():
+                return None
+            self.memory.move_to_end(key)
+            self.count("memory_hits", entry[1])
+            return entry[1]
+
+    def get_disk(self, key: str):
+        with self.lock:
+            row = None
+            if self.conn is not None:
+                try:
+                    row = self.conn.execute("SELECT entities, expires FROM entity_search WHERE key = ? AND expires > ?",
+                                            (key, time.time())).fetchone()
+                except sqlite3.Error as e:
+                    logging.warning(f"Entity cache lookup failed: {e}")
+            if row is None:
+                self.metrics["misses"] += 1
+                return None
+            entities = json.loads(row[0])
+            self.remember(key, row[1], entities)
+            self.count("disk_hits", entities)
+            return entities
+
+    async def aput(self, ngram: str, lang: str, limit: int, entities: list):
+        """
+        Stores the entity records, the file write runs in a worker thread
+        """
+        key, expires = self.put_memory(ngram, lang, limit, entities)
+        if self.conn is not None:
+            await asyncio.to_thread(self.put_disk, key, expires, entities)
+
+    def put_memory(self, ngram: str, lang: str, limit: int, entities: list):
+        key = self.key(ngram, lang, limit)
+        expires = time.time() + (self.ttl if entities else self.negative_ttl)
+        with self.lock:
+            self.remember(key, expires, entities)
+            self.metrics["stores"] += 1
+        return key, expires
+
+    def put_disk(self, key: str, expires: float, entities: list):
+        if self.conn is None:
+            return
+        with self.lock:
+            try:
+                self.conn.execute("INSERT OR REPLACE INTO entity_search (key, entities, expires) VALUES (?, ?, ?)",
+                                  (key, json.dumps(entities), expires))
+            except sqlite3.Error as e:
+                logging.warning(f"Entity cache write failed: {e}")
+
+    def remember(self, key: str, expires: float, entities: list):
+        self.memory[key] = (expires, entities)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+
+    def count(self, tier: str, entities: list):
+        self.metrics[tier] += 1
+        if not entities:
+            self.metrics["negative_hits"] += 1
+
+    def purge(self):
+        """
+        Deletes expired entries from the cache file
+        """
+        if self.conn is not None:
+            with self.lock:
+                self.conn.execute("DELETE FROM entity_search WHERE expires <= ?", (time.time(),))
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            result = dict(self.metrics)
+            result["cached_in_memory"] = len(self.memory)
+        lookups = result["memory_hits"] + result["disk_hits"] + result["misses"]
+        result["hit_ratio"] = (result["memory_hits"] + result["disk_hits"]) / lookups if lookups else 0.0
+        return result
+
+
+entity_cache = EntityCache()
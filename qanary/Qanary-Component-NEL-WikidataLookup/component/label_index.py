@@ -0,0 +1,244 @@
+"""
+Offline label -> QID index for local entity linking.
+
+The index is built once from a TSV file (`QID<TAB>label[<TAB>rank]`, lower rank = more popular) or
+from the N-Triples labels dump of Wikidata (`<.../entity/Q64> <...rdf-schema#label> "Berlin"@en .`,
+optionally gzipped), and stored as a sorted table that is memory-mapped at runtime: lookups are a
+binary search over the labels without loading the file. With `marisa-trie` installed the index can be
+stored as a trie instead (`--format marisa`). Both support exact and prefix lookups. An index holds the
+labels of one language, `lang` of the opened index tells which.
+
+    python -m component.label_index build labels.tsv labels.idx [--lang en] [--format table|marisa]
+    python -m component.label_index lookup labels.idx "lord of the rings" [--prefix]
+"""
+import re
+import sys
+import gzip
+import mmap
+import struct
+import argparse
+from collections import defaultdict
+
+MAGIC = b"LBLIDX02"
+HEADER = struct.Struct("<8sQ16s")  # magic, number of labels, language of the labels
+OFFSET = struct.Struct("<Q")
+
+ENTITY_PREFIX = "http://www.wikidata.org/entity/"
+# key of the language in a marisa index, labels don't start with a control character
+# (NUL is the value separator of marisa_trie.BytesTrie)
+MARISA_LANG_KEY = "\x01lang"
+NTRIPLE_LABEL = re.compile(
+    r'^<http://www\.wikidata\.org/entity/(Q\d+)> <http://www\.w3\.org/2000/01/rdf-schema#label> "((?:\\.|[^"\\])*)"@([\w-]+) \.'
+)
+
+
+def normalize(label: str) -> str:
+    return " ".join(label.casefold().split())
+
+
+NTRIPLE_ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f", '"': '"', "'": "'", "\\": "\\"}
+
+
+def unescape(literal: str) -> str:
+    return re.sub(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)',
+                  lambda m: chr(int(m.group(1)[1:], 16)) if len(m.group(1)) > 1 else NTRIPLE_ESCAPES.get(m.group(1), m.group(1)),
+                  literal)
+
+
+def read_labels(path: str, lang: str = "en"):
+    """
+    Yields `(qid, label, rank)` of a TSV or N-Triples file
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("<"):
+                match = NTRIPLE_LABEL.match(line)
+                if match and match.group(3) == lang:
+                    label = unescape(match.group(2))
+                    # the dump is ordered by QID, lower QIDs are the better known entities
+                    yield match.group(1), label, int(match.group(1)[1:])
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 2 or not re.fullmatch(r"Q\d+", fields[0]):
+                continue
+            rank = float(fields[2]) if len(fields) > 2 and fields[2] else int(fields[0][1:])
+            yield fields[0], fields[1], rank
+
+
+def group_labels(labels) -> dict:
+    """
+    normalized label -> (label, QIDs ordered by rank)
+    """
+    grouped = defaultdict(dict)
+    originals = {}
+    for qid, label, rank in labels:
+        key = normalize(label)
+        if not key:
+            continue
+        originals.setdefault(key, label)
+        grouped[key][qid] = min(rank, grouped[key].get(qid, rank))
+    return {key: (originals[key], sorted(qids, key=qids.get)) for key, qids in grouped.items()}
+
+
+def record(label: str, qids: list) -> str:
+    return label.replace("\t", " ") + "\t" + ",".join(qids)
+
+
+def build_table(grouped: dict, output: str, lang: str = "en"):
+    keys = sorted(grouped, key=lambda key: key.encode("utf-8"))
+    records = [(key + "\t" + record(*grouped[key])).encode("utf-8") for key in keys]
+    with open(output, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(records), lang.encode("ascii")))
+        offset = 0
+        for data in records:
+            f.write(OFFSET.pack(offset))
+            offset += len(data)
+        f.write(OFFSET.pack(offset))
+        for data in records:
+            f.write(data)
+
+
+def build_marisa(grouped: dict, output: str, lang: str = "en"):
+    import marisa_trie
+    items = [(key, record(*value).encode("utf-8")) for key, value in grouped.items()]
+    trie = marisa_trie.BytesTrie(items + [(MARISA_LANG_KEY, lang.encode("ascii"))])
+    trie.save(output)
+
+
+def parse_record(data: bytes, limit: int) -> list:
+    label, qids = data.decode("utf-8").split("\t")
+    return [
+        {"uri": ENTITY_PREFIX + qid, "label": label, "match": label, "rank": rank}
+        for rank, qid in enumerate(qids.split(",")[:limit])
+    ]
+
+
+class SortedTableIndex:
+    """
+    Memory-mapped sorted table, binary search over the normalized labels
+    """
+
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size, lang = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a label index")
+        self.lang = lang.rstrip(b"\0").decode("ascii")
+        self.start = HEADER.size + OFFSET.size * (self.size + 1)
+
+    def entry(self, i: int) -> bytes:
+        begin = OFFSET.unpack_from(self.data, HEADER.size + OFFSET.size * i)[0]
+        end = OFFSET.unpack_from(self.data, HEADER.size + OFFSET.size * (i + 1))[0]
+        return self.data[self.start + begin:self.start + end]
+
+    def key(self, i: int) -> bytes:
+        entry = self.entry(i)
+        return entry[:entry.index(b"\t")]
+
+    def bisect(self, key: bytes) -> int:
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def lookup(self, label: str, limit: int = 3) -> list:
+        key = normalize(label).encode("utf-8")
+        i = self.bisect(key)
+        if i < self.size and self.key(i) == key:
+            entry = self.entry(i)
+            return parse_record(entry[len(key) + 1:], limit)
+        return []
+
+    def prefix(self, prefix: str, limit: int = 10) -> list:
+        """
+        Labels starting with `prefix`, in label order
+        """
+        key = normalize(prefix).encode("utf-8")
+        labels = []
+        i = self.bisect(key)
+        while i < self.size and len(labels) < limit:
+            entry = self.entry(i)
+            if not entry.startswith(key):
+                break
+            labels.append(entry.split(b"\t", 2)[1].decode("utf-8"))
+            i += 1
+        return labels
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+class MarisaIndex:
+
+    def __init__(self, path: str):
+        import marisa_trie
+        self.trie = marisa_trie.BytesTrie()
+        self.trie.mmap(path)
+        lang = self.trie.get(MARISA_LANG_KEY)
+        if not lang:
+            raise ValueError(f"{path} is not a label index")
+        self.lang = lang[0].decode("ascii")
+
+    def lookup(self, label: str, limit: int = 3) -> list:
+        values = self.trie.get(normalize(label))
+        return parse_record(values[0], limit) if values else []
+
+    def prefix(self, prefix: str, limit: int = 10) -> list:
+        # trie order, a short prefix may match millions of labels
+        labels = []
+        for key, value in self.trie.iteritems(normalize(prefix)):
+            if len(labels) == limit:
+                break
+            if key == MARISA_LANG_KEY:
+                continue
+            labels.append(value.decode("utf-8").split("\t")[0])
+        return labels
+
+    def close(self):
+        pass
+
+
+def open_index(path: str):
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+    if magic.startswith(MAGIC[:6]) and magic != MAGIC:
+        raise ValueError(f"{path} was built by an older version, rebuild it")
+    return SortedTableIndex(path) if magic == MAGIC else MarisaIndex(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline Wikidata label index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build the index from a TSV or N-Triples labels file")
+    build.add_argument("source")
+    build.add_argument("output")
+    build.add_argument("--lang", default="en")
+    build.add_argument("--format", choices=("table", "marisa"), default="table")
+    lookup = commands.add_parser("lookup", help="look up a label")
+    lookup.add_argument("index")
+    lookup.add_argument("label")
+    lookup.add_argument("--prefix", action="store_true", help="list the labels starting with the label")
+    lookup.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        grouped = group_labels(read_labels(args.source, args.lang))
+        (build_marisa if args.format == "marisa" else build_table)(grouped, args.output, args.lang)
+        print(f"Indexed {len(grouped)} {args.lang} labels into {args.output}")
+    else:
+        index = open_index(args.index)
+        results = index.prefix(args.label, args.limit) if args.prefix else index.lookup(args.label, args.limit)
+        for result in results:
+            print(result)
+        index.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,33 @@
 import os
-import re
+import asyncio
 import logging
-import requests
+
+import httpx
 
 import nltk
 from nltk.corpus import stopwords
+from packaging.version import Version
 
 from fastapi import APIRouter, Request
 from fastapi.responses import JSONResponse, PlainTextResponse
 
-from qanary_helpers.qanary_queries import insert_into_triplestore, get_text_question_in_graph
+from qanary_helpers.qanary_queries import get_text_question_in_graph
+
+from component.annotation_writer import AnnotationWriter, iri, get_metrics
+from component.entity_cache import entity_cache
+from component.candidate_selection import candidate_spans, rank_entities, NGramSearch
+from component.label_index import open_index
 
 
 nltk.download('stopwords')
+try:
+    nltk.download('averaged_perceptron_tagger_eng' if Version(nltk.__version__) >= Version('3.9') else 'averaged_perceptron_tagger')
+    nltk.pos_tag(["test"])
+    pos_tag = nltk.pos_tag
+except (LookupError, ValueError, OSError) as e:
+    logging.warning(f"POS tagger not available, selecting n-grams by capitalization only: {e}")
+    pos_tag = None
+stop_words = set(stopwords.words('english'))
 logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
 
 if not os.getenv("PRODUCTION"):
@@ -30,47 +45,162 @@ if os.environ.get('MAX_NGRAM'):
 else:
     MAX_NGRAM = 4
 
+# at most this many Wikidata searches of this process run at the same time
+SEARCH_CONCURRENCY = int(os.environ.get('SEARCH_CONCURRENCY', 8))
+# deadline of a single search and of all searches of one question (seconds)
+SEARCH_TIMEOUT = float(os.environ.get('SEARCH_TIMEOUT', 5))
+SEARCH_DEADLINE = float(os.environ.get('SEARCH_DEADLINE', 10))
+# entities annotated per question, and the minimum score of an annotated entity
+TOP_K_ENTITIES = int(os.environ.get('TOP_K_ENTITIES', 5))
+MIN_ENTITY_SCORE = float(os.environ.get('MIN_ENTITY_SCORE', 0.5))
+
+# online: Wikidata search API, offline: local label index only, hybrid: label index, API for the misses
+ENTITY_LINKING_MODE = os.environ.get('ENTITY_LINKING_MODE', 'online')
+LABEL_INDEX_PATH = os.environ.get('LABEL_INDEX_PATH', 'labels.idx')
+
+WDT_SEARCH_URL = "https://www.wikidata.org/w/api.php"
+USER_AGENT = "Qanary-Component-NEL-WikidataLookup/0.1 (https://github.com/WSE-research/langgraph-examples)"
+
 headers = {'Content-Type': 'application/json'}
 
+# shared connection pool, created on first use within the event loop of the server
+http_client = None
+search_semaphore = None
+
+label_index = None
+if ENTITY_LINKING_MODE in ("offline", "hybrid"):
+    # built with `python -m component.label_index build <labels.tsv> <LABEL_INDEX_PATH> --lang <lang>`
+    label_index = open_index(LABEL_INDEX_PATH)
+    logging.info(f"Linking {label_index.lang} questions with the label index {LABEL_INDEX_PATH}")
+elif ENTITY_LINKING_MODE != "online":
+    raise ValueError(f"Unknown ENTITY_LINKING_MODE: {ENTITY_LINKING_MODE}")
+
 router = APIRouter(
     tags=[SERVICE_NAME_COMPONENT],
     responses={404: {"description": "Not found"}},
 )
 
 
-def search_entity(query: str, lang: str = "en", search_limit: int = 3):
-    wdt_search_url = "https://www.wikidata.org/w/api.php?action=wbsearchentities&search={search}&format=json&language={lang}&uselang={lang}&type=item&limit={search_limit}"
+def search_params(query: str, lang: str, search_limit: int) -> dict:
+    return {
+        "action": "wbsearchentities",
+        "search": query,
+        "format": "json",
+        "language": lang,
+        "uselang": lang,
+        "type": "item",
+        "limit": search_limit,
+    }
+
+
+def entity_records(data: dict) -> list:
+    """
+    URI, label, matched text (label or alias) and rank of every found entity
+    """
+    if "search" not in data:
+        # error response (e.g. rate limited), must not be cached as "no entity"
+        raise ValueError(data.get("error", data))
+    return [
+        {
+            "uri": f"http://www.wikidata.org/entity/{entity['id']}",
+            "label": entity.get("label"),
+            "match": entity.get("match", {}).get("text"),
+            "rank": rank,
+        }
+        for rank, entity in enumerate(data["search"])
+    ]
+
+
+def search_local(query: str, lang: str, search_limit: int):
+    """
+    Entities of the label index, None if the API has to be asked (e.g. the index has another language)
+    """
+    if label_index is None:
+        return None
+    if lang != label_index.lang:
+        # the offline mode can't link questions of other languages
+        return [] if ENTITY_LINKING_MODE == "offline" else None
+    entities = label_index.lookup(query, search_limit)
+    if entities or ENTITY_LINKING_MODE == "offline":
+        return entities
+    return None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global http_client, search_semaphore
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            timeout=httpx.Timeout(SEARCH_TIMEOUT),
+            limits=httpx.Limits(max_connections=SEARCH_CONCURRENCY, max_keepalive_connections=SEARCH_CONCURRENCY),
+        )
+        search_semaphore = asyncio.Semaphore(SEARCH_CONCURRENCY)
+    return http_client
+
+
+async def asearch_entity(query: str, lang: str = "en", search_limit: int = 3):
+    local = search_local(query, lang, search_limit)
+    if local is not None:
+        return local
+    cached = await entity_cache.aget(query, lang, search_limit)
+    if cached is not None:
+        return cached
+    client = get_http_client()
     try:
-        response = requests.get(wdt_search_url.format(
-            search=query, lang=lang, search_limit=search_limit), timeout=20)
-        data = response.json()
-        ne_list = []
-        for entity in data["search"]:
-            wdt_id = entity["id"]
-            ne_list.append(f"http://www.wikidata.org/entity/{wdt_id}")
-
-        return ne_list
-    except Exception as e:
-        print(str(e))
+        async with search_semaphore:
+            response = await client.get(WDT_SEARCH_URL, params=search_params(query, lang, search_limit))
+        entities = entity_records(response.json())
+    except (httpx.HTTPError, ValueError) as e:
+        logging.warning(f"Wikidata search for '{query}' failed: {e}")
+        return []
+    await entity_cache.aput(query, lang, search_limit, entities)
+    return entities
+
+
+async def search_entities(ngrams: list, lang: str = "en", search_limit: int = 3, deadline: float = None):
+    """
+    Searches all n-grams concurrently, searches not finished by `deadline` (event loop time, default
+    SEARCH_DEADLINE from now) are dropped. Returns one entity list per n-gram.
+    """
+    if not ngrams:
         return []
+    loop = asyncio.get_running_loop()
+    timeout = max((deadline or loop.time() + SEARCH_DEADLINE) - loop.time(), 0)
+    tasks = [asyncio.ensure_future(asearch_entity(ngram, lang, search_limit)) for ngram in ngrams]
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        logging.warning(f"{len(pending)} of {len(tasks)} Wikidata searches missed the deadline")
+
+    return [task.result() if task in done else [] for task in tasks]
+
+
+async def link_entities(question_text: str, lang: str = "en"):
+    """
+    Returns the best `(uri, score)` pairs of the question
+    """
+    spans = candidate_spans(question_text, MIN_NGRAM, MAX_NGRAM, stop_words, pos_tag)
+    logging.info(f"Candidate ngrams: {[ngram for _, _, ngram in spans]}")
+
+    # one deadline for all rounds of the search
+    deadline = asyncio.get_running_loop().time() + SEARCH_DEADLINE
+    search = NGramSearch(lambda ngrams: search_entities(ngrams, lang, deadline=deadline))
+    results = await search.run(spans)
+    return rank_entities(results, TOP_K_ENTITIES, MIN_ENTITY_SCORE)
 
 
-def generate_ngrams(text, min_n, max_n):
-    stop_words = set(stopwords.words('english'))
+@router.on_event("startup")
+def purge_entity_cache():
+    entity_cache.purge()
 
-    def clean_text(text):
-        text = re.sub(r'[^a-zA-Z0-9\s]', '', text)
-        words = text.split()
-        words = [word for word in words if word.lower() not in stop_words]
-        return ' '.join(words)
 
-    text = clean_text(text)
-    words = text.split()
-    ngrams = []
-    for n in range(min_n, max_n + 1):
-        for i in range(len(words) - n + 1):
-            ngrams.append(' '.join(words[i:i+n]))
-    return ngrams
+@router.on_event("shutdown")
+async def close_http_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
 
 
 @router.post("/annotatequestion")
@@ -80,56 +210,32 @@ async def qanary_service(request: Request):
     triplestore_ingraph_uuid = request_json["values"]["urn:qanary#inGraph"]
 
     # get question text from triplestore
-    question_text = get_text_question_in_graph(
-        triplestore_endpoint_url, triplestore_ingraph_uuid)[0]['text']
-    question_uri = get_text_question_in_graph(
-        triplestore_endpoint=triplestore_endpoint_url, graph=triplestore_ingraph_uuid)[0]['uri']
+    question = get_text_question_in_graph(
+        triplestore_endpoint=triplestore_endpoint_url, graph=triplestore_ingraph_uuid)[0]
+    question_text = question['text']
+    question_uri = question['uri']
 
     logging.info(f"Querying Wikidata Lookup for question: {question_text}")
 
-    ngrams = generate_ngrams(question_text, MIN_NGRAM, MAX_NGRAM)
-
-    logging.info(f"Generated ngrams: {ngrams}")
-
-    entities = []
-    for ngram in ngrams:
-        entities.extend(search_entity(ngram))
+    entities = await link_entities(question_text)
 
     logging.info(f"Wikidata Lookup response: {entities}")
 
-    for entity in entities:
-        SPARQLquery = f"""
-                        PREFIX dbr: <http://dbpedia.org/resource/>
-                        PREFIX dbo: <http://dbpedia.org/ontology/>
-                        PREFIX qa: <http://www.wdaqua.eu/qa#>
-                        PREFIX oa: <http://www.w3.org/ns/openannotation/core/>
-                        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                        PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-                        INSERT {{
-                        GRAPH <{triplestore_ingraph_uuid}> {{
-                            ?newAnnotation rdf:type qa:AnnotationOfEntity ;
-                                oa:hasBody <{entity}> ;
-                                qa:score \"1.0\"^^xsd:float ;
-                                oa:annotatedAt ?time ;
-                                oa:annotatedBy <urn:qanary:{SERVICE_NAME_COMPONENT.replace(" ", "-")}> ;
-                                oa:hasTarget [ 
-                                    a    oa:SpecificResource ;
-                                    oa:hasSource <{question_uri}> ;
-                                ] .
-                            }}
-                        }}
-                        WHERE {{
-                            BIND (IRI(str(RAND())) AS ?newAnnotation) .
-                            BIND (now() as ?time) 
-                        }}
-                    """
-
-        insert_into_triplestore(triplestore_endpoint_url,
-                                SPARQLquery)  # inserting new data to the triplestore
+    writer = AnnotationWriter(triplestore_endpoint_url, triplestore_ingraph_uuid,
+                              f"urn:qanary:{SERVICE_NAME_COMPONENT.replace(' ', '-')}")
+    target = f"[ a oa:SpecificResource ; oa:hasSource {iri(question_uri)} ]"
+    for entity, score in entities:
+        writer.add("qa:AnnotationOfEntity", iri(entity), target, score, prefix="urn:qanary:annotation:entity:")
+    await writer.aflush()  # one update for all entities
 
     return JSONResponse(content=request_json)
 
 
+@router.get("/metrics")
+def metrics():
+    return JSONResponse(content={"annotation_writer": get_metrics(), "entity_cache": entity_cache.get_metrics()})
+
+
 @router.get("/health")
 def health():
     return PlainTextResponse(content="alive")
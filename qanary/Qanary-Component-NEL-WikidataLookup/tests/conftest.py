@@ -0,0 +1,7 @@
+"""
+Run with `python -m pytest tests` from the component directory.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,40 @@
+"""
+Entity cache tiers, with the SQLite work off the event loop.
+"""
+import asyncio
+import threading
+
+from component.entity_cache import EntityCache
+
+ENTITIES = [{"uri": "http://www.wikidata.org/entity/Q64", "label": "Berlin", "match": "Berlin", "rank": 0}]
+
+
+def test_file_tier_is_shared(tmp_path):
+    path = str(tmp_path / "entity_cache.sqlite")
+
+    async def run():
+        await EntityCache(path=path).aput("Berlin", "en", 3, ENTITIES)
+        cache = EntityCache(path=path)
+        return cache, await cache.aget(" berlin", "en", 3), await cache.aget("berlin", "en", 3)
+
+    cache, from_disk, from_memory = asyncio.run(run())
+    assert from_disk == from_memory == ENTITIES
+    assert cache.get_metrics()["disk_hits"] == 1
+    assert cache.get_metrics()["memory_hits"] == 1
+
+
+def test_file_lookup_runs_off_the_event_loop(tmp_path):
+    cache = EntityCache(path=str(tmp_path / "entity_cache.sqlite"))
+    threads = []
+    get_disk, put_disk = cache.get_disk, cache.put_disk
+    cache.get_disk = lambda *args: threads.append(threading.current_thread()) or get_disk(*args)
+    cache.put_disk = lambda *args: threads.append(threading.current_thread()) or put_disk(*args)
+
+    async def run():
+        assert await cache.aget("Berlin", "en", 3) is None
+        await cache.aput("Berlin", "en", 3, [])
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(run())
+    assert len(threads) == 2
+    assert loop_thread not in threads
@@ -0,0 +1,154 @@
+"""
+Builds the label index from small TSV and gzipped N-Triples files and looks labels up.
+"""
+import gzip
+
+import pytest
+
+from component import label_index
+
+TSV = """\
+Q15228\tThe Lord of the Rings\t3
+Q127367\tThe Lord of the Rings\t1
+Q1\tThe Lord of the Flies\t5
+Q64\tBerlin
+Q821244\tberlin\t
+no qid\tignored
+Q2\t
+"""
+
+LABEL = "<http://www.w3.org/2000/01/rdf-schema#label>"
+NTRIPLES = "\n".join(f"<http://www.wikidata.org/entity/{qid}> {LABEL} {literal} ." for qid, literal in [
+    ("Q167646", '"Paris"@en'),
+    ("Q90", '"Paris"@en'),
+    ("Q90", '"Paname"@fr'),
+    ("Q42", r'"Douglas \"Doug\" Adams"@en'),
+    ("Q3", r'"Café Paris"@en'),
+]) + "\n<http://www.wikidata.org/entity/Q90> <http://schema.org/description> \"capital\"@en .\n"
+
+FORMATS = [
+    pytest.param(label_index.build_table, id="table"),
+    pytest.param(label_index.build_marisa, id="marisa"),
+]
+
+
+def qids(results) -> list:
+    return [result["uri"].rsplit("/", 1)[1] for result in results]
+
+
+@pytest.fixture(params=FORMATS)
+def build(request, tmp_path):
+    if request.param is label_index.build_marisa:
+        pytest.importorskip("marisa_trie")
+
+    indexes = []
+
+    def build(source: str, lang: str = "en"):
+        output = str(tmp_path / "labels.idx")
+        request.param(label_index.group_labels(label_index.read_labels(source, lang)), output, lang)
+        indexes.append(label_index.open_index(output))
+        return indexes[-1]
+
+    yield build
+    for index in indexes:
+        index.close()
+
+
+@pytest.fixture
+def tsv(tmp_path) -> str:
+    path = tmp_path / "labels.tsv"
+    path.write_text(TSV, encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def ntriples(tmp_path) -> str:
+    path = tmp_path / "labels.nt.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(NTRIPLES)
+    return str(path)
+
+
+def test_exact_lookup_is_normalized_and_ranked(build, tsv):
+    index = build(tsv)
+    results = index.lookup("  the LORD of the\trings ")
+    #the rank column decides, lower is more popular
+    assert qids(results) == ["Q127367", "Q15228"]
+    assert [result["rank"] for result in results] == [0, 1]
+    assert results[0]["label"] == "The Lord of the Rings"
+    assert results[0]["uri"] == "http://www.wikidata.org/entity/Q127367"
+    assert qids(index.lookup("the lord of the rings", limit=1)) == ["Q127367"]
+
+
+def test_rank_defaults_to_the_qid(build, tsv):
+    assert qids(build(tsv).lookup("Berlin")) == ["Q64", "Q821244"]
+
+
+def test_lookup_misses(build, tsv):
+    index = build(tsv)
+    assert index.lookup("lord of the rings") == []
+    assert index.lookup("the lord") == []
+    assert index.lookup("ignored") == []
+
+
+def test_prefix_lookup(build, tsv):
+    index = build(tsv)
+    assert sorted(index.prefix("The Lord of")) == ["The Lord of the Flies", "The Lord of the Rings"]
+    assert len(index.prefix("the lord of", limit=1)) == 1
+    assert index.prefix("ber") == ["Berlin"]
+    assert index.prefix("zzz") == []
+
+
+def test_table_prefix_is_in_label_order(tmp_path, tsv):
+    output = str(tmp_path / "labels.idx")
+    label_index.build_table(label_index.group_labels(label_index.read_labels(tsv)), output)
+    index = label_index.SortedTableIndex(output)
+    try:
+        assert index.prefix("the lord of") == ["The Lord of the Flies", "The Lord of the Rings"]
+        assert index.prefix("") == ["Berlin", "The Lord of the Flies", "The Lord of the Rings"]
+    finally:
+        index.close()
+
+
+def test_gzipped_ntriples(build, ntriples):
+    index = build(ntriples)
+    #the dump has no rank, lower QIDs are the better known entities
+    assert qids(index.lookup("paris")) == ["Q90", "Q167646"]
+    assert qids(index.lookup('Douglas "Doug" Adams')) == ["Q42"]
+    assert qids(index.lookup("café paris")) == ["Q3"]
+    assert index.lookup("paname") == []
+    assert index.lookup("capital") == []
+    assert sorted(index.prefix("pa")) == ["Paris"]
+
+
+def test_ntriples_language(build, ntriples):
+    index = build(ntriples, lang="fr")
+    assert index.lang == "fr"
+    assert qids(index.lookup("Paname")) == ["Q90"]
+    assert index.lookup("paris") == []
+
+
+def test_language_is_stored(build, tsv):
+    index = build(tsv)
+    assert index.lang == "en"
+    #the language is not a label
+    assert sorted(index.prefix("")) == ["Berlin", "The Lord of the Flies", "The Lord of the Rings"]
+    assert index.lookup("lang") == []
+
+
+def test_older_index_is_rejected(tmp_path):
+    path = tmp_path / "labels.idx"
+    path.write_bytes(b"LBLIDX01" + bytes(8))
+    with pytest.raises(ValueError, match="rebuild"):
+        label_index.open_index(str(path))
+
+
+def test_cli(tmp_path, tsv, capsys):
+    output = str(tmp_path / "labels.idx")
+    label_index.main(["build", tsv, output])
+    assert "Indexed 3 en labels" in capsys.readouterr().out
+
+    label_index.main(["lookup", output, "berlin", "--limit", "1"])
+    assert "Q64" in capsys.readouterr().out
+    label_index.main(["lookup", output, "the lord", "--prefix"])
+    assert capsys.readouterr().out.splitlines() == ["The Lord of the Flies", "The Lord of the Rings"]
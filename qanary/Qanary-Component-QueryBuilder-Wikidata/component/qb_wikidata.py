@@ -4,7 +4,9 @@ import logging
 from fastapi import APIRouter, Request
 from fastapi.responses import JSONResponse, PlainTextResponse
 
-from qanary_helpers.qanary_queries import insert_into_triplestore, get_text_question_in_graph, query_triplestore
+from qanary_helpers.qanary_queries import get_text_question_in_graph, query_triplestore
+
+from component.annotation_writer import AnnotationWriter, iri, literal, get_metrics
 
 
 logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
@@ -55,6 +57,8 @@ async def qanary_service(request: Request):
 
     logging.info(f"Entity candidates: {entity_list}")
 
+    writer = AnnotationWriter(triplestore_endpoint_url, triplestore_ingraph_uuid, f"urn:qanary:{SERVICE_NAME_COMPONENT}")
+
     for candidate in entity_list:
         # answer_sparql
         answer_sparql = f"""
@@ -76,37 +80,19 @@ async def qanary_service(request: Request):
         """
 
         answer_sparql = answer_sparql.replace("\n", " ")
-        # query candidate
-        sparql_AnnotationOfAnswerSPARQL = f"""
-            PREFIX dbr: <http://dbpedia.org/resource/>
-            PREFIX oa: <http://www.w3.org/ns/openannotation/core/>
-            PREFIX qa: <http://www.wdaqua.eu/qa#>
-            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-            PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-
-            INSERT {{
-                GRAPH <{triplestore_ingraph_uuid}>  {{
-                    ?newAnnotation rdf:type qa:AnnotationOfAnswerSPARQL .
-                    ?newAnnotation oa:hasTarget <{question_uri}> .
-                    ?newAnnotation oa:hasBody "{answer_sparql}" .
-                    ?newAnnotation qa:score "1.0"^^xsd:float .
-                    ?newAnnotation oa:annotatedAt ?time .
-                    ?newAnnotation oa:annotatedBy <urn:qanary:{SERVICE_NAME_COMPONENT}> .
-                }}
-            }}
-            WHERE {{
-                BIND (IRI(CONCAT("urn:qanary:annotation:answer:sparql:", STR(RAND()))) AS ?newAnnotation) .
-                BIND (now() as ?time) .
-            }}
-        """
-
-        logging.debug(f"SPARQL for query candidates:\n{sparql_AnnotationOfAnswerSPARQL}")
+        writer.add("qa:AnnotationOfAnswerSPARQL", literal(answer_sparql), iri(question_uri),
+                   prefix="urn:qanary:annotation:answer:sparql:")
 
-        insert_into_triplestore(triplestore_endpoint_url, sparql_AnnotationOfAnswerSPARQL)
+    await writer.aflush()  # one update for all candidates
 
     return JSONResponse(content=request_json)
 
 
+@router.get("/metrics")
+def metrics():
+    return JSONResponse(content={"annotation_writer": get_metrics()})
+
+
 @router.get("/health")
 def health():
     return PlainTextResponse(content="alive") 